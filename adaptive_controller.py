@@ -0,0 +1,100 @@
+import threading
+import time
+import logging
+from collections import deque
+import numpy as np
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_PROFILE = REGISTRY.gauge(
+    "inspection_active_profile", "Inference profile currently selected by the adaptive controller", ("profile",)
+)
+PROFILE_SWITCHES = REGISTRY.counter(
+    "inspection_profile_switches_total", "Profile switches by direction", ("direction",)
+)
+
+
+class AdaptiveProfileController:
+    def __init__(self, profiles, latency_slo_ms, degrade_ratio=0.9, recover_ratio=0.6,
+                 max_queue_depth=4, window=50, min_samples=10, cooldown_s=5.0):
+        """
+        Switches between inference profiles based on end-to-end latency and queue depth.
+        Profiles are ordered from highest quality (slowest) to fastest, e.g.
+        [{"name": "1280", "model_path": "yolov8s.pt", "img_size": 1280},
+         {"name": "960", "model_path": "yolov8s.pt", "img_size": 960},
+         {"name": "640-nano", "model_path": "yolov8n.pt", "img_size": 640}].
+        The controller steps one profile down when the p90 latency exceeds
+        degrade_ratio * SLO or the queue is deeper than max_queue_depth, and one step up
+        when p90 stays below recover_ratio * SLO with an empty queue. After a switch it waits
+        for cooldown_s and min_samples new observations before deciding again.
+        Args:
+            profiles (list): Profile dictionaries with 'name', 'model_path' and 'img_size'.
+            latency_slo_ms (float): End-to-end latency objective per inspection.
+            degrade_ratio (float): Share of the SLO above which quality is reduced.
+            recover_ratio (float): Share of the SLO below which quality is increased again.
+            max_queue_depth (int): Queue depth above which quality is reduced.
+            window (int): Number of latency samples the decision is based on.
+            min_samples (int): Samples required after a switch before the next decision.
+            cooldown_s (float): Minimum time between two switches.
+        """
+        if not profiles:
+            raise ValueError("At least one inference profile is required")
+        for profile in profiles:
+            missing = {"name", "model_path", "img_size"} - set(profile)
+            if missing:
+                raise ValueError(f"Profile {profile} is missing {sorted(missing)}")
+        self.profiles = [dict(profile) for profile in profiles]
+        self.latency_slo_s = latency_slo_ms / 1000.0
+        self.degrade_ratio = degrade_ratio
+        self.recover_ratio = recover_ratio
+        self.max_queue_depth = max_queue_depth
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+
+        self._index = 0
+        self._latencies = deque(maxlen=window)
+        self._last_switch = time.monotonic()
+        self._lock = threading.Lock()
+        self._set_active_metric()
+        logger.info("AdaptiveProfileController initialized with profiles %s (SLO %.0f ms).",
+                    [p["name"] for p in self.profiles], latency_slo_ms)
+
+    def current_profile(self):
+        return self.profiles[self._index]
+
+    def observe(self, latency_s, queue_depth=0):
+        """
+        Records the end-to-end latency of one inspection and possibly switches profile.
+        Returns:
+            dict: The profile to use for the next inspection.
+        """
+        with self._lock:
+            self._latencies.append(latency_s)
+            if (len(self._latencies) < self.min_samples
+                    or time.monotonic() - self._last_switch < self.cooldown_s):
+                return self.profiles[self._index]
+
+            p90 = float(np.percentile(self._latencies, 90))
+            overloaded = p90 > self.latency_slo_s * self.degrade_ratio or queue_depth > self.max_queue_depth
+            relaxed = p90 < self.latency_slo_s * self.recover_ratio and queue_depth == 0
+
+            if overloaded and self._index < len(self.profiles) - 1:
+                self._switch(self._index + 1, "down", p90, queue_depth)
+            elif relaxed and self._index > 0:
+                self._switch(self._index - 1, "up", p90, queue_depth)
+            return self.profiles[self._index]
+
+    def _switch(self, index, direction, p90, queue_depth):
+        previous = self.profiles[self._index]["name"]
+        self._index = index
+        self._latencies.clear()
+        self._last_switch = time.monotonic()
+        PROFILE_SWITCHES.inc(direction=direction)
+        self._set_active_metric()
+        logger.warning("Inference profile %s -> %s (p90 %.1f ms, queue depth %d).",
+                       previous, self.profiles[index]["name"], p90 * 1000.0, queue_depth)
+
+    def _set_active_metric(self):
+        ACTIVE_PROFILE.clear()
+        ACTIVE_PROFILE.set(1, profile=self.profiles[self._index]["name"])
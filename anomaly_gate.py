@@ -0,0 +1,167 @@
+import os
+import glob
+import logging
+import cv2
+import numpy as np
+from .metrics import REGISTRY, time_stage
+
+logger = logging.getLogger(__name__)
+
+GATE_DECISIONS = REGISTRY.counter(
+    "inspection_gate_frames_total", "Frames screened by the anomaly gate, by decision", ("decision",)
+)
+GATE_SCORE = REGISTRY.histogram(
+    "inspection_gate_score", "Texture anomaly score of screened frames",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+)
+
+
+class TextureAnomalyGate:
+    def __init__(self, threshold=6.0, size=256, grid=8):
+        """
+        First cascade stage that decides whether a frame needs the full defect detector.
+        The frame is converted to gray and downscaled so that its longer side is `size` pixels;
+        for each cell of a grid x grid raster the mean intensity, the mean absolute Laplacian
+        (scratches, pits) and the gradient energy are compared against statistics of known
+        good parts. The anomaly score is the largest z-score over all cells and features.
+        Parts are assumed to be presented in a fixture, i.e. roughly at the same position.
+        Without reference statistics every frame is passed on.
+        Args:
+            threshold (float): Score at or above which a frame is sent to the detector.
+            size (int): Longer side of the downscaled frame.
+            grid (int): Number of cells per image side.
+        """
+        self.threshold = threshold
+        self.size = size
+        self.grid = grid
+        self.mean = None
+        self.std = None
+
+    @property
+    def is_fitted(self):
+        return self.mean is not None
+
+    def features(self, img):
+        """
+        Computes the per-cell texture features of a BGR or gray image.
+        Returns:
+            np.ndarray: Array of shape (3, grid, grid).
+        """
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        # INTER_AREA is only fast for integer factors, so crop to a multiple of the factor
+        # first and do the remaining (small) resize bilinearly
+        factor = max(1, max(h, w) // self.size)
+        h, w = h - h % factor, w - w % factor
+        small = cv2.resize(gray[:h, :w], (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+        scale = self.size / max(h, w) * factor
+        # Cell boundaries must line up, so the downscaled size is a multiple of the grid
+        width = max(self.grid, int(round(small.shape[1] * scale / self.grid)) * self.grid)
+        height = max(self.grid, int(round(small.shape[0] * scale / self.grid)) * self.grid)
+        small = cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR).astype(np.float32)
+
+        laplacian = np.abs(cv2.Laplacian(small, cv2.CV_32F, ksize=3))
+        gx = cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=3)
+        gradient = gx * gx + gy * gy
+
+        stack = np.stack([small, laplacian, np.sqrt(gradient)])
+        cells = stack.reshape(3, self.grid, height // self.grid, self.grid, width // self.grid)
+        return cells.mean(axis=(2, 4))
+
+    def fit(self, good_images):
+        """
+        Learns the reference statistics from images of defect-free parts.
+        Args:
+            good_images (list): BGR image arrays or image paths.
+        """
+        feats = []
+        for image in good_images:
+            if isinstance(image, str):
+                image_path, image = image, cv2.imread(image)
+                if image is None:
+                    logger.error("Could not load image %s", image_path)
+                    continue
+            feats.append(self.features(image))
+        if len(feats) < 2:
+            raise ValueError("At least two good images are needed to fit the anomaly gate")
+        feats = np.stack(feats)
+        self.mean = feats.mean(axis=0)
+        # Floor the spread so that perfectly uniform cells do not produce huge scores
+        self.std = np.maximum(feats.std(axis=0), 0.05 * np.abs(self.mean).mean(axis=(1, 2), keepdims=True) + 1e-3)
+        logger.info("Anomaly gate fitted on %d good images.", len(feats))
+
+    def calibrate_threshold(self, defect_images, min_recall=1.0, margin=0.9):
+        """
+        Lowers the threshold until at least min_recall of the given defect images are passed on.
+        Args:
+            defect_images (list): BGR image arrays of parts with known defects.
+            min_recall (float): Required share of defect images that reach the detector.
+            margin (float): Safety factor applied to the resulting threshold.
+        Returns:
+            float: The new threshold.
+        """
+        scores = np.sort([self.score(image) for image in defect_images])
+        if len(scores) == 0:
+            return self.threshold
+        # Index of the weakest defect score that still has to pass
+        allowed_misses = int(np.floor(len(scores) * (1.0 - min_recall)))
+        required = scores[allowed_misses]
+        self.threshold = min(self.threshold, float(required) * margin)
+        logger.info("Anomaly gate threshold calibrated to %.2f (recall %.2f).", self.threshold, min_recall)
+        return self.threshold
+
+    def score(self, img):
+        """Anomaly score of a frame; larger is more suspicious."""
+        if not self.is_fitted:
+            return float("inf")
+        z = np.abs(self.features(img) - self.mean) / self.std
+        return float(z.max())
+
+    def screen(self, img):
+        """
+        Decides whether the frame has to go through the defect detector.
+        Returns:
+            tuple: (suspicious, score)
+        """
+        with time_stage("gate"):
+            score = self.score(img)
+        suspicious = score >= self.threshold
+        GATE_DECISIONS.inc(decision="detect" if suspicious else "skip")
+        if np.isfinite(score):
+            GATE_SCORE.observe(score)
+        return suspicious, score
+
+    def save(self, path):
+        if not self.is_fitted:
+            raise ValueError("The anomaly gate has not been fitted")
+        np.savez(path, mean=self.mean, std=self.std, threshold=self.threshold, size=self.size, grid=self.grid)
+
+    @classmethod
+    def load(cls, path, threshold=None):
+        """Loads a fitted gate; threshold overrides the stored one if given."""
+        data = np.load(path)
+        gate = cls(threshold=float(data["threshold"]) if threshold is None else threshold,
+                   size=int(data["size"]), grid=int(data["grid"]))
+        gate.mean = data["mean"]
+        gate.std = data["std"]
+        logger.info("Anomaly gate loaded from %s (threshold %.2f).", path, gate.threshold)
+        return gate
+
+
+if __name__ == "__main__":
+    # Fit the gate on a directory of defect-free parts: python anomaly_gate.py data/good gate.npz
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    good_dir = sys.argv[1] if len(sys.argv) > 1 else "data/good_parts"
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "models/anomaly_gate.npz"
+    paths = sorted(glob.glob(os.path.join(good_dir, "*.jpg")) + glob.glob(os.path.join(good_dir, "*.png")))
+
+    gate = TextureAnomalyGate()
+    gate.fit(paths)
+    scores = [gate.score(cv2.imread(p)) for p in paths]
+    print(f"Good part scores: max {max(scores):.2f}, mean {np.mean(scores):.2f} (threshold {gate.threshold})")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    gate.save(output_path)
+    print(f"Anomaly gate saved to {output_path}")
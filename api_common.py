@@ -0,0 +1,131 @@
+"""
+Request parsing and serialization helpers shared by the Flask (WSGI) and the
+async (ASGI) inspection APIs
+"""
+
+import json
+import base64
+import numpy as np
+
+
+def convert_numpy_types(obj):
+    """Convert numpy types to native Python types for JSON serialization"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: convert_numpy_types(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_numpy_types(item) for item in obj]
+    return obj
+
+
+def is_truthy(value):
+    """Interpret a form, query or JSON flag such as render=true"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def parse_measurement_options(values):
+    """
+    Read optional measurement points and scale factor from form fields, query
+    parameters (JSON-encoded strings) or a JSON body
+    """
+    measurement_points = values.get('measurement_points')
+    if isinstance(measurement_points, str):
+        try:
+            measurement_points = json.loads(measurement_points)
+        except json.JSONDecodeError:
+            measurement_points = None
+
+    real_world_unit_per_pixel = values.get('scale_factor')
+    if real_world_unit_per_pixel is not None:
+        try:
+            real_world_unit_per_pixel = float(real_world_unit_per_pixel)
+        except (TypeError, ValueError):
+            real_world_unit_per_pixel = None
+    return measurement_points, real_world_unit_per_pixel
+
+
+def strip_data_url(image_data):
+    """Remove a data URL prefix (data:image/...;base64,) if present"""
+    if image_data.startswith('data:image'):
+        return image_data.split(',', 1)[1]
+    return image_data
+
+
+def parse_shape(shape):
+    """Parse a raw payload shape such as '2048,2448,3'"""
+    return [int(v) for v in shape.split(',')]
+
+
+def overlay_data_url(overlay):
+    """Encode JPEG overlay bytes as a data URL for JSON responses"""
+    return "data:image/jpeg;base64," + base64.b64encode(overlay).decode("ascii")
+
+
+PRIORITY_LANES = ("realtime", "bulk")
+
+
+def parse_priority(values, default="realtime"):
+    """
+    Read the scheduling lane ('priority') of a request
+    Raises ValueError for unknown lanes
+    """
+    lane = values.get('priority') or default
+    if lane not in PRIORITY_LANES:
+        raise ValueError(f"Unknown priority '{lane}', expected one of {', '.join(PRIORITY_LANES)}")
+    return lane
+
+
+def parse_profiles(value):
+    """
+    Parse adaptive inference profiles from a JSON list such as
+    '[{"name": "960", "model_path": "yolov8s.pt", "img_size": 960}, ...]'
+    Returns None for an empty value
+    """
+    if not value:
+        return None
+    profiles = json.loads(value)
+    if not isinstance(profiles, list):
+        raise ValueError("Inference profiles must be a JSON list")
+    return profiles
+
+
+def job_payload(frame, values, render, lane="realtime"):
+    """
+    Build a work queue payload (distributed mode) from the frame description of a
+    request ('kind', 'data' and decode options), its measurement options and its lane
+    """
+    measurement_points, real_world_unit_per_pixel = parse_measurement_options(values)
+    data = frame["data"]
+    return dict(
+        frame,
+        data=data if isinstance(data, str) else bytes(data),
+        measurement_points=measurement_points,
+        scale_factor=real_world_unit_per_pixel,
+        camera_id=values.get('camera_id'),
+        render=render,
+        priority=lane
+    )
+
+
+def capture_details(values, batch=False):
+    """
+    Request options and parsed inspection arguments of a slow request capture
+    (see SlowRequestRecorder); the image payload itself is stored separately
+    """
+    measurement_points, real_world_unit_per_pixel = parse_measurement_options(values)
+    options = {key: value for key, value in values.items() if key != 'image_data'}
+    inspection = {
+        "measurement_points": measurement_points,
+        "scale_factor": real_world_unit_per_pixel,
+        "camera_id": values.get('camera_id'),
+        "lane": values.get('priority') or ("bulk" if batch else "realtime"),
+        "batch": batch
+    }
+    return options, inspection
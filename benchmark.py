@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the Metal Inspection App
+Measures latency, throughput and memory of the inspection pipeline,
+in-process and through the HTTP API, on synthetic frames
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+# Add the parent directory to the path to import our services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "hd": (1280, 960),
+    "5mp": (2448, 2048),
+}
+
+MEASUREMENT_POINTS = [[100, 100], [500, 100]]
+SCALE_FACTOR = 0.01
+
+
+def create_synthetic_frame(width, height, seed=0):
+    """Create a reproducible synthetic metal part frame with a few defect-like features"""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(90, 170, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+    texture = gradient + rng.normal(0, 6, (height, width)).astype(np.float32)
+    img = np.clip(texture, 0, 255).astype(np.uint8)
+    img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+    # Bright specular band, a dark dent and a scratch
+    cv2.rectangle(img, (width // 5, height // 3), (width // 5 + width // 20, 2 * height // 3), (245, 245, 245), -1)
+    cv2.circle(img, (2 * width // 3, height // 2), max(4, min(width, height) // 30), (40, 40, 40), -1)
+    cv2.line(img, (width // 4, height // 5), (3 * width // 4, height // 4), (60, 60, 60), 2)
+    return img
+
+
+def summarize_latencies(latencies_ms, wall_time_s=None):
+    """Summarize a list of latencies (ms) into percentiles and frames per second"""
+    if not latencies_ms:
+        return {"count": 0}
+    values = np.asarray(latencies_ms)
+    summary = {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "min": float(values.min()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+    total_s = wall_time_s if wall_time_s else values.sum() / 1000.0
+    summary["fps"] = float(len(values) / total_s) if total_s > 0 else None
+    return summary
+
+
+def peak_rss_mb(pid=None):
+    """Peak resident set size in MB of this process or of another local process"""
+    if pid is None:
+        # ru_maxrss is reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def collect_metadata(args):
+    """Collect environment information so that runs can be compared"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "model": args.model,
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+    }
+
+
+def time_call(func, iterations, warmup, concurrency=1):
+    """
+    Run func warmup + iterations times per worker from concurrency threads and return
+    the measured latencies in ms and the wall time of the measured calls in seconds
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: func(), range(warmup * concurrency)))
+
+        def timed(_):
+            t0 = time.perf_counter()
+            func()
+            return (time.perf_counter() - t0) * 1000.0
+
+        t0 = time.perf_counter()
+        latencies = list(pool.map(timed, range(iterations * concurrency)))
+        wall_time = time.perf_counter() - t0
+    return latencies, wall_time
+
+
+def benchmark_in_process(service, frame_path, iterations, warmup, concurrency=1):
+    """
+    Benchmark each pipeline stage and the full inspection in-process, on in-memory frames
+    and pooled buffers like the API, with concurrency threads calling at the same time
+    """
+    from services.image_io import decode_image
+    from services.visualization import draw_inspection_overlay
+
+    with open(frame_path, "rb") as f:
+        payload = f.read()
+    frame, _ = decode_image(payload)
+    preprocessor, detector = service.image_preprocessor, service.defect_detector
+    preprocessed = preprocessor.preprocess_array(frame)
+    defects = detector.detect_defects(preprocessed)
+    measurements = service.measurement_module.measure_object_dimensions(
+        preprocessed, MEASUREMENT_POINTS, SCALE_FACTOR
+    )
+    renderer = service.overlay_renderer
+    preview, scale = renderer.make_preview(preprocessed)
+
+    def preprocess():
+        with service.buffer_pool.lease() as buffers:
+            preprocessor.preprocess_array(frame, buffers)
+
+    def total():
+        image, decode_scale = decode_image(payload)
+        service.perform_inspection(image, MEASUREMENT_POINTS, SCALE_FACTOR, decode_scale)
+
+    stages = {
+        "decode": lambda: decode_image(payload),
+        "preprocess": preprocess,
+        "inference": lambda: detector.detect_defects(preprocessed),
+        "measurement": lambda: service.measurement_module.measure_object_dimensions(
+            preprocessed, MEASUREMENT_POINTS, SCALE_FACTOR
+        ),
+        "visualization": lambda: renderer.encode(
+            draw_inspection_overlay(preview.copy(), defects, measurements, scale)
+        ),
+        "serialization": lambda: json.dumps({"defects": defects, "measurements": measurements}, default=float),
+        "total": total,
+    }
+    return {
+        name: summarize_latencies(*time_call(func, iterations, warmup, concurrency))
+        for name, func in stages.items()
+    }
+
+
+def benchmark_http(base_url, frame_path, concurrency, num_requests, warmup):
+    """Send num_requests multipart inspections with the given concurrency and measure latency"""
+    import requests
+
+    with open(frame_path, "rb") as f:
+        payload = f.read()
+    local = threading.local()
+
+    def post_once(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        t0 = time.perf_counter()
+        try:
+            response = local.session.post(
+                f"{base_url}/api/inspect",
+                files={"image": ("frame.jpg", payload, "image/jpeg")},
+                data={"measurement_points": json.dumps(MEASUREMENT_POINTS), "scale_factor": str(SCALE_FACTOR)},
+                timeout=120,
+            )
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return (time.perf_counter() - t0) * 1000.0, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(post_once, range(warmup)))
+        t0 = time.perf_counter()
+        outcomes = list(pool.map(post_once, range(num_requests)))
+        wall_time = time.perf_counter() - t0
+
+    latencies = [latency for latency, ok in outcomes if ok]
+    summary = summarize_latencies(latencies, wall_time)
+    summary["errors"] = sum(1 for _, ok in outcomes if not ok)
+    return summary
+
+
+def compare_results(current, baseline_path):
+    """Print the relative change of p50/p95/fps against a previous benchmark run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(entry):
+        return entry["mode"], entry["resolution"], entry["concurrency"], entry["stage"]
+
+    previous = {key(entry): entry for entry in baseline.get("results", [])}
+    print(f"\nComparison against {baseline_path} ({baseline.get('metadata', {}).get('git_commit')})")
+    print("-" * 80)
+    for entry in current["results"]:
+        old = previous.get(key(entry))
+        if not old or not old["latency_ms"].get("count") or not entry["latency_ms"].get("count"):
+            continue
+        changes = []
+        for metric in ("p50", "p95", "fps"):
+            before, after = old["latency_ms"].get(metric), entry["latency_ms"].get(metric)
+            if before and after:
+                changes.append(f"{metric} {before:.1f} -> {after:.1f} ({(after - before) / before * 100:+.1f}%)")
+        print(f"  {'/'.join(str(k) for k in key(entry)):<40} " + ", ".join(changes))
+
+
+def run_benchmarks(args):
+    """Run all requested benchmarks and return the machine-readable results"""
+    results = {"metadata": collect_metadata(args), "results": []}
+    work_dir = tempfile.mkdtemp(prefix="inspection_bench_")
+
+    frames = {}
+    for name in args.resolutions:
+        width, height = RESOLUTIONS[name]
+        frame_path = os.path.join(work_dir, f"frame_{name}.jpg")
+        cv2.imwrite(frame_path, create_synthetic_frame(width, height, seed=args.seed))
+        frames[name] = (frame_path, width, height)
+
+    if args.mode in ("inprocess", "all"):
+        from services.inspection_service import InspectionService
+        service = InspectionService(model_path=args.model)
+        for name, (frame_path, width, height) in frames.items():
+            for concurrency in args.concurrency:
+                print(f"In-process benchmark: {name} ({width}x{height}), concurrency {concurrency}")
+                stages = benchmark_in_process(service, frame_path, args.iterations, args.warmup, concurrency)
+                for stage, summary in stages.items():
+                    results["results"].append({
+                        "mode": "inprocess", "resolution": name, "width": width, "height": height,
+                        "concurrency": concurrency, "stage": stage, "latency_ms": summary,
+                    })
+        results["inprocess_peak_rss_mb"] = peak_rss_mb()
+
+    if args.mode in ("http", "all"):
+        for name, (frame_path, width, height) in frames.items():
+            for concurrency in args.concurrency:
+                print(f"HTTP benchmark: {name} ({width}x{height}), concurrency {concurrency}")
+                summary = benchmark_http(
+                    args.url, frame_path, concurrency, args.iterations * concurrency, args.warmup
+                )
+                results["results"].append({
+                    "mode": "http", "resolution": name, "width": width, "height": height,
+                    "concurrency": concurrency, "stage": "total", "latency_ms": summary,
+                })
+        if args.server_pid:
+            results["server_peak_rss_mb"] = peak_rss_mb(args.server_pid)
+
+    results["client_peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def print_summary(results):
+    print("\n" + "=" * 80)
+    print("METAL INSPECTION APP - BENCHMARK RESULTS")
+    print("=" * 80)
+    print(f"{'mode':<10}{'res':<6}{'conc':>5} {'stage':<14}{'p50':>9}{'p95':>9}{'p99':>9}{'fps':>9}")
+    for entry in results["results"]:
+        summary = entry["latency_ms"]
+        if not summary.get("count"):
+            print(f"{entry['mode']:<10}{entry['resolution']:<6}{entry['concurrency']:>5} {entry['stage']:<14}  no data")
+            continue
+        print(f"{entry['mode']:<10}{entry['resolution']:<6}{entry['concurrency']:>5} {entry['stage']:<14}"
+              f"{summary['p50']:>9.1f}{summary['p95']:>9.1f}{summary['p99']:>9.1f}{summary['fps'] or 0:>9.1f}")
+    for key in ("inprocess_peak_rss_mb", "server_peak_rss_mb", "client_peak_rss_mb"):
+        if results.get(key) is not None:
+            print(f"{key}: {results[key]:.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the metal inspection pipeline")
+    parser.add_argument("--mode", choices=["inprocess", "http", "all"], default="inprocess")
+    parser.add_argument("--resolutions", nargs="+", choices=sorted(RESOLUTIONS), default=["vga", "hd", "5mp"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--iterations", type=int, default=20, help="Measured iterations per stage and worker")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--server-pid", type=int, help="PID of a local API server to report its peak RSS")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous benchmark JSON to compare against")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run_benchmarks(args)
+    print_summary(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare_results(results, args.compare)
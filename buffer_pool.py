@@ -0,0 +1,142 @@
+import threading
+import logging
+from collections import defaultdict
+import numpy as np
+from .metrics import REGISTRY, record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+POOL_BYTES = REGISTRY.gauge(
+    "inspection_frame_pool_bytes", "Bytes held by the frame buffer pool, by state (in_use/free)", ("pool", "state")
+)
+POOL_HIGH_WATER = REGISTRY.gauge(
+    "inspection_frame_pool_high_water_bytes", "Largest number of bytes in use at the same time", ("pool",)
+)
+
+
+class BufferPool:
+    def __init__(self, name="frames", max_free_per_key=4, max_free_bytes=512 * 1024 * 1024):
+        """
+        Pool of preallocated arrays keyed by shape and dtype, so the per-frame intermediate
+        images of decode, preprocessing and model input are reused instead of being allocated
+        for every request. Repeated frame sizes keep memory flat and avoid allocator stalls.
+        Args:
+            name (str): Pool name used in metrics.
+            max_free_per_key (int): Free buffers kept per shape and dtype; released buffers beyond that are dropped.
+            max_free_bytes (int): Upper bound of the bytes held in free buffers.
+        """
+        self.name = name
+        self.max_free_per_key = max_free_per_key
+        self.max_free_bytes = max_free_bytes
+        self._free = defaultdict(list)  # (shape, dtype) -> free arrays
+        self._in_use = {}  # id(array) -> key
+        self._in_use_per_key = defaultdict(int)
+        self._high_water_per_key = defaultdict(int)
+        self._in_use_bytes = 0
+        self._free_bytes = 0
+        self._high_water_bytes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, shape, dtype=np.uint8):
+        """
+        Returns an array of the given shape and dtype. Its content is undefined.
+        The array must be handed back with release() once no longer referenced.
+        """
+        key = (tuple(int(v) for v in shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            array = free.pop() if free else None
+            if array is not None:
+                self._free_bytes -= array.nbytes
+        record_cache_lookup(f"buffer_pool_{self.name}", array is not None)
+        if array is None:
+            array = np.empty(key[0], dtype=key[1])
+        with self._lock:
+            self._in_use[id(array)] = key
+            self._in_use_per_key[key] += 1
+            self._high_water_per_key[key] = max(self._high_water_per_key[key], self._in_use_per_key[key])
+            self._in_use_bytes += array.nbytes
+            self._high_water_bytes = max(self._high_water_bytes, self._in_use_bytes)
+            self._update_metrics()
+        return array
+
+    def release(self, array):
+        """Returns an array obtained from acquire() to the pool."""
+        with self._lock:
+            key = self._in_use.pop(id(array), None)
+            if key is None:
+                raise ValueError("Array was not acquired from this pool")
+            self._in_use_per_key[key] -= 1
+            self._in_use_bytes -= array.nbytes
+            free = self._free[key]
+            if len(free) < self.max_free_per_key and self._free_bytes + array.nbytes <= self.max_free_bytes:
+                free.append(array)
+                self._free_bytes += array.nbytes
+            self._update_metrics()
+
+    def lease(self):
+        """Returns a BufferLease that releases all buffers taken from it when it is closed."""
+        return BufferLease(self)
+
+    def clear(self):
+        """Drops all free buffers, e.g. after the camera resolution changed."""
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+            self._update_metrics()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Bytes in use and free, the high-water mark of bytes in use, and per shape and
+                  dtype the buffers in use, free and their high-water mark.
+        """
+        with self._lock:
+            keys = set(self._free) | set(self._high_water_per_key)
+            return {
+                "in_use_bytes": self._in_use_bytes,
+                "free_bytes": self._free_bytes,
+                "high_water_bytes": self._high_water_bytes,
+                "buffers": {
+                    f"{'x'.join(map(str, shape))}:{np.dtype(dtype).name}": {
+                        "in_use": self._in_use_per_key[(shape, dtype)],
+                        "free": len(self._free.get((shape, dtype), ())),
+                        "high_water": self._high_water_per_key[(shape, dtype)],
+                    }
+                    for shape, dtype in sorted(keys)
+                },
+            }
+
+    def _update_metrics(self):
+        # Called with the lock held
+        POOL_BYTES.set(self._in_use_bytes, pool=self.name, state="in_use")
+        POOL_BYTES.set(self._free_bytes, pool=self.name, state="free")
+        POOL_HIGH_WATER.set(self._high_water_bytes, pool=self.name)
+
+
+class BufferLease:
+    """Buffers of one request; all of them go back to the pool when the lease is closed."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._arrays = []
+
+    def get(self, shape, dtype=np.uint8):
+        array = self.pool.acquire(shape, dtype)
+        self._arrays.append(array)
+        return array
+
+    def like(self, image):
+        """A buffer with the shape and dtype of image."""
+        return self.get(image.shape, image.dtype)
+
+    def close(self):
+        arrays, self._arrays = self._arrays, []
+        for array in arrays:
+            self.pool.release(array)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
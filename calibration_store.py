@@ -0,0 +1,87 @@
+import os
+import json
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class CalibrationStore:
+    def __init__(self, path=None):
+        """
+        Versioned camera calibrations keyed by camera id, persisted as one JSON file.
+        All versions are kept so that a calibration can be traced or rolled back;
+        the newest version of each camera is the active one.
+        Args:
+            path (str, optional): Calibration file. Without a path calibrations only live in memory.
+        """
+        self.path = path
+        self._cameras = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._cameras = json.load(f)
+        logger.info("CalibrationStore initialized with %d camera(s).", len(self._cameras))
+
+    def camera_ids(self):
+        return sorted(self._cameras)
+
+    def get(self, camera_id, version=None):
+        """
+        Returns a calibration of a camera, the newest one unless a version is given.
+        Returns:
+            dict: camera_matrix, dist_coeffs, image_size, version, created_at, or None if unknown.
+        """
+        versions = self._cameras.get(camera_id)
+        if not versions:
+            return None
+        if version is None:
+            return dict(versions[-1])
+        for entry in versions:
+            if entry["version"] == int(version):
+                return dict(entry)
+        return None
+
+    def history(self, camera_id):
+        """All stored versions of a camera, oldest first."""
+        return [dict(entry) for entry in self._cameras.get(camera_id, [])]
+
+    def save(self, camera_id, calibration):
+        """
+        Stores a new calibration version for a camera.
+        Args:
+            camera_id (str): Camera identifier.
+            calibration (dict): At least 'camera_matrix' (3x3) and 'dist_coeffs'; further keys such as
+                                'image_size' ([width, height]) are stored with the version.
+        Returns:
+            dict: The stored entry including its version.
+        """
+        camera_matrix = calibration.get("camera_matrix")
+        dist_coeffs = calibration.get("dist_coeffs")
+        if camera_matrix is None or len(camera_matrix) != 3 or any(len(row) != 3 for row in camera_matrix):
+            raise ValueError("camera_matrix must be a 3x3 matrix")
+        if dist_coeffs is None or len(dist_coeffs) not in (4, 5, 8, 12, 14):
+            raise ValueError("dist_coeffs must have 4, 5, 8, 12 or 14 elements")
+
+        with self._lock:
+            versions = self._cameras.setdefault(camera_id, [])
+            entry = dict(calibration)
+            entry["camera_matrix"] = [[float(v) for v in row] for row in camera_matrix]
+            entry["dist_coeffs"] = [float(v) for v in dist_coeffs]
+            entry["version"] = versions[-1]["version"] + 1 if versions else 1
+            entry["created_at"] = datetime.now().isoformat()
+            versions.append(entry)
+            if self.path:
+                self._save()
+        logger.info("Calibration of camera %s stored as version %d.", camera_id, entry["version"])
+        return dict(entry)
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._cameras, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -1,9 +1,12 @@
 import numpy as np
 import cv2
+import logging
+
+logger = logging.getLogger(__name__)
 
 class CameraCalibrator:
     def __init__(self):
-        print("CameraCalibrator initialized.")
+        logger.info("CameraCalibrator initialized.")
 
     def calibrate_camera(self, image_paths, checkerboard_size=(9, 6), square_size=0.025):
         """
@@ -17,10 +20,17 @@ class CameraCalibrator:
             checkerboard_size (tuple): Number of inner corners per a row and column (e.g., (9, 6)).
             square_size (float): Size of a square in the checkerboard in meters.
         Returns:
-            dict: A dictionary containing camera matrix, distortion coefficients, etc.
-                  (Placeholder returns dummy values).
+            dict: A dictionary containing camera matrix, distortion coefficients and the image size
+                  ([width, height]) of the calibration images (placeholder returns dummy values).
         """
-        print(f"Calibrating camera using {len(image_paths)} images (placeholder).")
+        logger.info("Calibrating camera using %d images (placeholder).", len(image_paths))
+
+        image_size = None
+        for image_path in image_paths:
+            img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                image_size = [img.shape[1], img.shape[0]]
+                break
 
         # Dummy values for demonstration
         camera_matrix = np.array([[1000.0, 0.0, 640.0],
@@ -28,10 +38,11 @@ class CameraCalibrator:
                                   [0.0, 0.0, 1.0]])
         dist_coeffs = np.array([0.0, 0.0, 0.0, 0.0, 0.0])
 
-        print("Camera calibration complete (placeholder).")
-        return {"camera_matrix": camera_matrix.tolist(), "dist_coeffs": dist_coeffs.tolist()}
+        logger.info("Camera calibration complete (placeholder).")
+        return {"camera_matrix": camera_matrix.tolist(), "dist_coeffs": dist_coeffs.tolist(), "image_size": image_size}
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     calibrator = CameraCalibrator()
     # In a real application, you would provide actual image paths
     dummy_image_paths = ["dummy_checkerboard_1.jpg", "dummy_checkerboard_2.jpg"]
@@ -1,67 +1,202 @@
 from ultralytics import YOLO
 import os
+import logging
 import cv2
 import numpy as np
+from .metrics import time_stage, set_model_info
+from .visualization import draw_inspection_overlay
+
+logger = logging.getLogger(__name__)
 
 class DefectDetector:
-    def __init__(self, model_path="yolov8n.pt"): # Placeholder for a trained model
+    def __init__(self, model_path="yolov8n.pt", img_size=640, buffer_pool=None): # Placeholder for a trained model
         """
         Initializes the DefectDetector with a YOLOv8 model.
+        Args:
+            model_path (str): Path to the model weights.
+            img_size (int): Model input size in pixels.
+            buffer_pool (BufferPool, optional): If given, larger frames are resized to the model input
+                                                size into pooled buffers before they are handed to the model.
         """
         self.model = YOLO(model_path)
-        print(f"DefectDetector initialized with model: {model_path}")
+        self.model_path = model_path
+        self.img_size = img_size
+        self.buffer_pool = buffer_pool
+        self._models = {model_path: self.model}
+        self._settings = None
+        self._active_model_path = model_path
+        set_model_info(model_path)
+        logger.info("DefectDetector initialized with model: %s", model_path)
+
+    def load_model(self, model_path):
+        """Loads additional model weights once, e.g. for the profiles of an adaptive controller."""
+        if model_path not in self._models:
+            self._models[model_path] = YOLO(model_path)
+            logger.info("DefectDetector loaded additional model: %s", model_path)
+        return self._models[model_path]
+
+    def apply_settings(self, settings):
+        """
+        Applies detection settings (see settings_store.DEFAULT_SETTINGS) to all following model calls.
+        Confidence, IoU, maximum detections and the class filter are handed to the model's NMS,
+        so suppressed boxes are never materialized. Per-class thresholds lower or raise the
+        confidence floor of single classes; NMS runs with the lowest of all thresholds and the
+        stricter classes are filtered on the raw tensors before any defect dictionaries are built.
+        """
+        self._settings = {
+            "detection_threshold": settings["detection_threshold"],
+            "iou_threshold": settings["iou_threshold"],
+            "max_detections": settings["max_detections"],
+            "allowed_classes": settings.get("allowed_classes"),
+            "class_thresholds": dict(settings.get("class_thresholds") or {}),
+        }
+        logger.info("Detection settings applied: %s", self._settings)
+
+    def _predict_args(self, model, settings):
+        if settings is None:
+            return {}
+        conf = min([settings["detection_threshold"]] + list(settings["class_thresholds"].values()))
+        args = {"conf": conf, "iou": settings["iou_threshold"], "max_det": settings["max_detections"]}
+        if settings["allowed_classes"] is not None:
+            allowed = set(settings["allowed_classes"])
+            args["classes"] = [int(i) for i, name in model.names.items() if name in allowed]
+        return args
+
+    def _resolve_profile(self, profile):
+        if profile is None:
+            self._set_active_model(self.model_path)
+            return self.model, self.img_size
+        model = self.load_model(profile["model_path"])
+        self._set_active_model(profile["model_path"])
+        return model, profile["img_size"]
+
+    def _set_active_model(self, model_path):
+        # The model info metric follows profile switches; it is only updated when the model changes
+        if model_path != self._active_model_path:
+            self._active_model_path = model_path
+            set_model_info(model_path)
+
+    def _model_input(self, image, img_size, buffers):
+        """
+        Resizes a frame to the model input size into a pooled buffer, the same way the model's
+        letterbox would, so the model never allocates a full-frame copy.
+        Returns:
+            tuple: (model input, factor from model input to image coordinates).
+        """
+        if buffers is None or isinstance(image, str):
+            return image, 1.0
+        height, width = image.shape[:2]
+        ratio = img_size / max(height, width)
+        if ratio >= 1.0:
+            return image, 1.0
+        size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+        resized = buffers.get((size[1], size[0]) + image.shape[2:], image.dtype)
+        cv2.resize(image, size, dst=resized, interpolation=cv2.INTER_LINEAR)
+        return resized, max(height, width) / max(size)
 
-    def detect_defects(self, image_path):
+    def detect_defects(self, image, box_scale=1.0, profile=None):
         """
         Detects defects in an image using the loaded YOLOv8 model.
         Args:
-            image_path (str): Path to the input image.
+            image (str or np.ndarray): Path to the input image or a BGR image array.
+            box_scale (float): Factor applied to the boxes, e.g. to map boxes found on a
+                               reduced-resolution decode back to original frame coordinates.
+            profile (dict, optional): Inference profile ('model_path', 'img_size') overriding the
+                                      default model and input size.
         Returns:
             list: A list of dictionaries, each representing a detected defect.
                   Each dictionary contains 'box' (bounding box coordinates),
                   'confidence' (detection confidence), and 'class' (defect type).
         """
-        print(f"Detecting defects in image: {image_path}")
-        results = self.model(image_path)
-
-        detected_defects = []
-        for r in results:
-            boxes = r.boxes.xyxy.cpu().numpy()  # Bounding box coordinates (x1, y1, x2, y2)
-            confidences = r.boxes.conf.cpu().numpy()  # Confidence scores
-            classes = r.boxes.cls.cpu().numpy()  # Class IDs
-
-            for box, conf, cls in zip(boxes, confidences, classes):
-                detected_defects.append({
-                    "box": box.tolist(),
-                    "confidence": float(conf),
-                    "class": self.model.names[int(cls)]  # Get class name from model
-                })
-        print(f"Detected {len(detected_defects)} defects.")
+        if isinstance(image, str):
+            logger.debug("Detecting defects in image: %s", image)
+        model, img_size = self._resolve_profile(profile)
+        settings = self._settings
+        buffers = self.buffer_pool.lease() if self.buffer_pool is not None else None
+        try:
+            model_input, input_scale = self._model_input(image, img_size, buffers)
+            with time_stage("inference"):
+                results = model(model_input, imgsz=img_size, verbose=False, **self._predict_args(model, settings))
+
+            with time_stage("postprocess"):
+                detected_defects = []
+                for r in results:
+                    detected_defects.extend(
+                        self._result_to_defects(r, box_scale * input_scale, model.names, settings)
+                    )
+        finally:
+            if buffers is not None:
+                buffers.close()
+        logger.debug("Detected %d defects.", len(detected_defects))
         return detected_defects
 
+    def detect_defects_batch(self, images, box_scales=None, profile=None):
+        """
+        Detects defects in several images with a single batched model call.
+        Args:
+            images (list): Image paths or BGR image arrays.
+            box_scales (list, optional): Box scale per image (see detect_defects).
+            profile (dict, optional): Inference profile for the whole batch (see detect_defects).
+        Returns:
+            list: One list of defects per input image.
+        """
+        if not images:
+            return []
+        box_scales = box_scales or [1.0] * len(images)
+        model, img_size = self._resolve_profile(profile)
+        settings = self._settings
+        buffers = self.buffer_pool.lease() if self.buffer_pool is not None else None
+        try:
+            inputs = [self._model_input(image, img_size, buffers) for image in images]
+            with time_stage("inference"):
+                results = model([model_input for model_input, _ in inputs], imgsz=img_size, verbose=False,
+                                **self._predict_args(model, settings))
+
+            with time_stage("postprocess"):
+                return [
+                    self._result_to_defects(r, scale * input_scale, model.names, settings)
+                    for r, scale, (_, input_scale) in zip(results, box_scales, inputs)
+                ]
+        finally:
+            if buffers is not None:
+                buffers.close()
+
+    def _result_to_defects(self, result, box_scale=1.0, names=None, settings=None):
+        names = names or self.model.names
+        boxes = result.boxes.xyxy.cpu().numpy()  # Bounding box coordinates (x1, y1, x2, y2)
+        confidences = result.boxes.conf.cpu().numpy()  # Confidence scores
+        classes = result.boxes.cls.cpu().numpy()  # Class IDs
+
+        if settings is not None and settings["class_thresholds"]:
+            # NMS ran with the lowest threshold; enforce the per-class ones before building dictionaries
+            default = settings["detection_threshold"]
+            thresholds = np.array([settings["class_thresholds"].get(names[int(cls)], default) for cls in classes])
+            keep = confidences >= thresholds
+            boxes, confidences, classes = boxes[keep], confidences[keep], classes[keep]
+        if box_scale != 1.0:
+            boxes = boxes * box_scale
+
+        return [
+            {
+                "box": box.tolist(),
+                "confidence": float(conf),
+                "class": names[int(cls)]  # Get class name from model
+            }
+            for box, conf, cls in zip(boxes, confidences, classes)
+        ]
+
     def visualize_defects(self, image_path, defects, output_path="output_defects.jpg"):
         """
         Visualizes detected defects on the image and saves it.
         """
         img = cv2.imread(image_path)
         if img is None:
-            print(f"Error: Could not load image {image_path}")
+            logger.error("Could not load image %s", image_path)
             return
 
-        for defect in defects:
-            x1, y1, x2, y2 = map(int, defect["box"])
-            confidence = defect["confidence"]
-            class_name = defect["class"]
-
-            color = (0, 0, 255)  # Red color for bounding box
-            thickness = 2
-            cv2.rectangle(img, (x1, y1), (x2, y2), color, thickness)
-
-            label = f"{class_name}: {confidence:.2f}"
-            cv2.putText(img, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, thickness)
-
+        draw_inspection_overlay(img, defects)
         cv2.imwrite(output_path, img)
-        print(f"Visualized defects saved to: {output_path}")
+        logger.debug("Visualized defects saved to: %s", output_path)
 
 if __name__ == "__main__":
     # Create a dummy image for testing
@@ -73,6 +208,7 @@ if __name__ == "__main__":
         cv2.imwrite(dummy_image_path, dummy_img)
         print(f"Created dummy image at {dummy_image_path}")
 
+    logging.basicConfig(level=logging.INFO)
     detector = DefectDetector()
     detected_defects = detector.detect_defects(dummy_image_path)
     detector.visualize_defects(dummy_image_path, detected_defects)
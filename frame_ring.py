@@ -0,0 +1,332 @@
+import os
+import glob
+import json
+import time
+import threading
+import logging
+from multiprocessing import shared_memory, resource_tracker
+import cv2
+import numpy as np
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FRAMES_PUBLISHED = REGISTRY.counter(
+    "inspection_ring_frames_published_total", "Frames written into the shared-memory ring", ("ring",)
+)
+FRAMES_DROPPED = REGISTRY.counter(
+    "inspection_ring_frames_dropped_total",
+    "Frames the consumer lost because the producer lapped it or overwrote them during inspection, "
+    "or that could not be read or inspected",
+    ("ring", "reason")
+)
+
+_MAGIC = 0x46524E47  # "FRNG"
+_ALIGN = 64
+_DTYPES = ("uint8", "uint16", "float32")
+_CAMERA_ID_BYTES = 32
+_METADATA_BYTES = 256
+_HEADER = np.dtype([("magic", "<u4"), ("slots", "<u4"), ("slot_bytes", "<u8"), ("write_seq", "<u8")], align=True)
+_SLOT = np.dtype([
+    ("seq", "<u8"),  # 0 while the slot is being written
+    ("timestamp", "<f8"),
+    ("nbytes", "<u8"),
+    ("height", "<u4"),
+    ("width", "<u4"),
+    ("channels", "<u4"),
+    ("dtype", "<u4"),
+    ("camera_id", f"S{_CAMERA_ID_BYTES}"),
+    ("metadata", f"S{_METADATA_BYTES}"),  # Small JSON document, e.g. part or trigger ids
+], align=True)
+
+# Rings created by this process; attaching to those must not touch the resource tracker
+_OWNED = set()
+
+
+def _align(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class _RingLayout:
+    """Maps the header, slot table and frame data of a ring onto one shared-memory block."""
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.header = np.ndarray((1,), dtype=_HEADER, buffer=shm.buf)[0]
+        if self.header["magic"] != _MAGIC:
+            raise ValueError(f"Shared memory '{shm.name}' is not a frame ring")
+        self.slots = int(self.header["slots"])
+        self.slot_bytes = int(self.header["slot_bytes"])
+        table_offset = _align(_HEADER.itemsize)
+        self.table = np.ndarray((self.slots,), dtype=_SLOT, buffer=shm.buf, offset=table_offset)
+        self.data_offset = _align(table_offset + _SLOT.itemsize * self.slots)
+
+    @staticmethod
+    def size(slots, slot_bytes):
+        return _align(_align(_HEADER.itemsize) + _SLOT.itemsize * slots) + slots * _align(slot_bytes)
+
+    def frame_view(self, slot, shape, dtype):
+        offset = self.data_offset + slot * _align(self.slot_bytes)
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+
+    def close(self):
+        # Drop all numpy views before the mapping is closed
+        self.header = self.table = None
+        self.shm.close()
+
+
+class Frame:
+    __slots__ = ("seq", "camera_id", "timestamp", "metadata", "image", "_slot")
+
+    def __init__(self, seq, camera_id, timestamp, metadata, image, slot):
+        self.seq = seq
+        self.camera_id = camera_id
+        self.timestamp = timestamp
+        self.metadata = metadata
+        self.image = image  # View into shared memory, valid until the producer reuses the slot
+        self._slot = slot
+
+
+class FrameRingProducer:
+    def __init__(self, name, slots=8, max_shape=(2048, 2448, 3), dtype="uint8"):
+        """
+        Creates a shared-memory ring buffer that acquisition processes write raw frames into.
+        Frames are never encoded; a consumer in another process reads them in place.
+        Args:
+            name (str): Name of the shared-memory block, e.g. 'inspection_cam0'.
+            slots (int): Number of frames kept; must cover the frames produced during one inspection.
+            max_shape (tuple): Largest frame shape (height, width, channels) that will be published.
+            dtype (str): Largest pixel type that will be published ('uint8', 'uint16' or 'float32').
+        """
+        self.name = name
+        slot_bytes = int(np.prod(max_shape)) * np.dtype(dtype).itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=_RingLayout.size(slots, slot_bytes))
+        header = np.ndarray((1,), dtype=_HEADER, buffer=self.shm.buf)
+        header[0] = (_MAGIC, slots, slot_bytes, 0)
+        self._layout = _RingLayout(self.shm)
+        self._pending = None
+        _OWNED.add(name)
+        logger.info("FrameRingProducer '%s' created: %d slots of %.1f MB.", name, slots, slot_bytes / 1e6)
+
+    def next_buffer(self, shape, dtype="uint8"):
+        """
+        Returns a writable array in the next slot, so a grabber can fill it directly.
+        The frame becomes visible to consumers with commit().
+        """
+        dtype = np.dtype(dtype)
+        if dtype.name not in _DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype.name}', expected one of {_DTYPES}")
+        shape = tuple(int(v) for v in shape)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if nbytes > self._layout.slot_bytes:
+            raise ValueError(f"Frame of {nbytes} bytes does not fit into slots of {self._layout.slot_bytes} bytes")
+
+        seq = int(self._layout.header["write_seq"]) + 1
+        slot = (seq - 1) % self._layout.slots
+        # Invalidate the slot first so readers of the previous frame notice the overwrite
+        self._layout.table[slot]["seq"] = 0
+        self._pending = (seq, slot, shape, dtype, nbytes)
+        return self._layout.frame_view(slot, shape, dtype)
+
+    def commit(self, camera_id="", timestamp=None, metadata=None):
+        """
+        Publishes the frame written into the buffer returned by next_buffer().
+        Raises:
+            ValueError: If camera_id exceeds 32 or the metadata JSON 256 bytes (UTF-8); the
+                        frame stays pending and can be committed again with shorter values.
+        """
+        if self._pending is None:
+            raise RuntimeError("commit() called without next_buffer()")
+        camera_bytes = camera_id.encode()
+        if len(camera_bytes) > _CAMERA_ID_BYTES:
+            raise ValueError(f"camera_id '{camera_id}' exceeds {_CAMERA_ID_BYTES} bytes")
+        metadata_bytes = json.dumps(metadata or {}).encode()
+        if len(metadata_bytes) > _METADATA_BYTES:
+            raise ValueError(f"Frame metadata of {len(metadata_bytes)} bytes exceeds {_METADATA_BYTES} bytes")
+        seq, slot, shape, dtype, nbytes = self._pending
+        entry = self._layout.table[slot]
+        entry["timestamp"] = time.time() if timestamp is None else timestamp
+        entry["nbytes"] = nbytes
+        entry["height"], entry["width"] = shape[0], shape[1]
+        entry["channels"] = shape[2] if len(shape) == 3 else 1
+        entry["dtype"] = _DTYPES.index(dtype.name)
+        entry["camera_id"] = camera_bytes
+        entry["metadata"] = metadata_bytes
+        entry["seq"] = seq
+        self._layout.header["write_seq"] = seq
+        self._pending = None
+        FRAMES_PUBLISHED.inc(ring=self.name)
+        return seq
+
+    def publish(self, frame, camera_id="", timestamp=None, metadata=None):
+        """
+        Copies a frame into the ring (one memcpy) and publishes it.
+        Returns:
+            int: The sequence number of the frame.
+        """
+        np.copyto(self.next_buffer(frame.shape, frame.dtype), frame)
+        return self.commit(camera_id, timestamp, metadata)
+
+    def close(self):
+        """Closes and removes the ring."""
+        self._layout.close()
+        self.shm.unlink()
+        _OWNED.discard(self.name)
+
+
+class FrameRingConsumer:
+    def __init__(self, name, poll_interval_s=0.001):
+        """
+        Attaches to an existing ring. Several threads may share one consumer; each frame is
+        handed to exactly one of them. A consumer that falls more than one ring length behind
+        skips to the oldest frame still available.
+        Args:
+            name (str): Name of the shared-memory block.
+            poll_interval_s (float): Sleep between checks for new frames.
+        """
+        self.name = name
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _OWNED:
+            # The producer owns the block; without this the resource tracker would remove it
+            # when this process exits
+            resource_tracker.unregister(shm._name, "shared_memory")
+        self._layout = _RingLayout(shm)
+        self.poll_interval_s = poll_interval_s
+        self._next_seq = int(self._layout.header["write_seq"]) + 1
+        self._lock = threading.Lock()
+        self.dropped = 0
+        logger.info("FrameRingConsumer attached to '%s' (%d slots).", name, self._layout.slots)
+
+    def read_next(self, timeout=None):
+        """
+        Waits for the next frame.
+        Returns:
+            Frame: The frame with an image view into shared memory, or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        layout = self._layout
+        while True:
+            with self._lock:
+                latest = int(layout.header["write_seq"])
+                # The slot after the newest frame may already be rewritten
+                oldest = latest - layout.slots + 2
+                if self._next_seq < oldest:
+                    self._drop(oldest - self._next_seq, "lapped")
+                    self._next_seq = oldest
+                seq = self._next_seq if self._next_seq <= latest else None
+                if seq is not None:
+                    self._next_seq += 1
+
+            if seq is None:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                time.sleep(self.poll_interval_s)
+                continue
+
+            slot = (seq - 1) % layout.slots
+            entry = layout.table[slot].copy()
+            if int(entry["seq"]) != seq:
+                self._drop(1, "overwritten")
+                continue
+            shape = (int(entry["height"]), int(entry["width"]))
+            if entry["channels"] > 1:
+                shape += (int(entry["channels"]),)
+            try:
+                camera_id = entry["camera_id"].decode()
+                metadata = json.loads(entry["metadata"].decode() or "{}")
+            except ValueError:
+                # Written by a producer that does not validate its fields; skip instead of failing the reader
+                self._drop(1, "invalid")
+                continue
+            image = layout.frame_view(slot, shape, _DTYPES[int(entry["dtype"])])
+            return Frame(seq, camera_id, float(entry["timestamp"]), metadata, image, slot)
+
+    def is_valid(self, frame):
+        """True while the producer has not started to overwrite the frame's slot."""
+        return int(self._layout.table[frame._slot]["seq"]) == frame.seq
+
+    def release(self, frame):
+        """
+        Checks after processing that the frame was not overwritten in the meantime.
+        Returns:
+            bool: False if the results computed from the frame must be discarded.
+        """
+        if self.is_valid(frame):
+            return True
+        self._drop(1, "overwritten")
+        return False
+
+    def discard(self, frame, reason="failed"):
+        """Gives up a frame that could not be processed; it is counted as dropped."""
+        self._drop(1, reason)
+
+    def _drop(self, count, reason):
+        self.dropped += count
+        FRAMES_DROPPED.inc(count, ring=self.name, reason=reason)
+        logger.warning("Frame ring '%s': %d frame(s) dropped (%s).", self.name, count, reason)
+
+    def close(self):
+        self._layout.close()
+
+
+def iter_source_frames(source):
+    """Yields BGR frames from a video file, a camera index or a directory of images."""
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "*.jpg")) + glob.glob(os.path.join(source, "*.png")))
+        for path in paths:
+            img = cv2.imread(path)
+            if img is not None:
+                yield img
+        return
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    try:
+        while True:
+            ok, img = capture.read()
+            if not ok:
+                return
+            yield img
+    finally:
+        capture.release()
+
+
+def run_stand_in_producer(name, source, camera_id="cam0", fps=30.0, loop=True, slots=8):
+    """
+    Replays a video or image directory into a ring at a fixed frame rate, as a stand-in
+    for a camera acquisition process.
+    """
+    frames = list(iter_source_frames(source))
+    if not frames:
+        raise ValueError(f"No frames found in {source}")
+    max_shape = tuple(int(v) for v in np.max([frame.shape for frame in frames], axis=0))
+    producer = FrameRingProducer(name, slots=slots, max_shape=max_shape)
+    interval = 1.0 / fps
+    next_time = time.monotonic()
+    try:
+        while True:
+            for index, frame in enumerate(frames):
+                producer.publish(frame, camera_id, metadata={"source_index": index})
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.monotonic()))
+            if not loop:
+                break
+    finally:
+        producer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shared-memory frame ring stand-in producer")
+    parser.add_argument("source", help="Video file, camera index or directory of images")
+    parser.add_argument("--name", default="inspection_cam0")
+    parser.add_argument("--camera-id", default="cam0")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--once", action="store_true", help="Play the source once instead of looping")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        run_stand_in_producer(args.name, args.source, args.camera_id, args.fps, not args.once, args.slots)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,146 @@
+import cv2
+import numpy as np
+
+# cv2.imdecode flags for decoding at 1/1, 1/2, 1/4 and 1/8 resolution.
+# For JPEG the reduction happens inside the decoder (DCT scaling), so the full frame is never materialized.
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+RAW_DTYPES = {
+    "uint8": np.uint8,
+    "uint16": np.uint16,
+    "float32": np.float32,
+}
+
+# Start-of-frame markers carrying the image dimensions (excluding DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_dimensions(buffer):
+    """
+    Reads width and height from a JPEG header without decoding the image.
+    Args:
+        buffer (bytes-like): Encoded image data.
+    Returns:
+        tuple: (width, height), or None if the data is not a parseable JPEG.
+    """
+    data = memoryview(buffer)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # Markers without payload
+            i += 2
+            continue
+        length = (data[i + 2] << 8) | data[i + 3]
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+def choose_reduction(width, height, target_size):
+    """
+    Returns the largest decode reduction factor (1, 2, 4 or 8) that keeps the
+    longer image side at or above target_size.
+    """
+    longest = max(width, height)
+    for factor in (8, 4, 2):
+        if longest / factor >= target_size:
+            return factor
+    return 1
+
+
+def decode_image(buffer, target_size=None):
+    """
+    Decodes an encoded image (JPEG, PNG, ...) directly from memory into a BGR array.
+    Args:
+        buffer (bytes-like): Encoded image data; bytes, bytearray or memoryview are used without copying.
+        target_size (int, optional): If given, JPEGs larger than needed for this model input
+                                     size are decoded at a reduced resolution.
+    Returns:
+        tuple: (image as np.ndarray, reduction factor applied at decode time).
+    Raises:
+        ValueError: If the data cannot be decoded.
+    """
+    if memoryview(buffer).nbytes == 0:
+        raise ValueError("Empty image data")
+
+    factor = 1
+    if target_size:
+        dimensions = jpeg_dimensions(buffer)
+        if dimensions is not None:
+            factor = choose_reduction(dimensions[0], dimensions[1], target_size)
+
+    image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), REDUCED_DECODE_FLAGS[factor])
+    if image is None:
+        raise ValueError("Could not decode image data")
+    return image, factor
+
+
+def decode_raw_pixels(buffer, shape, dtype="uint8", channel_order="bgr", buffers=None):
+    """
+    Wraps a raw pixel payload as an 8-bit BGR image.
+    Args:
+        buffer (bytes-like): Raw pixel data in row-major order.
+        shape (tuple): (height, width) or (height, width, channels).
+        dtype (str): One of RAW_DTYPES. uint16 data is scaled to 8 bit, float32 is expected in [0, 1].
+        channel_order (str): 'bgr' or 'rgb' for 3-channel data; single-channel data is treated as gray.
+        buffers (BufferLease, optional): Supplies the converted images instead of allocating them.
+    Returns:
+        np.ndarray: The image. For uint8 BGR input this is a view of the buffer (no copy).
+    Raises:
+        ValueError: If shape, dtype or payload size do not match.
+    """
+    if channel_order not in ("bgr", "rgb", "gray"):
+        raise ValueError(f"Unsupported channel order '{channel_order}', expected bgr, rgb or gray")
+    if dtype not in RAW_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {sorted(RAW_DTYPES)}")
+    shape = tuple(int(v) for v in shape)
+    if len(shape) not in (2, 3) or (len(shape) == 3 and shape[2] not in (1, 3)):
+        raise ValueError(f"Unsupported shape {shape}, expected (h, w) or (h, w, 1|3)")
+
+    np_dtype = np.dtype(RAW_DTYPES[dtype])
+    expected = int(np.prod(shape)) * np_dtype.itemsize
+    received = memoryview(buffer).nbytes
+    if received != expected:
+        raise ValueError(f"Payload has {received} bytes, expected {expected} for {shape} {dtype}")
+
+    image = np.frombuffer(buffer, dtype=np_dtype).reshape(shape)
+    if buffers is not None and np_dtype != np.uint8:
+        converted = buffers.get(shape, np.uint8)
+        if np_dtype == np.uint16:
+            np.right_shift(image, 8, out=converted, casting="unsafe")
+        else:
+            scaled = buffers.get(shape, np.float32)
+            np.clip(image, 0.0, 1.0, out=scaled)
+            np.multiply(scaled, 255.0, out=scaled)
+            np.copyto(converted, scaled, casting="unsafe")
+        image = converted
+    elif np_dtype == np.uint16:
+        image = (image >> 8).astype(np.uint8)
+    elif np_dtype == np.float32:
+        image = (np.clip(image, 0.0, 1.0) * 255.0).astype(np.uint8)
+
+    bgr_shape = (shape[0], shape[1], 3)
+    if image.ndim == 2 or image.shape[2] == 1:
+        dst = buffers.get(bgr_shape) if buffers is not None else None
+        return cv2.cvtColor(image.reshape(shape[0], shape[1]), cv2.COLOR_GRAY2BGR, dst=dst)
+    if channel_order == "rgb":
+        dst = buffers.get(bgr_shape) if buffers is not None else None
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=dst)
+    return image
@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import REGISTRY, QUEUE_DEPTH, STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+REJECTED_TOTAL = REGISTRY.counter(
+    "inspection_executor_rejected_total", "Work items rejected because the executor queue was full", ("queue",)
+)
+
+
+class ExecutorOverloaded(RuntimeError):
+    """Raised when the executor already holds as much work as it may queue."""
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers=2, max_queue=16, name="inference"):
+        """
+        Bounded thread pool for CPU-bound preprocessing and inference.
+        OpenCV and PyTorch release the GIL in their heavy kernels, so threads give
+        real parallelism while sharing one loaded model.
+        Args:
+            max_workers (int): Number of worker threads.
+            max_queue (int): Number of work items that may wait for a free worker.
+                             Submissions beyond max_workers + max_queue are rejected.
+            name (str): Queue name used in metrics and thread names.
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = 0
+        self._lock = threading.Lock()
+        logger.info("InferenceExecutor '%s' initialized with %d workers, queue %d.", name, max_workers, max_queue)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @property
+    def queued(self):
+        """Work items waiting for a free worker"""
+        return max(0, self._pending - self.max_workers)
+
+    def is_full(self):
+        return self._pending >= self.capacity
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        QUEUE_DEPTH.dec(queue=self.name)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submits work to the pool.
+        Returns:
+            concurrent.futures.Future: The future of the work item.
+        Raises:
+            ExecutorOverloaded: If the queue is full.
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                REJECTED_TOTAL.inc(queue=self.name)
+                raise ExecutorOverloaded(f"{self.name} queue is full ({self.capacity} items)")
+            self._pending += 1
+        QUEUE_DEPTH.inc(queue=self.name)
+
+        submitted = time.perf_counter()
+
+        def run():
+            STAGE_DURATION.observe(time.perf_counter() - submitted, stage=f"{self.name}_queue_wait")
+            return fn(*args, **kwargs)
+
+        # Carries the caller's context (e.g. its stage trace) into the worker thread
+        future = self._executor.submit(contextvars.copy_context().run, run)
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Runs fn in the pool and awaits its result from the event loop.
+        Raises:
+            ExecutorOverloaded: If the queue is full.
+            asyncio.TimeoutError: If the result is not available within timeout seconds.
+                                  Work that has not started yet is cancelled.
+        """
+        future = asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
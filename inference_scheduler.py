@@ -0,0 +1,186 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+from .metrics import REGISTRY, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+REALTIME = "realtime"
+BULK = "bulk"
+LANES = (REALTIME, BULK)
+
+SCHEDULER_WAIT = REGISTRY.histogram(
+    "inspection_scheduler_wait_seconds", "Time from submission until inference starts, per lane", ("lane",)
+)
+SCHEDULER_BATCH_SIZE = REGISTRY.histogram(
+    "inspection_scheduler_batch_size", "Images per detector call, per lane", ("lane",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+SLO_MISSES = REGISTRY.counter(
+    "inspection_scheduler_slo_misses_total", "Realtime detections that finished after the latency SLO", ("lane",)
+)
+
+
+class _WorkItem:
+    __slots__ = ("image", "box_scale", "profile", "future", "submitted")
+
+    def __init__(self, image, box_scale, profile=None):
+        self.image = image
+        self.box_scale = box_scale
+        self.profile = profile
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+class PriorityInferenceScheduler:
+    def __init__(self, detector, realtime_slo_ms=100.0, realtime_max_batch=4, bulk_max_batch=32,
+                 bulk_max_wait_ms=20.0, preemption_budget=0.5):
+        """
+        Schedules detector calls from two priority lanes onto one DefectDetector.
+        Realtime frames are always served first. Bulk work fills the remaining capacity
+        in batches that are sized so that one bulk batch takes at most
+        preemption_budget * realtime_slo_ms; realtime frames therefore wait at most one
+        such batch before they preempt bulk work at the next batch boundary.
+        Args:
+            detector (DefectDetector): The detector all lanes share.
+            realtime_slo_ms (float): Latency objective for realtime detections.
+            realtime_max_batch (int): Maximum number of realtime frames per detector call.
+            bulk_max_batch (int): Upper limit for bulk batch sizes.
+            bulk_max_wait_ms (float): How long a partial bulk batch may wait to fill up.
+            preemption_budget (float): Share of the realtime SLO one bulk batch may take.
+        """
+        self.detector = detector
+        self.realtime_slo_s = realtime_slo_ms / 1000.0
+        self.realtime_max_batch = realtime_max_batch
+        self.bulk_max_batch = bulk_max_batch
+        self.bulk_max_wait_s = bulk_max_wait_ms / 1000.0
+        self.preemption_budget = preemption_budget
+
+        self._queues = {lane: deque() for lane in LANES}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._per_image_s = None  # Moving average of batched inference time per image
+        self._stats = {lane: {"completed": 0, "wait_total_s": 0.0, "wait_max_s": 0.0, "slo_misses": 0}
+                       for lane in LANES}
+
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("PriorityInferenceScheduler started (realtime SLO %.0f ms).", realtime_slo_ms)
+
+    def submit(self, image, box_scale=1.0, lane=REALTIME, profile=None):
+        """
+        Queues an image for detection.
+        Only consecutive items with the same inference profile are batched together.
+        Returns:
+            concurrent.futures.Future: Resolves to the list of defects.
+        """
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {LANES}")
+        item = _WorkItem(image, box_scale, profile)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Scheduler has been shut down")
+            self._queues[lane].append(item)
+            QUEUE_DEPTH.set(len(self._queues[lane]), queue=f"scheduler_{lane}")
+            self._condition.notify()
+        return item.future
+
+    def detect(self, image, box_scale=1.0, lane=REALTIME, timeout=None, profile=None):
+        """Blocking variant of submit returning the list of defects."""
+        return self.submit(image, box_scale, lane, profile).result(timeout)
+
+    def bulk_batch_size(self):
+        """Largest bulk batch that still fits into the preemption budget."""
+        if self._per_image_s is None:
+            return min(self.bulk_max_batch, self.realtime_max_batch)
+        budget = self.realtime_slo_s * self.preemption_budget
+        return max(1, min(self.bulk_max_batch, int(budget / self._per_image_s)))
+
+    def _take(self, lane, count):
+        queue = self._queues[lane]
+        items = [queue.popleft()]
+        while queue and len(items) < count and queue[0].profile == items[0].profile:
+            items.append(queue.popleft())
+        QUEUE_DEPTH.set(len(queue), queue=f"scheduler_{lane}")
+        return items
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._queues[REALTIME]:
+                    return REALTIME, self._take(REALTIME, self.realtime_max_batch)
+                bulk = self._queues[BULK]
+                if bulk:
+                    target = self.bulk_batch_size()
+                    remaining = self.bulk_max_wait_s - (time.perf_counter() - bulk[0].submitted)
+                    if len(bulk) >= target or remaining <= 0 or self._stopped:
+                        return BULK, self._take(BULK, target)
+                    # Wait for more bulk work; a realtime arrival wakes us up and wins
+                    self._condition.wait(remaining)
+                    continue
+                if self._stopped:
+                    return None, []
+                self._condition.wait()
+
+    def _run(self):
+        while True:
+            lane, items = self._next_batch()
+            if lane is None:
+                return
+
+            start = time.perf_counter()
+            stats = self._stats[lane]
+            for item in items:
+                wait = start - item.submitted
+                SCHEDULER_WAIT.observe(wait, lane=lane)
+                stats["wait_total_s"] += wait
+                stats["wait_max_s"] = max(stats["wait_max_s"], wait)
+            SCHEDULER_BATCH_SIZE.observe(len(items), lane=lane)
+
+            try:
+                results = self.detector.detect_defects_batch(
+                    [item.image for item in items], [item.box_scale for item in items], profile=items[0].profile
+                )
+            except Exception as e:
+                logger.exception("Batched detection failed for %d %s items", len(items), lane)
+                for item in items:
+                    item.future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            per_image = (finished - start) / len(items)
+            self._per_image_s = per_image if self._per_image_s is None else 0.8 * self._per_image_s + 0.2 * per_image
+
+            for item, defects in zip(items, results):
+                if lane == REALTIME and finished - item.submitted > self.realtime_slo_s:
+                    SLO_MISSES.inc(lane=lane)
+                    stats["slo_misses"] += 1
+                item.future.set_result(defects)
+            stats["completed"] += len(items)
+
+    def stats(self):
+        """Per-lane queue length, completed detections and wait times."""
+        with self._condition:
+            queued = {lane: len(queue) for lane, queue in self._queues.items()}
+        report = {}
+        for lane, stats in self._stats.items():
+            completed = stats["completed"]
+            report[lane] = {
+                "queued": queued[lane],
+                "completed": completed,
+                "mean_wait_ms": stats["wait_total_s"] / completed * 1000.0 if completed else None,
+                "max_wait_ms": stats["wait_max_s"] * 1000.0,
+                "slo_misses": stats["slo_misses"],
+            }
+        report["bulk_batch_size"] = self.bulk_batch_size()
+        return report
+
+    def shutdown(self, wait=True):
+        """Stops accepting work; queued items are still processed."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if wait:
+            self._thread.join()
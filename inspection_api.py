@@ -1,45 +1,228 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Request, request, jsonify, render_template, Response, g
 from flask_cors import CORS
 import os
 import sys
-import json
+import time
+import logging
 import base64
 from io import BytesIO
-from PIL import Image
-import numpy as np
-import cv2
 
 # Add the parent directory to the path to import our services
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from concurrent.futures import TimeoutError as FutureTimeout
+
 try:
     from services.inspection_service import InspectionService
+    from services.api_common import (
+        convert_numpy_types, is_truthy, parse_measurement_options, strip_data_url, parse_shape, overlay_data_url,
+        parse_priority, parse_profiles, job_payload, capture_details
+    )
+    from services.metrics import REGISTRY, QUEUE_DEPTH, time_stage, start_stage_trace, stop_stage_trace
+    from services.image_io import decode_image, decode_raw_pixels
+    from services.settings_store import SettingsConflict
+    from services.inference_executor import ExecutorOverloaded
+    from services.work_queue import start_work_queue_client
+    from services.profiling import SamplingProfiler, SlowRequestRecorder, ProfilerBusy
 except ImportError:
     # Fallback for direct execution
     sys.path.append('/home/ubuntu/metal_inspection_app/app')
     from services.inspection_service import InspectionService
+    from services.api_common import (
+        convert_numpy_types, is_truthy, parse_measurement_options, strip_data_url, parse_shape, overlay_data_url,
+        parse_priority, parse_profiles, job_payload, capture_details
+    )
+    from services.metrics import REGISTRY, QUEUE_DEPTH, time_stage, start_stage_trace, stop_stage_trace
+    from services.image_io import decode_image, decode_raw_pixels
+    from services.settings_store import SettingsConflict
+    from services.inference_executor import ExecutorOverloaded
+    from services.work_queue import start_work_queue_client
+    from services.profiling import SamplingProfiler, SlowRequestRecorder, ProfilerBusy
+
+# Per-frame messages are logged at DEBUG and therefore off unless explicitly enabled
+logging.basicConfig(
+    level=os.environ.get("INSPECTION_LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+REQUEST_DURATION = REGISTRY.histogram(
+    "inspection_http_request_duration_seconds", "HTTP request duration by endpoint", ("endpoint",)
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "inspection_http_requests_total", "HTTP requests by endpoint and status code", ("endpoint", "status")
+)
 
 
+class InMemoryUploadRequest(Request):
+    """Keeps uploaded files in memory so they can be decoded without a temporary file"""
 
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
 
 
 app = Flask(__name__, template_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates'))
+app.request_class = InMemoryUploadRequest
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("INSPECTION_MAX_UPLOAD_MB", "64")) * 1024 * 1024
+# Decode JPEGs at reduced resolution (down to the model input size) unless a request says otherwise
+app.config["REDUCED_DECODE"] = os.environ.get("INSPECTION_REDUCED_DECODE", "false").lower() in ("1", "true", "yes", "on")
 CORS(app)  # Enable CORS for all routes
 
-# Initialize the inspection service
-inspection_service = InspectionService()
+# Initialize the inspection service; realtime and bulk requests share the detector through priority lanes
+inspection_service = InspectionService(
+    use_scheduler=is_truthy(os.environ.get("INSPECTION_SCHEDULER", "true")),
+    realtime_slo_ms=float(os.environ.get("INSPECTION_REALTIME_SLO_MS", "100")),
+    profiles=parse_profiles(os.environ.get("INSPECTION_PROFILES")),
+    latency_slo_ms=float(os.environ.get("INSPECTION_LATENCY_SLO_MS", "0")) or None,
+    gate_path=os.environ.get("INSPECTION_GATE_PATH") or None,
+    gate_threshold=float(os.environ.get("INSPECTION_GATE_THRESHOLD", "0")) or None,
+    settings_path=os.environ.get("INSPECTION_SETTINGS_PATH", "config/inspection_settings.json"),
+    calibration_path=os.environ.get("INSPECTION_CALIBRATION_PATH", "config/calibrations.json")
+)
+
+# Distributed mode: frames are queued for stateless inference workers, either in this
+# process ('inprocess') or on other nodes connected to a broker ('host:port')
+app.config["WORK_QUEUE_TIMEOUT"] = float(os.environ.get("INSPECTION_REQUEST_TIMEOUT", "30"))
+work_queue_client = None
+if os.environ.get("INSPECTION_WORK_QUEUE"):
+    work_queue_client = start_work_queue_client(
+        os.environ["INSPECTION_WORK_QUEUE"],
+        inspection_service,
+        authkey=os.environ.get("INSPECTION_BROKER_AUTHKEY", "").encode(),
+        local_workers=int(os.environ.get("INSPECTION_LOCAL_WORKERS", "0"))
+    )
+
+# Opt-in diagnostics: an on-demand sampling profiler and the capture of slow requests for offline replay
+profiler = SamplingProfiler() if is_truthy(os.environ.get("INSPECTION_PROFILING", "false")) else None
+slow_request_recorder = None
+if float(os.environ.get("INSPECTION_SLOW_REQUEST_MS", "0")) > 0:
+    slow_request_recorder = SlowRequestRecorder(
+        os.environ.get("INSPECTION_SLOW_REQUEST_DIR", "logs/slow_requests"),
+        threshold_ms=float(os.environ["INSPECTION_SLOW_REQUEST_MS"]),
+        max_entries=int(os.environ.get("INSPECTION_SLOW_REQUEST_KEEP", "50"))
+    )
+
+def decode_target_size(values):
+    """Model input size to decode down to, or None for a full-resolution decode"""
+    if is_truthy(values.get('reduced_decode', app.config["REDUCED_DECODE"])):
+        return inspection_service.current_input_size()
+    return None
+
+def serialize_results(results, render=False):
+    """Build the JSON response for inspection results, optionally with an overlay preview"""
+    payload = {
+        "success": True,
+        "results": results
+    }
+    if render:
+        overlay = inspection_service.render_overlay(results["result_id"])
+        if overlay is not None:
+            payload["overlay"] = overlay_data_url(overlay)
+    with time_stage("serialization"):
+        payload["results"] = convert_numpy_types(results)
+        return jsonify(payload)
+
+def inspect_remote(frames, values, render=False, lane="realtime"):
+    """
+    Queue frames for the inference workers (distributed mode) and wait for their results.
+    frames are work queue payloads without options ('kind', 'data', decode options);
+    lane is the priority the jobs are queued and detected with
+    Returns the results in order, or an error response
+    """
+    request_id = request.headers.get('X-Request-Id')
+    try:
+        futures = [work_queue_client.submit(job_payload(frame, values, render, lane), request_id) for frame in frames]
+    except ExecutorOverloaded:
+        return None, (jsonify({"error": "Inspection queue is full, retry later"}), 503, {"Retry-After": "1"})
+    deadline = time.monotonic() + app.config["WORK_QUEUE_TIMEOUT"]
+    try:
+        return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures], None
+    except FutureTimeout:
+        for future in futures:
+            work_queue_client.cancel(future)
+        return None, (jsonify({"error": "Inspection timed out"}), 504)
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+
+def serialize_remote_results(results):
+    """Build the JSON response for a result computed by a worker; the overlay is rendered there"""
+    overlay = results.pop("overlay", None)
+    payload = {"success": True}
+    if overlay is not None:
+        payload["overlay"] = overlay_data_url(overlay)
+    with time_stage("serialization"):
+        payload["results"] = convert_numpy_types(results)
+        return jsonify(payload)
+
+def capture_request(frames, values, batch=False):
+    """
+    Remember the input frames (work queue frame descriptions) and options of this request
+    in case it turns out slow (see SlowRequestRecorder)
+    """
+    if slow_request_recorder is not None:
+        g.capture = {"frames": frames, "values": values, "batch": batch}
+
+def capture_slow_request(endpoint, latency, status):
+    capture = g.pop("capture")
+    options, inspection = capture_details(capture["values"], capture["batch"])
+    slow_request_recorder.capture(
+        endpoint, latency, capture["frames"], status=status, options=options, inspection=inspection,
+        settings=inspection_service.settings_store.get(), timings=g.get("stage_timings")
+    )
+
+@app.before_request
+def _start_request_timer():
+    g.start_time = time.perf_counter()
+    QUEUE_DEPTH.inc(queue="http_in_flight")
+    if slow_request_recorder is not None:
+        g.stage_timings = start_stage_trace()
+
+@app.teardown_request
+def _finish_request(exc=None):
+    if "start_time" in g:
+        QUEUE_DEPTH.dec(queue="http_in_flight")
+    if "stage_timings" in g:
+        stop_stage_trace()
+    # Drops the views of the upload buffers before the request closes them
+    g.pop("capture", None)
+
+@app.after_request
+def _record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if "start_time" in g:
+        latency = time.perf_counter() - g.start_time
+        REQUEST_DURATION.observe(latency, endpoint=endpoint)
+        if "capture" in g and slow_request_recorder.is_slow(latency):
+            capture_slow_request(endpoint, latency, response.status_code)
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus-style metrics endpoint"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Inspection API is running"})
+    health = {"status": "healthy", "message": "Inspection API is running"}
+    if inspection_service.scheduler is not None:
+        health["scheduler"] = inspection_service.scheduler.stats()
+    if inspection_service.profile_controller is not None:
+        health["profile"] = inspection_service.profile_controller.current_profile()["name"]
+    if work_queue_client is not None:
+        health["work_queue"] = work_queue_client.work_queue.stats()
+    health["buffer_pool"] = inspection_service.buffer_pool.stats()
+    return jsonify(health)
 
 @app.route('/api/inspect', methods=['POST'])
 def inspect_image():
     """
     Endpoint to perform inspection on an uploaded image
     Expects: multipart/form-data with 'image' file
-    Returns: JSON with defects and measurements
+    Optional: 'measurement_points', 'scale_factor', 'render', 'reduced_decode',
+              'priority' (realtime or bulk) and 'camera_id' as form fields or query parameters
+    Returns: JSON with result id, defects and measurements
     """
     try:
         if 'image' not in request.files:
@@ -49,59 +232,41 @@ def inspect_image():
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
         
-        # Save the uploaded file temporarily
-        temp_image_path = "temp_uploaded_image.jpg"
-        file.save(temp_image_path)
+        options = request.values
         
-        # Optional measurement points (if provided)
-        measurement_points = None
-        if 'measurement_points' in request.form:
-            try:
-                measurement_points = json.loads(request.form['measurement_points'])
-            except json.JSONDecodeError:
-                pass
+        render = is_truthy(options.get('render', False))
+        try:
+            lane = parse_priority(options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        frame = {"kind": "encoded", "data": file.stream.getbuffer(), "target_size": decode_target_size(options)}
+        capture_request([frame], options)
+        if work_queue_client is not None:
+            results, error = inspect_remote([frame], options, render, lane)
+            return error or serialize_remote_results(results[0])
         
-        # Optional scale factor
-        real_world_unit_per_pixel = None
-        if 'scale_factor' in request.form:
-            try:
-                real_world_unit_per_pixel = float(request.form['scale_factor'])
-            except ValueError:
-                pass
+        # Decode straight from the in-memory upload buffer, without a temporary file
+        try:
+            image, decode_scale = decode_image(frame["data"], frame["target_size"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        measurement_points, real_world_unit_per_pixel = parse_measurement_options(options)
         
         # Perform inspection
         results = inspection_service.perform_inspection(
-            temp_image_path, 
+            image, 
             measurement_points, 
-            real_world_unit_per_pixel
+            real_world_unit_per_pixel,
+            decode_scale=decode_scale,
+            lane=lane,
+            camera_id=options.get('camera_id')
         )
         
-        # Clean up temporary file
-        if os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
-        
-        # Convert numpy types to native Python types for JSON serialization
-        def convert_numpy_types(obj):
-            if isinstance(obj, np.integer):
-                return int(obj)
-            elif isinstance(obj, np.floating):
-                return float(obj)
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            elif isinstance(obj, dict):
-                return {key: convert_numpy_types(value) for key, value in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_numpy_types(item) for item in obj]
-            return obj
-        
-        results = convert_numpy_types(results)
-        
-        return jsonify({
-            "success": True,
-            "results": results
-        })
+        return serialize_results(results, render)
         
     except Exception as e:
+        logger.exception("Inspection request failed")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/inspect/base64', methods=['POST'])
@@ -109,77 +274,182 @@ def inspect_base64_image():
     """
     Endpoint to perform inspection on a base64-encoded image
     Expects: JSON with 'image_data' (base64 string)
-    Returns: JSON with defects and measurements
+    Optional: 'measurement_points', 'scale_factor', 'render', 'reduced_decode', 'priority' and 'camera_id'
+    Returns: JSON with result id, defects and measurements
     """
     try:
         data = request.get_json()
         if not data or 'image_data' not in data:
             return jsonify({"error": "No image data provided"}), 400
         
-        # Decode base64 image
-        image_data = data['image_data']
-        if image_data.startswith('data:image'):
-            # Remove data URL prefix if present
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(BytesIO(image_bytes))
+        render = is_truthy(data.get('render', False))
+        try:
+            lane = parse_priority(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        frame = {"kind": "base64", "data": strip_data_url(data['image_data']), "target_size": decode_target_size(data)}
+        capture_request([frame], data)
+        if work_queue_client is not None:
+            results, error = inspect_remote([frame], data, render, lane)
+            return error or serialize_remote_results(results[0])
         
-        # Convert to OpenCV format and save temporarily
-        temp_image_path = "temp_base64_image.jpg"
-        image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        cv2.imwrite(temp_image_path, image_cv)
+        # Decode base64 image (data URL prefix is removed if present)
+        try:
+            image_bytes = base64.b64decode(frame["data"])
+            image, decode_scale = decode_image(image_bytes, frame["target_size"])
+        except (ValueError, base64.binascii.Error) as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Optional measurement points
-        measurement_points = data.get('measurement_points')
-        real_world_unit_per_pixel = data.get('scale_factor')
+        measurement_points, real_world_unit_per_pixel = parse_measurement_options(data)
         
         # Perform inspection
         results = inspection_service.perform_inspection(
-            temp_image_path, 
+            image, 
             measurement_points, 
-            real_world_unit_per_pixel
+            real_world_unit_per_pixel,
+            decode_scale=decode_scale,
+            lane=lane,
+            camera_id=data.get('camera_id')
         )
         
-        # Clean up temporary file
-        if os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
-        
-        # Convert numpy types to native Python types for JSON serialization
-        def convert_numpy_types(obj):
-            if isinstance(obj, np.integer):
-                return int(obj)
-            elif isinstance(obj, np.floating):
-                return float(obj)
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            elif isinstance(obj, dict):
-                return {key: convert_numpy_types(value) for key, value in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_numpy_types(item) for item in obj]
-            return obj
-        
-        results = convert_numpy_types(results)
+        return serialize_results(results, render)
         
-        return jsonify({
-            "success": True,
-            "results": results
-        })
+    except Exception as e:
+        logger.exception("Inspection request failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/inspect/raw', methods=['POST'])
+def inspect_raw_image():
+    """
+    Endpoint to perform inspection on raw pixel data
+    Expects: application/octet-stream body with the pixels in row-major order and
+             query parameters 'shape' (e.g. 2048,2448,3), optional 'dtype' (uint8, uint16,
+             float32, default uint8) and 'channel_order' (bgr or rgb, default bgr)
+    Optional: 'measurement_points', 'scale_factor', 'render', 'priority' and 'camera_id' query parameters
+    Returns: JSON with result id, defects and measurements
+    """
+    try:
+        options = request.args
+        shape = options.get('shape') or request.headers.get('X-Image-Shape')
+        if not shape:
+            return jsonify({"error": "No image shape provided"}), 400
+        
+        render = is_truthy(options.get('render', False))
+        try:
+            lane = parse_priority(options)
+            frame = {"kind": "raw", "data": request.get_data(cache=False), "shape": parse_shape(shape),
+                     "dtype": options.get('dtype', 'uint8'), "channel_order": options.get('channel_order', 'bgr')}
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        capture_request([frame], options)
+        if work_queue_client is not None:
+            results, error = inspect_remote([frame], options, render, lane)
+            return error or serialize_remote_results(results[0])
+        
+        # Converted pixels (rgb, gray, high bit depth) live in pooled buffers until the response is built
+        with inspection_service.buffer_pool.lease() as buffers:
+            try:
+                image = decode_raw_pixels(
+                    frame["data"],
+                    frame["shape"],
+                    dtype=frame["dtype"],
+                    channel_order=frame["channel_order"],
+                    buffers=buffers
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            measurement_points, real_world_unit_per_pixel = parse_measurement_options(options)
+            
+            # Perform inspection
+            results = inspection_service.perform_inspection(
+                image, 
+                measurement_points, 
+                real_world_unit_per_pixel,
+                lane=lane,
+                camera_id=options.get('camera_id')
+            )
+        
+        return serialize_results(results, render)
+        
+    except Exception as e:
+        logger.exception("Inspection request failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/inspect/batch', methods=['POST'])
+def inspect_batch():
+    """
+    Endpoint to inspect several images in one request, e.g. for archive re-inspection
+    Expects: multipart/form-data with multiple 'images' files
+    Optional: 'priority' (default bulk) and 'reduced_decode' as form fields or query parameters
+    Returns: JSON with one result (result id, defects) per image, in upload order
+    """
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({"error": "No images provided"}), 400
+        
+        options = request.values
+        try:
+            lane = parse_priority(options, default="bulk")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        target_size = decode_target_size(options)
+        frames = [{"kind": "encoded", "data": file.stream.getbuffer(), "target_size": target_size} for file in files]
+        capture_request(frames, options, batch=True)
+        if work_queue_client is not None:
+            results, error = inspect_remote(frames, {}, lane=lane)
+            if error:
+                return error
+            with time_stage("serialization"):
+                return jsonify({"success": True, "results": convert_numpy_types(results)})
+        
+        try:
+            decoded = [decode_image(frame["data"], target_size) for frame in frames]
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        results = inspection_service.inspect_batch(
+            [image for image, _ in decoded],
+            decode_scales=[scale for _, scale in decoded],
+            lane=lane
+        )
+        
+        with time_stage("serialization"):
+            return jsonify({
+                "success": True,
+                "results": convert_numpy_types(results)
+            })
         
     except Exception as e:
+        logger.exception("Batch inspection request failed")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/results/<result_id>/overlay', methods=['GET'])
+def result_overlay(result_id):
+    """
+    Endpoint to render the annotated preview of a recent inspection on demand
+    Returns: image/jpeg
+    """
+    overlay = inspection_service.render_overlay(result_id)
+    if overlay is None:
+        return jsonify({"error": "Unknown or expired result id"}), 404
+    return Response(overlay, mimetype="image/jpeg")
+
 @app.route('/api/calibrate', methods=['POST'])
 def calibrate_camera():
     """
     Endpoint for camera calibration
     Expects: multipart/form-data with multiple 'images' files
-    Returns: JSON with calibration parameters
+    Optional: 'camera_id' (default 'default'); the calibration is stored as a new
+              version for that camera and used for its following inspections
+    Returns: JSON with calibration parameters and version
     """
     try:
         files = request.files.getlist('images')
         if not files:
             return jsonify({"error": "No calibration images provided"}), 400
+        camera_id = request.values.get('camera_id') or 'default'
         
         # Save uploaded files temporarily
         temp_paths = []
@@ -198,9 +468,11 @@ def calibrate_camera():
             if os.path.exists(temp_path):
                 os.remove(temp_path)
         
+        stored = inspection_service.update_calibration(camera_id, calibration_results)
         return jsonify({
             "success": True,
-            "calibration": calibration_results
+            "camera_id": camera_id,
+            "calibration": stored
         })
         
     except Exception as e:
@@ -210,27 +482,68 @@ def calibrate_camera():
 def settings():
     """
     Endpoint to get or update inspection settings
+    POST expects a JSON object with the settings to change; an optional 'version'
+    rejects the update with 409 if the settings were changed in the meantime
     """
     if request.method == 'GET':
-        # Return current settings (placeholder)
-        return jsonify({
-            "detection_threshold": 0.85,
-            "measurement_tolerance": 0.2,
-            "preprocessing_enabled": True
-        })
-    
-    elif request.method == 'POST':
-        # Update settings (placeholder)
-        data = request.get_json()
-        # In a real implementation, you would save these settings
-        return jsonify({
-            "success": True,
-            "message": "Settings updated successfully",
-            "settings": data
-        })
+        return jsonify(inspection_service.settings_store.get())
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    expected_version = data.pop("version", None)
+    data.pop("updated_at", None)
+    try:
+        updated = inspection_service.settings_store.update(data, expected_version)
+    except SettingsConflict as e:
+        return jsonify({"error": str(e), "settings": inspection_service.settings_store.get()}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "success": True,
+        "message": "Settings updated successfully",
+        "settings": updated
+    })
+
+@app.route('/api/debug/profile', methods=['POST'])
+def profile():
+    """
+    Endpoint to sample the running service for a while (opt-in with INSPECTION_PROFILING=true)
+    Optional: 'seconds' (default 10), 'interval_ms' (default 10) and 'include_idle' query parameters
+    Returns: text/plain collapsed stacks ('thread;outer;...;inner count' per line) for flamegraph tools
+    """
+    if profiler is None:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_s = float(request.args.get('interval_ms', profiler.interval_s * 1000)) / 1000
+        session = profiler.profile(seconds, interval_s, is_truthy(request.args.get('include_idle', False)))
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(session["stacks"] + "\n", mimetype="text/plain", headers={
+        "X-Profile-Samples": str(session["samples"]),
+        "X-Profile-Duration": str(session["duration_s"])
+    })
+
+@app.route('/api/debug/slow_requests', methods=['GET'])
+def slow_requests():
+    """
+    Endpoint listing the captured slow requests, newest first (opt-in with INSPECTION_SLOW_REQUEST_MS)
+    Each capture directory holds the input frames and can be replayed with python -m services.profiling
+    """
+    if slow_request_recorder is None:
+        return jsonify({"error": "Slow request capture is disabled"}), 404
+    return jsonify({
+        "threshold_ms": slow_request_recorder.threshold_s * 1000,
+        "directory": slow_request_recorder.directory,
+        "captures": slow_request_recorder.entries()
+    })
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # For many slow or concurrent clients use the async serving mode (inspection_api_async.py)
+    app.run(host='0.0.0.0', port=5000, debug=is_truthy(os.environ.get("INSPECTION_DEBUG", "false")), threaded=True)
 
 
 
@@ -0,0 +1,632 @@
+"""
+Async (ASGI) serving mode of the inspection API.
+
+Serves the same routes and payloads as inspection_api.py. Uploads and responses
+are handled on an event loop, so slow clients do not hold a worker thread.
+Decoding, preprocessing and inference run on a bounded executor. Requests are
+rejected with 503 when its queue is full and answered with 504 when they exceed
+the request timeout. With INSPECTION_WORK_QUEUE set, frames are instead queued
+for inference workers on this or other nodes (see work_queue.py).
+
+Run with:
+    hypercorn inspection_api_async:app --bind 0.0.0.0:5000
+or:
+    python inspection_api_async.py
+"""
+
+from quart import Quart, Request, request, jsonify, Response, g
+import os
+import sys
+import time
+import asyncio
+import logging
+import base64
+from io import BytesIO
+
+# Add the parent directory to the path to import our services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from services.inspection_service import InspectionService
+    from services.api_common import (
+        convert_numpy_types, is_truthy, parse_measurement_options, strip_data_url, parse_shape, overlay_data_url,
+        parse_priority, parse_profiles, job_payload, capture_details
+    )
+    from services.inference_executor import InferenceExecutor, ExecutorOverloaded
+    from services.metrics import REGISTRY, QUEUE_DEPTH, time_stage, start_stage_trace, stop_stage_trace
+    from services.image_io import decode_image, decode_raw_pixels
+    from services.settings_store import SettingsConflict
+    from services.work_queue import start_work_queue_client
+    from services.profiling import SamplingProfiler, SlowRequestRecorder, ProfilerBusy
+except ImportError:
+    # Fallback for direct execution
+    sys.path.append('/home/ubuntu/metal_inspection_app/app')
+    from services.inspection_service import InspectionService
+    from services.api_common import (
+        convert_numpy_types, is_truthy, parse_measurement_options, strip_data_url, parse_shape, overlay_data_url,
+        parse_priority, parse_profiles, job_payload, capture_details
+    )
+    from services.inference_executor import InferenceExecutor, ExecutorOverloaded
+    from services.metrics import REGISTRY, QUEUE_DEPTH, time_stage, start_stage_trace, stop_stage_trace
+    from services.image_io import decode_image, decode_raw_pixels
+    from services.settings_store import SettingsConflict
+    from services.work_queue import start_work_queue_client
+    from services.profiling import SamplingProfiler, SlowRequestRecorder, ProfilerBusy
+
+logging.basicConfig(
+    level=os.environ.get("INSPECTION_LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+REQUEST_DURATION = REGISTRY.histogram(
+    "inspection_http_request_duration_seconds", "HTTP request duration by endpoint", ("endpoint",)
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "inspection_http_requests_total", "HTTP requests by endpoint and status code", ("endpoint", "status")
+)
+
+
+class InMemoryUploadRequest(Request):
+    """Keeps uploaded files in memory so they can be decoded without a temporary file"""
+
+    def make_form_data_parser(self):
+        return self.form_data_parser_class(
+            max_content_length=self.max_content_length,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.parameter_storage_class,
+            stream_factory=lambda *args, **kwargs: BytesIO(),
+        )
+
+
+app = Quart(__name__)
+app.request_class = InMemoryUploadRequest
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("INSPECTION_MAX_UPLOAD_MB", "64")) * 1024 * 1024
+app.config["REDUCED_DECODE"] = is_truthy(os.environ.get("INSPECTION_REDUCED_DECODE", "false"))
+app.config["REQUEST_TIMEOUT"] = float(os.environ.get("INSPECTION_REQUEST_TIMEOUT", "30"))
+
+# Initialize the inspection service and the executor it runs on; realtime and
+# bulk requests share the detector through priority lanes
+inspection_service = InspectionService(
+    use_scheduler=is_truthy(os.environ.get("INSPECTION_SCHEDULER", "true")),
+    realtime_slo_ms=float(os.environ.get("INSPECTION_REALTIME_SLO_MS", "100")),
+    profiles=parse_profiles(os.environ.get("INSPECTION_PROFILES")),
+    latency_slo_ms=float(os.environ.get("INSPECTION_LATENCY_SLO_MS", "0")) or None,
+    gate_path=os.environ.get("INSPECTION_GATE_PATH") or None,
+    gate_threshold=float(os.environ.get("INSPECTION_GATE_THRESHOLD", "0")) or None,
+    settings_path=os.environ.get("INSPECTION_SETTINGS_PATH", "config/inspection_settings.json"),
+    calibration_path=os.environ.get("INSPECTION_CALIBRATION_PATH", "config/calibrations.json")
+)
+executor = InferenceExecutor(
+    max_workers=int(os.environ.get("INSPECTION_WORKERS", "2")),
+    max_queue=int(os.environ.get("INSPECTION_MAX_QUEUE", "16")),
+)
+inspection_service.attach_executor(executor)
+# Distributed mode: frames are queued for stateless inference workers, either in this
+# process ('inprocess') or on other nodes connected to a broker ('host:port')
+work_queue_client = None
+if os.environ.get("INSPECTION_WORK_QUEUE"):
+    work_queue_client = start_work_queue_client(
+        os.environ["INSPECTION_WORK_QUEUE"],
+        inspection_service,
+        authkey=os.environ.get("INSPECTION_BROKER_AUTHKEY", "").encode(),
+        local_workers=int(os.environ.get("INSPECTION_LOCAL_WORKERS", "0"))
+    )
+
+# Opt-in diagnostics: an on-demand sampling profiler and the capture of slow requests for offline replay
+profiler = SamplingProfiler() if is_truthy(os.environ.get("INSPECTION_PROFILING", "false")) else None
+slow_request_recorder = None
+if float(os.environ.get("INSPECTION_SLOW_REQUEST_MS", "0")) > 0:
+    slow_request_recorder = SlowRequestRecorder(
+        os.environ.get("INSPECTION_SLOW_REQUEST_DIR", "logs/slow_requests"),
+        threshold_ms=float(os.environ["INSPECTION_SLOW_REQUEST_MS"]),
+        max_entries=int(os.environ.get("INSPECTION_SLOW_REQUEST_KEEP", "50"))
+    )
+
+
+def decode_target_size(values):
+    """Model input size to decode down to, or None for a full-resolution decode"""
+    if is_truthy(values.get('reduced_decode', app.config["REDUCED_DECODE"])):
+        return inspection_service.current_input_size()
+    return None
+
+
+def overloaded_response():
+    response = jsonify({"error": "Inspection queue is full, retry later"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+async def run_inspection(decode, measurement_points, real_world_unit_per_pixel, render, lane="realtime",
+                         camera_id=None):
+    """
+    Decode and inspect on the executor and build the JSON response on the event loop.
+    decode is a callable taking a BufferLease for converted pixels and returning (image, decode_scale);
+    it raises ValueError for bad input.
+    """
+    queued_at = time.perf_counter()
+
+    def work():
+        with inspection_service.buffer_pool.lease() as buffers:
+            image, decode_scale = decode(buffers)
+            results = inspection_service.perform_inspection(
+                image, measurement_points, real_world_unit_per_pixel, decode_scale=decode_scale, lane=lane,
+                camera_id=camera_id, queued_at=queued_at
+            )
+        overlay = inspection_service.render_overlay(results["result_id"]) if render else None
+        return results, overlay
+
+    try:
+        results, overlay = await executor.run(work, timeout=app.config["REQUEST_TIMEOUT"])
+    except ExecutorOverloaded:
+        return overloaded_response()
+    except asyncio.TimeoutError:
+        return jsonify({"error": "Inspection timed out"}), 504
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    payload = {"success": True}
+    if overlay is not None:
+        payload["overlay"] = overlay_data_url(overlay)
+    with time_stage("serialization"):
+        payload["results"] = convert_numpy_types(results)
+        return jsonify(payload)
+
+
+async def inspect_remote(frames, values, render=False, lane="realtime"):
+    """
+    Queue frames for the inference workers (distributed mode) and wait for their results.
+    frames are work queue payloads without options ('kind', 'data', decode options);
+    lane is the priority the jobs are queued and detected with
+    Returns the results in order, or an error response
+    """
+    request_id = request.headers.get('X-Request-Id')
+    payloads = [job_payload(frame, values, render, lane) for frame in frames]
+    try:
+        # Queuing on a broker is a network round trip carrying the frame; keep it off the event loop
+        futures = await asyncio.to_thread(
+            lambda: [work_queue_client.submit(payload, request_id) for payload in payloads]
+        )
+    except ExecutorOverloaded:
+        return None, overloaded_response()
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*[asyncio.wrap_future(future) for future in futures]), app.config["REQUEST_TIMEOUT"]
+        )
+    except asyncio.TimeoutError:
+        for future in futures:
+            work_queue_client.cancel(future)
+        return None, (jsonify({"error": "Inspection timed out"}), 504)
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    return results, None
+
+
+def serialize_remote_results(results):
+    """Build the JSON response for a result computed by a worker; the overlay is rendered there"""
+    overlay = results.pop("overlay", None)
+    payload = {"success": True}
+    if overlay is not None:
+        payload["overlay"] = overlay_data_url(overlay)
+    with time_stage("serialization"):
+        payload["results"] = convert_numpy_types(results)
+        return jsonify(payload)
+
+
+def capture_request(frames, values, batch=False):
+    """
+    Remember the input frames (work queue frame descriptions) and options of this request
+    in case it turns out slow (see SlowRequestRecorder)
+    """
+    if slow_request_recorder is not None:
+        g.capture = {"frames": frames, "values": values, "batch": batch}
+
+
+def capture_slow_request(endpoint, latency, status):
+    capture = g.pop("capture")
+    options, inspection = capture_details(capture["values"], capture["batch"])
+    slow_request_recorder.capture(
+        endpoint, latency, capture["frames"], status=status, options=options, inspection=inspection,
+        settings=inspection_service.settings_store.get(), timings=g.get("stage_timings")
+    )
+
+
+@app.before_request
+async def _admission_control():
+    g.start_time = time.perf_counter()
+    QUEUE_DEPTH.inc(queue="http_in_flight")
+    if slow_request_recorder is not None:
+        g.stage_timings = start_stage_trace()
+    # Shed load before reading an upload body that could not be processed anyway
+    if (request.method == 'POST' and request.path.startswith('/api/inspect') and work_queue_client is None
+            and executor.is_full()):
+        return overloaded_response()
+
+
+@app.teardown_request
+async def _finish_request(exc=None):
+    if "start_time" in g:
+        QUEUE_DEPTH.dec(queue="http_in_flight")
+    if "stage_timings" in g:
+        stop_stage_trace()
+    # Drops the views of the upload buffers before the request closes them
+    g.pop("capture", None)
+
+
+@app.after_request
+async def _record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if "start_time" in g:
+        latency = time.perf_counter() - g.start_time
+        REQUEST_DURATION.observe(latency, endpoint=endpoint)
+        if "capture" in g and slow_request_recorder.is_slow(latency):
+            capture_slow_request(endpoint, latency, response.status_code)
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(response.status_code))
+    # Enable CORS for all routes
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Image-Shape"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus-style metrics endpoint"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    health = {
+        "status": "healthy",
+        "message": "Inspection API is running",
+        "queue": {"pending": executor.pending, "capacity": executor.capacity}
+    }
+    if inspection_service.scheduler is not None:
+        health["scheduler"] = inspection_service.scheduler.stats()
+    if inspection_service.profile_controller is not None:
+        health["profile"] = inspection_service.profile_controller.current_profile()["name"]
+    if work_queue_client is not None:
+        health["work_queue"] = await asyncio.to_thread(work_queue_client.work_queue.stats)
+    health["buffer_pool"] = inspection_service.buffer_pool.stats()
+    return jsonify(health)
+
+
+@app.route('/api/inspect', methods=['POST'])
+async def inspect_image():
+    """
+    Endpoint to perform inspection on an uploaded image
+    Expects: multipart/form-data with 'image' file
+    Optional: 'measurement_points', 'scale_factor', 'render', 'reduced_decode',
+              'priority' (realtime or bulk) and 'camera_id' as form fields or query parameters
+    Returns: JSON with result id, defects and measurements
+    """
+    try:
+        files = await request.files
+        if 'image' not in files:
+            return jsonify({"error": "No image file provided"}), 400
+
+        file = files['image']
+        if file.filename == '':
+            return jsonify({"error": "No image file selected"}), 400
+
+        options = await request.values
+        try:
+            lane = parse_priority(options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        buffer = file.stream.getbuffer()
+        target_size = decode_target_size(options)
+        frame = {"kind": "encoded", "data": buffer, "target_size": target_size}
+        capture_request([frame], options)
+        if work_queue_client is not None:
+            results, error = await inspect_remote([frame], options, is_truthy(options.get('render', False)), lane)
+            return error or serialize_remote_results(results[0])
+        measurement_points, real_world_unit_per_pixel = parse_measurement_options(options)
+
+        return await run_inspection(
+            lambda buffers: decode_image(buffer, target_size),
+            measurement_points,
+            real_world_unit_per_pixel,
+            is_truthy(options.get('render', False)),
+            lane,
+            options.get('camera_id')
+        )
+
+    except Exception as e:
+        logger.exception("Inspection request failed")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/inspect/base64', methods=['POST'])
+async def inspect_base64_image():
+    """
+    Endpoint to perform inspection on a base64-encoded image
+    Expects: JSON with 'image_data' (base64 string)
+    Optional: 'measurement_points', 'scale_factor', 'render', 'reduced_decode', 'priority' and 'camera_id'
+    Returns: JSON with result id, defects and measurements
+    """
+    try:
+        data = await request.get_json()
+        if not data or 'image_data' not in data:
+            return jsonify({"error": "No image data provided"}), 400
+
+        try:
+            lane = parse_priority(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        image_data = strip_data_url(data['image_data'])
+        target_size = decode_target_size(data)
+        frame = {"kind": "base64", "data": image_data, "target_size": target_size}
+        capture_request([frame], data)
+        if work_queue_client is not None:
+            results, error = await inspect_remote([frame], data, is_truthy(data.get('render', False)), lane)
+            return error or serialize_remote_results(results[0])
+        measurement_points, real_world_unit_per_pixel = parse_measurement_options(data)
+
+        def decode(buffers):
+            try:
+                return decode_image(base64.b64decode(image_data), target_size)
+            except base64.binascii.Error as e:
+                raise ValueError(str(e))
+
+        return await run_inspection(
+            decode, measurement_points, real_world_unit_per_pixel, is_truthy(data.get('render', False)), lane,
+            data.get('camera_id')
+        )
+
+    except Exception as e:
+        logger.exception("Inspection request failed")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/inspect/raw', methods=['POST'])
+async def inspect_raw_image():
+    """
+    Endpoint to perform inspection on raw pixel data
+    Expects: application/octet-stream body with the pixels in row-major order and
+             query parameters 'shape' (e.g. 2048,2448,3), optional 'dtype' (uint8, uint16,
+             float32, default uint8) and 'channel_order' (bgr or rgb, default bgr)
+    Optional: 'measurement_points', 'scale_factor', 'render', 'priority' and 'camera_id' query parameters
+    Returns: JSON with result id, defects and measurements
+    """
+    try:
+        options = request.args
+        shape = options.get('shape') or request.headers.get('X-Image-Shape')
+        if not shape:
+            return jsonify({"error": "No image shape provided"}), 400
+        try:
+            lane = parse_priority(options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        body = await request.get_data(cache=False)
+        try:
+            frame = {"kind": "raw", "data": body, "shape": parse_shape(shape),
+                     "dtype": options.get('dtype', 'uint8'), "channel_order": options.get('channel_order', 'bgr')}
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        capture_request([frame], options)
+        if work_queue_client is not None:
+            results, error = await inspect_remote([frame], options, is_truthy(options.get('render', False)), lane)
+            return error or serialize_remote_results(results[0])
+        measurement_points, real_world_unit_per_pixel = parse_measurement_options(options)
+
+        def decode(buffers):
+            image = decode_raw_pixels(
+                body,
+                frame["shape"],
+                dtype=frame["dtype"],
+                channel_order=frame["channel_order"],
+                buffers=buffers
+            )
+            return image, 1
+
+        return await run_inspection(
+            decode, measurement_points, real_world_unit_per_pixel, is_truthy(options.get('render', False)), lane,
+            options.get('camera_id')
+        )
+
+    except Exception as e:
+        logger.exception("Inspection request failed")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/inspect/batch', methods=['POST'])
+async def inspect_batch():
+    """
+    Endpoint to inspect several images in one request, e.g. for archive re-inspection
+    Expects: multipart/form-data with multiple 'images' files
+    Optional: 'priority' (default bulk) and 'reduced_decode' as form fields or query parameters
+    Returns: JSON with one result (result id, defects) per image, in upload order
+    """
+    try:
+        files = (await request.files).getlist('images')
+        if not files:
+            return jsonify({"error": "No images provided"}), 400
+
+        options = await request.values
+        try:
+            lane = parse_priority(options, default="bulk")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        target_size = decode_target_size(options)
+        buffers = [file.stream.getbuffer() for file in files]
+        frames = [{"kind": "encoded", "data": buffer, "target_size": target_size} for buffer in buffers]
+        capture_request(frames, options, batch=True)
+        if work_queue_client is not None:
+            results, error = await inspect_remote(frames, {}, lane=lane)
+            if error:
+                return error
+            with time_stage("serialization"):
+                return jsonify({"success": True, "results": convert_numpy_types(results)})
+
+        def work():
+            decoded = [decode_image(buffer, target_size) for buffer in buffers]
+            return inspection_service.inspect_batch(
+                [image for image, _ in decoded], decode_scales=[scale for _, scale in decoded], lane=lane
+            )
+
+        try:
+            results = await executor.run(work, timeout=app.config["REQUEST_TIMEOUT"])
+        except ExecutorOverloaded:
+            return overloaded_response()
+        except asyncio.TimeoutError:
+            return jsonify({"error": "Batch inspection timed out"}), 504
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        with time_stage("serialization"):
+            return jsonify({"success": True, "results": convert_numpy_types(results)})
+
+    except Exception as e:
+        logger.exception("Batch inspection request failed")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/results/<result_id>/overlay', methods=['GET'])
+async def result_overlay(result_id):
+    """
+    Endpoint to render the annotated preview of a recent inspection on demand
+    Returns: image/jpeg
+    """
+    try:
+        overlay = await executor.run(inspection_service.render_overlay, result_id,
+                                     timeout=app.config["REQUEST_TIMEOUT"])
+    except ExecutorOverloaded:
+        return overloaded_response()
+    except asyncio.TimeoutError:
+        return jsonify({"error": "Overlay rendering timed out"}), 504
+    if overlay is None:
+        return jsonify({"error": "Unknown or expired result id"}), 404
+    return Response(overlay, mimetype="image/jpeg")
+
+
+@app.route('/api/calibrate', methods=['POST'])
+async def calibrate_camera():
+    """
+    Endpoint for camera calibration
+    Expects: multipart/form-data with multiple 'images' files
+    Optional: 'camera_id' (default 'default'); the calibration is stored as a new
+              version for that camera and used for its following inspections
+    Returns: JSON with calibration parameters and version
+    """
+    try:
+        files = (await request.files).getlist('images')
+        if not files:
+            return jsonify({"error": "No calibration images provided"}), 400
+        camera_id = (await request.values).get('camera_id') or 'default'
+
+        def work():
+            from services.camera_calibration import CameraCalibrator
+
+            # Save uploaded files temporarily
+            temp_paths = []
+            for i, file in enumerate(files):
+                temp_path = f"temp_calibration_{i}.jpg"
+                with open(temp_path, "wb") as f:
+                    f.write(file.stream.getbuffer())
+                temp_paths.append(temp_path)
+            try:
+                calibration = CameraCalibrator().calibrate_camera(temp_paths)
+                return inspection_service.update_calibration(camera_id, calibration)
+            finally:
+                for temp_path in temp_paths:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+
+        calibration_results = await executor.run(work, timeout=app.config["REQUEST_TIMEOUT"])
+        return jsonify({
+            "success": True,
+            "camera_id": camera_id,
+            "calibration": calibration_results
+        })
+
+    except ExecutorOverloaded:
+        return overloaded_response()
+    except asyncio.TimeoutError:
+        return jsonify({"error": "Calibration timed out"}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/settings', methods=['GET', 'POST'])
+async def settings():
+    """
+    Endpoint to get or update inspection settings
+    POST expects a JSON object with the settings to change; an optional 'version'
+    rejects the update with 409 if the settings were changed in the meantime
+    """
+    if request.method == 'GET':
+        return jsonify(inspection_service.settings_store.get())
+
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    expected_version = data.pop("version", None)
+    data.pop("updated_at", None)
+    try:
+        updated = inspection_service.settings_store.update(data, expected_version)
+    except SettingsConflict as e:
+        return jsonify({"error": str(e), "settings": inspection_service.settings_store.get()}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "success": True,
+        "message": "Settings updated successfully",
+        "settings": updated
+    })
+
+
+@app.route('/api/debug/profile', methods=['POST'])
+async def profile():
+    """
+    Endpoint to sample the running service for a while (opt-in with INSPECTION_PROFILING=true)
+    Optional: 'seconds' (default 10), 'interval_ms' (default 10) and 'include_idle' query parameters
+    Returns: text/plain collapsed stacks ('thread;outer;...;inner count' per line) for flamegraph tools
+    """
+    if profiler is None:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_s = float(request.args.get('interval_ms', profiler.interval_s * 1000)) / 1000
+        # Samples from a thread of its own; the event loop keeps serving and shows up in the stacks
+        session = await asyncio.to_thread(
+            profiler.profile, seconds, interval_s, is_truthy(request.args.get('include_idle', False))
+        )
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(session["stacks"] + "\n", mimetype="text/plain", headers={
+        "X-Profile-Samples": str(session["samples"]),
+        "X-Profile-Duration": str(session["duration_s"])
+    })
+
+
+@app.route('/api/debug/slow_requests', methods=['GET'])
+async def slow_requests():
+    """
+    Endpoint listing the captured slow requests, newest first (opt-in with INSPECTION_SLOW_REQUEST_MS)
+    Each capture directory holds the input frames and can be replayed with python -m services.profiling
+    """
+    if slow_request_recorder is None:
+        return jsonify({"error": "Slow request capture is disabled"}), 404
+    captures = await asyncio.to_thread(slow_request_recorder.entries)
+    return jsonify({
+        "threshold_ms": slow_request_recorder.threshold_s * 1000,
+        "directory": slow_request_recorder.directory,
+        "captures": captures
+    })
+
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [os.environ.get("INSPECTION_BIND", "0.0.0.0:5000")]
+    asyncio.run(serve(app, config))
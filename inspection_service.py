@@ -1,79 +1,444 @@
 from .defect_detection import DefectDetector
 from .measurement import Measurement
 from .image_preprocessing import ImagePreprocessor
+from .metrics import time_stage, STAGE_DURATION
+from .visualization import OverlayRenderer
+from .inference_scheduler import PriorityInferenceScheduler, REALTIME, BULK
+from .adaptive_controller import AdaptiveProfileController
+from .anomaly_gate import TextureAnomalyGate
+from .settings_store import SettingsStore
+from .image_io import decode_raw_pixels
+from .part_tracker import PartTracker
+from .calibration_store import CalibrationStore
+from .buffer_pool import BufferPool
 import cv2
 import numpy as np
 import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Camera id of calibrations that apply to requests without a camera id
+DEFAULT_CAMERA = "default"
 
 class InspectionService:
-    def __init__(self, model_path="yolov8n.pt", camera_matrix=None, dist_coeffs=None):
-        self.defect_detector = DefectDetector(model_path)
+    def __init__(self, model_path="yolov8n.pt", camera_matrix=None, dist_coeffs=None,
+                 result_history=16, preview_max_size=960, model_input_size=640,
+                 use_scheduler=False, realtime_slo_ms=100.0, profiles=None, latency_slo_ms=None,
+                 gate_path=None, gate_threshold=None, settings_path=None, tracking_options=None,
+                 calibration_path=None):
+        """
+        Args:
+            model_path (str): Path to the YOLOv8 detection model.
+            camera_matrix (list, optional): Camera intrinsics for measurement while no calibration is stored
+                                            for the camera or as 'default'.
+            dist_coeffs (list, optional): Distortion coefficients to go with camera_matrix.
+            result_history (int): Number of recent results kept for on-demand overlays (0 disables).
+            preview_max_size (int): Maximum side length of stored overlay previews.
+            model_input_size (int): Detector input size; also the target for reduced-resolution decoding.
+            use_scheduler (bool): Route detections through a PriorityInferenceScheduler so that
+                                  realtime and bulk requests share the detector in priority lanes.
+            realtime_slo_ms (float): Latency objective of the realtime lane.
+            profiles (list, optional): Inference profiles ('name', 'model_path', 'img_size') ordered from
+                                       highest quality to fastest. If given, an AdaptiveProfileController
+                                       switches between them to keep end-to-end latency within latency_slo_ms.
+            latency_slo_ms (float, optional): End-to-end inspection latency objective for the adaptive
+                                              controller; defaults to realtime_slo_ms.
+            gate_path (str, optional): Fitted TextureAnomalyGate. If given, frames whose anomaly score stays
+                                       below the gate threshold are reported defect-free without running
+                                       preprocessing and the detector.
+            gate_threshold (float, optional): Overrides the threshold stored with the gate.
+            settings_path (str, optional): Persistent, versioned detection settings (see SettingsStore);
+                                           changes to the file are picked up without a restart.
+            tracking_options (dict, optional): Keyword arguments for the PartTracker of each stream
+                                               used by inspect_tracked().
+            calibration_path (str, optional): Persistent per-camera calibrations (see CalibrationStore);
+                                              each stored camera gets its own Measurement at startup.
+        """
+        self.model_input_size = model_input_size
+        # Intermediate frames of decode, preprocessing and model input are reused across requests
+        self.buffer_pool = BufferPool()
+        self.defect_detector = DefectDetector(model_path, img_size=model_input_size, buffer_pool=self.buffer_pool)
+        self.scheduler = None
+        if use_scheduler:
+            self.scheduler = PriorityInferenceScheduler(self.defect_detector, realtime_slo_ms=realtime_slo_ms)
+        self.profile_controller = None
+        if profiles:
+            self.profile_controller = AdaptiveProfileController(profiles, latency_slo_ms or realtime_slo_ms)
+            for profile in self.profile_controller.profiles:
+                self.defect_detector.load_model(profile["model_path"])
+        self.anomaly_gate = TextureAnomalyGate.load(gate_path, gate_threshold) if gate_path else None
+        self.tracking_options = tracking_options or {}
+        self._trackers = {}
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._executor = None
         self.image_preprocessor = ImagePreprocessor()
+        self.preprocessing_enabled = True
+        self.settings_store = SettingsStore(settings_path)
+        self.settings_store.subscribe(self._apply_settings)
         if camera_matrix is None or dist_coeffs is None:
             # Provide dummy camera parameters if not provided for basic functionality
-            print("Warning: Camera parameters not provided. Using dummy values for measurement.")
+            logger.warning("Camera parameters not provided. Using dummy values for measurement.")
             camera_matrix = [[1000.0, 0.0, 640.0], [0.0, 1000.0, 480.0], [0.0, 0.0, 1.0]]
             dist_coeffs = [0.0, 0.0, 0.0, 0.0, 0.0]
         self.measurement_module = Measurement(camera_matrix, dist_coeffs)
-        print("InspectionService initialized.")
+        self.calibration_store = CalibrationStore(calibration_path)
+        self._camera_measurements = {}
+        for camera_id in self.calibration_store.camera_ids():
+            self._load_calibration(camera_id)
+        self.overlay_renderer = OverlayRenderer(max_size=preview_max_size)
+        self.result_history = result_history
+        self._results = OrderedDict()
+        self._results_lock = threading.Lock()
+        logger.info("InspectionService initialized.")
+
+    def _load_calibration(self, camera_id):
+        calibration = self.calibration_store.get(camera_id)
+        # Replace the whole instance so that running inspections keep a consistent calibration
+        self._camera_measurements[camera_id] = Measurement(calibration["camera_matrix"], calibration["dist_coeffs"])
+        logger.info("Calibration version %d loaded for camera %s.", calibration["version"], camera_id)
+
+    def update_calibration(self, camera_id, calibration):
+        """
+        Persists a new calibration version for a camera and uses it for its following inspections.
+        Returns:
+            dict: The stored calibration including its version.
+        """
+        entry = self.calibration_store.save(camera_id, calibration)
+        self._load_calibration(camera_id)
+        return entry
+
+    def attach_executor(self, executor):
+        """
+        Tells the service which InferenceExecutor its inspections are queued on, so that the
+        adaptive controller sees the executor backlog instead of the inspections already running.
+        """
+        self._executor = executor
 
-    def perform_inspection(self, image_path, measurement_points=None, real_world_unit_per_pixel=None):
+    def _queue_depth(self):
+        if self._executor is not None:
+            return self._executor.queued
+        # Without an executor every request has its own thread; inspections beyond this one are the backlog
+        with self._in_flight_lock:
+            return self._in_flight - 1
+
+    def measurement_for(self, camera_id=None):
+        """
+        Measurement of a calibrated camera. Requests without a camera id and cameras without a
+        calibration of their own use the one stored as 'default' (e.g. by /api/calibrate without
+        a camera_id), or the camera parameters the service was created with.
+        """
+        measurement = self._camera_measurements.get(camera_id or DEFAULT_CAMERA)
+        if measurement is None:
+            if camera_id is not None:
+                logger.debug("No calibration stored for camera %s, using the default one.", camera_id)
+            measurement = self._camera_measurements.get(DEFAULT_CAMERA, self.measurement_module)
+        return measurement
+
+    def _apply_settings(self, settings):
+        self.defect_detector.apply_settings(settings)
+        self.preprocessing_enabled = settings["preprocessing_enabled"]
+
+    def _preprocess(self, image, buffers=None):
+        if not self.preprocessing_enabled:
+            return image
+        with time_stage("preprocess"):
+            return self.image_preprocessor.preprocess_array(image, buffers)
+
+    def perform_inspection(self, image, measurement_points=None, real_world_unit_per_pixel=None, decode_scale=1,
+                           lane=REALTIME, camera_id=None, queued_at=None):
         """
         Performs a complete inspection on an image, including defect detection and measurement.
         Args:
-            image_path (str): Path to the image to inspect.
+            image (str or np.ndarray): Path to the image to inspect, or an already decoded BGR image.
             measurement_points (list, optional): List of pixel coordinates for measurement.
             real_world_unit_per_pixel (float, optional): Scale for simplified measurement.
+            decode_scale (int): Reduction factor the image was decoded with. Defect boxes and
+                                measurement points are always in original frame coordinates.
+            lane (str): Scheduler lane, 'realtime' for line frames or 'bulk' for re-inspection.
+            camera_id (str, optional): Camera that took the image; selects its stored calibration.
+            queued_at (float, optional): time.perf_counter() when the request was queued, e.g. on an
+                                         InferenceExecutor; the adaptive controller then judges the
+                                         latency including the wait for a worker and the decode.
         Returns:
-            dict: A dictionary containing defect detection results and measurement results.
+            dict: A dictionary containing the result id, defect detection results and measurement results.
+                  With adaptive profiles it also names the inference profile that was used.
+                  An annotated overlay can be rendered later with render_overlay(result_id).
         """
-        print(f"Performing inspection on image: {image_path}")
+        start_time = time.perf_counter()
+        self.settings_store.reload_if_changed()
+        with self._in_flight_lock:
+            self._in_flight += 1
+        try:
+            with self.buffer_pool.lease() as buffers:
+                return self._inspect(image, measurement_points, real_world_unit_per_pixel, decode_scale, lane,
+                                     camera_id, start_time, queued_at, buffers)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def _inspect(self, image, measurement_points, real_world_unit_per_pixel, decode_scale, lane, camera_id,
+                 start_time, queued_at, buffers):
+        profile = self.profile_controller.current_profile() if self.profile_controller else None
+        settings_version = self.settings_store.version
 
-        # 1. Image Preprocessing for robustness
-        preprocessed_image_path = "preprocessed_for_inspection.jpg"
-        self.image_preprocessor.preprocess_image(image_path, preprocessed_image_path)
+        if isinstance(image, str):
+            logger.debug("Performing inspection on image: %s", image)
+            image_path, image = image, cv2.imread(image)
+            if image is None:
+                raise ValueError(f"Could not load image {image_path}")
 
-        # 2. Defect Detection on preprocessed image
-        defects = self.defect_detector.detect_defects(preprocessed_image_path)
+        # 1. Cheap anomaly screening; most parts are defect-free and never reach the detector
+        suspicious, anomaly_score = True, None
+        if self.anomaly_gate is not None:
+            suspicious, anomaly_score = self.anomaly_gate.screen(image)
 
-        # 3. Measurement (if points are provided) on preprocessed image
+        # 2. Image Preprocessing for robustness (needed by the detector and the measurement)
+        preprocessed_image = None
+        if suspicious or measurement_points:
+            preprocessed_image = self._preprocess(image, buffers)
+
+        # 3. Defect Detection on preprocessed image (records inference/postprocess stages)
+        defects = []
+        if suspicious:
+            if self.scheduler is not None:
+                # Inference runs batched on the scheduler thread; this is the wait and inference as seen by the request
+                with time_stage("scheduled_detection"):
+                    defects = self.scheduler.detect(preprocessed_image, decode_scale, lane, profile=profile)
+            else:
+                defects = self.defect_detector.detect_defects(
+                    preprocessed_image, box_scale=decode_scale, profile=profile
+                )
+
+        # 4. Measurement (if points are provided) on preprocessed image
         measurements = None
         if measurement_points:
-            measurements = self.measurement_module.measure_object_dimensions(
-                preprocessed_image_path, measurement_points, real_world_unit_per_pixel
+            with time_stage("measurement"):
+                measurements = self.measurement_for(camera_id).measure_object_dimensions(
+                    preprocessed_image, measurement_points, real_world_unit_per_pixel
+                )
+
+        # 5. Keep a reduced preview so that an overlay can be rendered on demand
+        result_id = uuid.uuid4().hex
+        if self.result_history > 0:
+            stored_image = preprocessed_image if preprocessed_image is not None else image
+            self._store_result(result_id, stored_image, defects, measurements, decode_scale)
+
+        total = time.perf_counter() - start_time
+        STAGE_DURATION.observe(total, stage="total")
+        logger.debug("Inspection complete.")
+        result = {"result_id": result_id, "defects": defects, "measurements": measurements,
+                  "settings_version": settings_version}
+        if self.anomaly_gate is not None:
+            result["anomaly_score"] = anomaly_score
+            result["detector_run"] = suspicious
+        if profile is not None:
+            result["profile"] = profile["name"]
+            if lane == REALTIME:
+                # The controller reacts to the latency as seen by the client and to the work waiting behind it
+                latency = time.perf_counter() - queued_at if queued_at is not None else total
+                self.profile_controller.observe(latency, self._queue_depth())
+        return result
+
+    def current_input_size(self):
+        """Detector input size of the active profile, the target for reduced-resolution decoding."""
+        if self.profile_controller is not None:
+            return self.profile_controller.current_profile()["img_size"]
+        return self.model_input_size
+
+    def inspect_batch(self, images, decode_scales=None, lane=BULK):
+        """
+        Inspects several images, e.g. for archive re-inspection.
+        With a scheduler the images are queued in the given lane and batched together
+        with other work of that lane; otherwise they are detected in one batched call.
+        Args:
+            images (list): Image paths or decoded BGR images.
+            decode_scales (list, optional): Decode reduction factor per image.
+            lane (str): Scheduler lane, 'bulk' by default.
+        Returns:
+            list: One result dictionary (result id, defects, measurements) per image.
+        """
+        decode_scales = decode_scales or [1] * len(images)
+        with self.buffer_pool.lease() as buffers:
+            return self._inspect_batch(images, decode_scales, lane, buffers)
+
+    def _inspect_batch(self, images, decode_scales, lane, buffers):
+        self.settings_store.reload_if_changed()
+        settings_version = self.settings_store.version
+        profile = self.profile_controller.current_profile() if self.profile_controller else None
+        frames, suspicious, scores = [], [], []
+        for image in images:
+            if isinstance(image, str):
+                image_path, image = image, cv2.imread(image)
+                if image is None:
+                    raise ValueError(f"Could not load image {image_path}")
+            is_suspicious, score = True, None
+            if self.anomaly_gate is not None:
+                is_suspicious, score = self.anomaly_gate.screen(image)
+            if is_suspicious:
+                image = self._preprocess(image, buffers)
+            frames.append(image)
+            suspicious.append(is_suspicious)
+            scores.append(score)
+
+        # Only frames that passed the anomaly gate go to the detector
+        selected = [i for i, flag in enumerate(suspicious) if flag]
+        all_defects = [[] for _ in frames]
+        if self.scheduler is not None:
+            futures = [self.scheduler.submit(frames[i], decode_scales[i], lane, profile) for i in selected]
+            for i, future in zip(selected, futures):
+                all_defects[i] = future.result()
+        elif selected:
+            batch_defects = self.defect_detector.detect_defects_batch(
+                [frames[i] for i in selected], [decode_scales[i] for i in selected], profile
             )
+            for i, defects in zip(selected, batch_defects):
+                all_defects[i] = defects
+
+        results = []
+        for image, defects, scale, is_suspicious, score in zip(frames, all_defects, decode_scales, suspicious, scores):
+            result_id = uuid.uuid4().hex
+            if self.result_history > 0:
+                self._store_result(result_id, image, defects, None, scale)
+            result = {"result_id": result_id, "defects": defects, "measurements": None,
+                      "settings_version": settings_version}
+            if self.anomaly_gate is not None:
+                result["anomaly_score"] = score
+                result["detector_run"] = is_suspicious
+            if profile is not None:
+                result["profile"] = profile["name"]
+            results.append(result)
+        return results
+
+    def inspect_tracked(self, image, stream_id="default", part_id=None, decode_scale=1, lane=REALTIME):
+        """
+        Inspects one frame of a conveyor stream. Parts and defects are tracked across frames,
+        so the detector only runs on keyframes; in between, the known defects are moved with
+        the estimated belt motion. Frames of one stream must be passed in order.
+        Args:
+            image (np.ndarray): Decoded BGR frame.
+            stream_id (str): Camera or stream the frame belongs to; each has its own tracker.
+            part_id (optional): Part identifier from the line control; otherwise parts are separated
+                                by belt travel.
+            decode_scale (int): Reduction factor the image was decoded with.
+            lane (str): Scheduler lane for keyframe detections.
+        Returns:
+            dict: part_id, whether the frame was a keyframe, the tracked defects in this frame and
+                  'part_verdicts', the consolidated verdicts of parts that were completed.
+        """
+        tracker = self._trackers.get(stream_id)
+        if tracker is None:
+            tracker = self._trackers[stream_id] = PartTracker(**self.tracking_options)
+
+        with time_stage("tracking"):
+            keyframe, verdicts = tracker.step(image, part_id, box_scale=decode_scale)
+        if keyframe:
+            profile = self.profile_controller.current_profile() if self.profile_controller else None
+            with self.buffer_pool.lease() as buffers:
+                preprocessed_image = self._preprocess(image, buffers)
+                if self.scheduler is not None:
+                    defects = self.scheduler.detect(preprocessed_image, decode_scale, lane, profile=profile)
+                else:
+                    defects = self.defect_detector.detect_defects(
+                        preprocessed_image, box_scale=decode_scale, profile=profile
+                    )
+            tracker.update(defects)
+        return {
+            "part_id": tracker.part_id,
+            "keyframe": keyframe,
+            "defects": tracker.current_defects(),
+            "part_verdicts": verdicts,
+        }
 
-        # 4. Visualize results (optional, for debugging/demonstration)
-        output_image_path = "inspection_results.jpg"
-        self._visualize_inspection_results(preprocessed_image_path, defects, measurements, output_image_path)
-
-        print("Inspection complete.")
-        return {"defects": defects, "measurements": measurements}
-
-    def _visualize_inspection_results(self, image_path, defects, measurements, output_path):
-        img = cv2.imread(image_path)
-        if img is None:
-            print(f"Error: Could not load image {image_path}")
-            return
-
-        # Draw defect bounding boxes
-        for defect in defects:
-            x1, y1, x2, y2 = map(int, defect["box"])
-            confidence = defect["confidence"]
-            class_name = defect["class"]
-            color = (0, 0, 255)  # Red for defects
-            thickness = 2
-            cv2.rectangle(img, (x1, y1), (x2, y2), color, thickness)
-            label = f"{class_name}: {confidence:.2f}"
-            cv2.putText(img, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, thickness)
-
-        # Draw measurement results (simplified for now)
-        if measurements and "measured_length" in measurements:
-            text = f'Measured Length: {measurements["measured_length"]:.2f}'
-            cv2.putText(img, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2) # Green for measurements
-
-        cv2.imwrite(output_path, img)
-        print(f"Inspection results visualized and saved to: {output_path}")
+    def finish_tracked_part(self, stream_id="default"):
+        """Returns the verdict of the part currently in view of a stream, e.g. when the line stops."""
+        tracker = self._trackers.get(stream_id)
+        if tracker is None or tracker.part_id is None:
+            return None
+        return tracker.finish()
+
+    def serve_frame_ring(self, consumer, on_result, stop_event=None, poll_timeout=0.5, tracking=False):
+        """
+        Inspects frames from a shared-memory FrameRingConsumer until stop_event is set.
+        Frames are inspected in place without encoding or copying. Results of frames the
+        producer overwrote during inspection are discarded; the ring counts them as dropped.
+        A frame whose inspection fails is logged, counted as dropped and skipped.
+        Several threads may run this method on the same consumer.
+        Args:
+            consumer (FrameRingConsumer): Attached frame ring.
+            on_result (callable): Called with (frame, result) for every inspected frame.
+            stop_event (threading.Event, optional): Ends the loop when set.
+            poll_timeout (float): How often stop_event is checked while no frames arrive.
+            tracking (bool): Track parts per camera with inspect_tracked() instead of inspecting every
+                             frame; a 'part_id' in the frame metadata marks part boundaries. Frames of
+                             one camera must then be served by a single thread.
+        """
+        while stop_event is None or not stop_event.is_set():
+            frame = consumer.read_next(timeout=poll_timeout)
+            if frame is None:
+                continue
+            try:
+                with self.buffer_pool.lease() as buffers:
+                    # A view for 8-bit BGR frames; gray and high bit depth frames are converted into pooled buffers
+                    image = decode_raw_pixels(frame.image, frame.image.shape, frame.image.dtype.name, buffers=buffers)
+                    if tracking:
+                        result = self.inspect_tracked(image, frame.camera_id, frame.metadata.get("part_id"))
+                    else:
+                        result = self.perform_inspection(image, lane=REALTIME, camera_id=frame.camera_id)
+            except Exception:
+                # One bad frame must not end the thread serving the camera
+                logger.exception("Inspection of frame %d from camera %s failed.", frame.seq, frame.camera_id)
+                consumer.discard(frame)
+                continue
+            if not consumer.release(frame):
+                if not (tracking and result["part_verdicts"]):
+                    continue
+                # Verdicts of completed parts do not depend on the overwritten pixels
+                result["defects"] = []
+            result["frame_seq"] = frame.seq
+            result["camera_id"] = frame.camera_id
+            on_result(frame, result)
+
+    def _store_result(self, result_id, image, defects, measurements, decode_scale=1):
+        preview, scale = self.overlay_renderer.make_preview(image)
+        # Boxes are in original frame coordinates, the image may have been decoded reduced
+        scale /= decode_scale
+        with self._results_lock:
+            self._results[result_id] = {
+                "preview": preview,
+                "scale": scale,
+                "defects": defects,
+                "measurements": measurements,
+            }
+            while len(self._results) > self.result_history:
+                self._results.popitem(last=False)
+
+    def get_result(self, result_id):
+        """Returns the stored defects and measurements of a recent inspection, or None."""
+        with self._results_lock:
+            entry = self._results.get(result_id)
+        if entry is None:
+            return None
+        return {"result_id": result_id, "defects": entry["defects"], "measurements": entry["measurements"]}
+
+    def render_overlay(self, result_id):
+        """
+        Renders the annotated preview of a recent inspection as JPEG bytes.
+        Returns:
+            bytes: JPEG data, or None if the result is no longer stored.
+        """
+        with self._results_lock:
+            entry = self._results.get(result_id)
+        if entry is None:
+            return None
+        return self.overlay_renderer.render(
+            result_id, entry["preview"], entry["scale"], entry["defects"], entry["measurements"]
+        )
 
 if __name__ == "__main__":
     # Example Usage:
@@ -87,6 +452,8 @@ if __name__ == "__main__":
             f.write("0 0.5 0.5 0.1 0.1")
         print(f"Created dummy image at {dummy_image_path}")
 
+    logging.basicConfig(level=logging.DEBUG)
+
     # Initialize InspectionService (using dummy camera params for now)
     inspection_service = InspectionService()
 
@@ -99,4 +466,9 @@ if __name__ == "__main__":
     )
     print("Full Inspection Results:", results)
 
+    overlay = inspection_service.render_overlay(results["result_id"])
+    with open("inspection_results.jpg", "wb") as f:
+        f.write(overlay)
+    print("Overlay saved to inspection_results.jpg")
+
 
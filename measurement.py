@@ -1,11 +1,27 @@
 import cv2
 import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Measurement:
     def __init__(self, camera_matrix, dist_coeffs):
-        self.camera_matrix = np.array(camera_matrix)
-        self.dist_coeffs = np.array(dist_coeffs)
-        print("Measurement module initialized with camera parameters.")
+        """
+        Args:
+            camera_matrix (list): 3x3 camera intrinsics.
+            dist_coeffs (list): Distortion coefficients.
+        """
+        self.camera_matrix = np.array(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.array(dist_coeffs, dtype=np.float64)
+        self.has_distortion = bool(np.any(self.dist_coeffs))
+        logger.info("Measurement module initialized with camera parameters.")
+
+    def undistort_points(self, points):
+        """Maps pixel coordinates of the distorted frame to the undistorted frame."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if not self.has_distortion:
+            return points.reshape(-1, 2)
+        return cv2.undistortPoints(points, self.camera_matrix, self.dist_coeffs, P=self.camera_matrix).reshape(-1, 2)
 
     def measure_object_dimensions(self, image_path, object_pixels, real_world_unit_per_pixel=None):
         """
@@ -17,7 +33,7 @@ class Measurement:
         4. Comparing with nominal dimensions to detect deviations.
 
         Args:
-            image_path (str): Path to the image containing the object.
+            image_path (str or np.ndarray): Path to the image containing the object, or the image itself.
             object_pixels (list): List of pixel coordinates (e.g., [[x1, y1], [x2, y2]]) defining the object.
             real_world_unit_per_pixel (float, optional): If provided, a simplified measurement can be done.
                                                          Otherwise, full camera calibration is needed.
@@ -25,15 +41,16 @@ class Measurement:
             dict: A dictionary containing measured dimensions and deviations.
                   (Placeholder returns dummy values).
         """
-        print(f"Measuring object dimensions in image: {image_path}")
+        if isinstance(image_path, str):
+            logger.debug("Measuring object dimensions in image: %s", image_path)
 
         # Dummy measurement based on pixel distance if real_world_unit_per_pixel is provided
         if real_world_unit_per_pixel and len(object_pixels) == 2:
-            p1 = np.array(object_pixels[0])
-            p2 = np.array(object_pixels[1])
+            # Only the two points are undistorted, not the whole image
+            p1, p2 = self.undistort_points(object_pixels)
             pixel_distance = np.linalg.norm(p1 - p2)
             measured_length = pixel_distance * real_world_unit_per_pixel
-            print(f"Simulated measured length: {measured_length:.2f} units.")
+            logger.debug("Simulated measured length: %.2f units.", measured_length)
             return {"measured_length": measured_length, "deviation": None}
 
         # More complex measurement using camera matrix would go here
@@ -41,10 +58,11 @@ class Measurement:
         measured_dimensions = {"length": 10.0, "width": 5.0}
         deviations = {"length_dev": 0.1, "width_dev": -0.05}
 
-        print("Object measurement complete (placeholder).")
+        logger.debug("Object measurement complete (placeholder).")
         return {"measured_dimensions": measured_dimensions, "deviations": deviations}
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     # Dummy camera parameters (from camera_calibration.py)
     dummy_camera_matrix = [[1000.0, 0.0, 640.0],
                            [0.0, 1000.0, 480.0],
@@ -0,0 +1,297 @@
+import os
+import json
+import importlib.util
+import shutil
+from datetime import datetime
+from ultralytics import YOLO
+from .model_evaluation import ModelEvaluator, IMAGE_EXTENSIONS
+
+# YOLOv8 model scales from smallest to largest
+YOLOV8_SCALES = "nsmlx"
+
+
+def model_size_mb(path):
+    """Size of a checkpoint file or an exported model directory in MB."""
+    if os.path.isdir(path):
+        total = sum(os.path.getsize(os.path.join(root, name))
+                    for root, _, files in os.walk(path) for name in files)
+    else:
+        total = os.path.getsize(path)
+    return total / (1024 * 1024)
+
+
+def num_parameters(model_path):
+    return sum(p.numel() for p in YOLO(model_path).model.parameters())
+
+
+def smaller_student(teacher_path):
+    """
+    Pretrained YOLOv8 weights one scale below the teacher (e.g. 'yolov8n.pt' for a yolov8s
+    teacher), or None if the teacher already has the smallest scale.
+    """
+    config = YOLO(teacher_path).model.yaml
+    scale = config.get("scale")
+    if not scale:
+        from ultralytics.nn.tasks import guess_model_scale
+        scale = guess_model_scale(config.get("yaml_file", ""))
+    if scale not in YOLOV8_SCALES or scale == YOLOV8_SCALES[0]:
+        return None
+    return f"yolov8{YOLOV8_SCALES[YOLOV8_SCALES.index(scale) - 1]}.pt"
+
+
+class ModelCompressor:
+    def __init__(self, output_dir="models/compressed", logs_dir="logs", img_size=640):
+        """
+        Produces cheaper serving variants of a trained detection model and compares them
+        side by side on accuracy, CPU latency and size.
+        Variants:
+            distilled: a smaller student trained on the teacher's predictions (pseudo labels),
+                       including images that have no manual labels.
+            pruned:    structured L1 pruning of convolution filters (needs torch-pruning),
+                       fine-tuned afterwards.
+            int8:      post-training int8 quantization (OpenVINO), calibrated on dataset images.
+        """
+        self.output_dir = output_dir
+        self.logs_dir = logs_dir
+        self.img_size = img_size
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.logs_dir, exist_ok=True)
+        print(f"ModelCompressor initialized, variants are written to {output_dir}")
+
+    def distill(self, teacher_path, dataset_config_path, student_model=None, epochs=50, batch_size=16,
+                pseudo_label_conf=0.25, extra_images_dir=None, patience=10):
+        """
+        Distills the teacher into a smaller student. The teacher labels the training images (and
+        optionally unlabeled production images); the student is trained on these pseudo labels and
+        validated on the original, manually labeled validation set.
+        Args:
+            teacher_path (str): Trained model to distill.
+            dataset_config_path (str): Dataset configuration of the teacher's training.
+            student_model (str, optional): Student weights or architecture, e.g. 'yolov8n.pt'; must have
+                                           fewer parameters than the teacher. Defaults to the next smaller
+                                           YOLOv8 scale (see smaller_student).
+            pseudo_label_conf (float): Minimum teacher confidence for a pseudo label.
+            extra_images_dir (str, optional): Unlabeled images added to the distillation set.
+        Returns:
+            str: Path of the student checkpoint.
+        Raises:
+            ValueError: If there is no student smaller than the teacher.
+        """
+        import yaml
+        student_model = student_model or smaller_student(teacher_path)
+        if student_model is None:
+            raise ValueError(f"{teacher_path} already has the smallest YOLOv8 scale; there is no smaller student")
+        if num_parameters(student_model) >= num_parameters(teacher_path):
+            raise ValueError(f"Student {student_model} is not smaller than the teacher {teacher_path}")
+        with open(dataset_config_path) as f:
+            dataset_config = yaml.safe_load(f)
+        dataset_dir = os.path.abspath(dataset_config["path"])
+        image_paths = self._list_images(os.path.join(dataset_dir, dataset_config["train"]))
+        if extra_images_dir:
+            image_paths += self._list_images(extra_images_dir)
+        if not image_paths:
+            raise ValueError("No images found for distillation")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        distill_dir = os.path.abspath(os.path.join(self.output_dir, f"distill_{timestamp}"))
+        images_dir = os.path.join(distill_dir, "images", "train")
+        labels_dir = os.path.join(distill_dir, "labels", "train")
+        os.makedirs(images_dir)
+        os.makedirs(labels_dir)
+
+        print(f"Pseudo-labeling {len(image_paths)} images with {teacher_path}")
+        teacher = YOLO(teacher_path)
+        for start in range(0, len(image_paths), batch_size):
+            batch = image_paths[start:start + batch_size]
+            results = teacher(batch, imgsz=self.img_size, conf=pseudo_label_conf, batch=batch_size,
+                              verbose=False)
+            for index, (image_path, r) in enumerate(zip(batch, results)):
+                # Index prefix keeps images with the same name from different directories apart
+                name = f"{start + index:06d}_{os.path.basename(image_path)}"
+                os.symlink(image_path, os.path.join(images_dir, name))
+                rows = [
+                    f"{int(cls)} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+                    for cls, (cx, cy, w, h) in zip(r.boxes.cls.cpu().numpy(), r.boxes.xywhn.cpu().numpy())
+                ]
+                with open(os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt"), "w") as f:
+                    f.write("\n".join(rows))
+
+        distill_config = {
+            "path": distill_dir,
+            "train": "images/train",
+            "val": os.path.join(dataset_dir, dataset_config["val"]),
+            "names": dataset_config["names"],
+        }
+        config_path = os.path.join(distill_dir, "dataset.yaml")
+        with open(config_path, "w") as f:
+            yaml.dump(distill_config, f)
+
+        print(f"Training student {student_model} on the teacher's pseudo labels")
+        student = YOLO(student_model)
+        student.train(data=config_path, epochs=epochs, batch=batch_size, imgsz=self.img_size, patience=patience,
+                      project=os.path.join(self.logs_dir, "runs"), name=f"distill_{timestamp}")
+        trainer = student.trainer
+        student_path = os.path.join(self.output_dir, f"distilled_{timestamp}.pt")
+        shutil.copy(trainer.best if os.path.exists(trainer.best) else trainer.last, student_path)
+        print(f"Distilled model saved to: {student_path}")
+        return student_path
+
+    def prune(self, model_path, dataset_config_path, amount=0.3, finetune_epochs=10, batch_size=16, patience=5):
+        """
+        Structured pruning: removes the weakest output filters (L1 norm) of every convolution
+        except the detection head with torch-pruning, so the network gets smaller and faster.
+        The pruned network is fine-tuned on the dataset to recover the lost accuracy and saved
+        in half precision like regular checkpoints.
+        Args:
+            model_path (str): Checkpoint to prune.
+            dataset_config_path (str): Dataset configuration for the fine-tuning.
+            amount (float): Fraction of filters removed per layer.
+            finetune_epochs (int): Fine-tuning epochs after pruning (0 skips the fine-tuning).
+        Returns:
+            str: Path of the pruned checkpoint.
+        Raises:
+            ImportError: If torch-pruning is not installed.
+        """
+        import torch
+        import torch_pruning
+        from ultralytics.models.yolo.detect import DetectionTrainer
+
+        yolo = YOLO(model_path)
+        model = yolo.model.float()
+        for parameter in model.parameters():
+            parameter.requires_grad_(True)
+        head = model.model[-1]
+        example = torch.zeros(1, 3, self.img_size, self.img_size)
+        params_before = sum(p.numel() for p in model.parameters())
+        pruner = torch_pruning.pruner.MetaPruner(
+            model, example, importance=torch_pruning.importance.MagnitudeImportance(p=1),
+            pruning_ratio=amount, ignored_layers=[head]
+        )
+        pruner.step()
+        params_after = sum(p.numel() for p in model.parameters())
+        print(f"Pruned {amount:.0%} of the filters: {params_before / 1e6:.2f}M -> {params_after / 1e6:.2f}M parameters")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pruned_path = os.path.join(self.output_dir, f"pruned_{int(amount * 100)}_{timestamp}.pt")
+        if finetune_epochs > 0:
+            class PrunedModelTrainer(DetectionTrainer):
+                # The default trainer rebuilds the unpruned architecture from the model's yaml
+                def get_model(self, cfg=None, weights=None, verbose=True):
+                    return model
+
+            yolo.train(data=dataset_config_path, trainer=PrunedModelTrainer, epochs=finetune_epochs,
+                       batch=batch_size, imgsz=self.img_size, patience=patience,
+                       project=os.path.join(self.logs_dir, "runs"), name=f"pruned_{timestamp}")
+            trainer = yolo.trainer
+            shutil.copy(trainer.best if os.path.exists(trainer.best) else trainer.last, pruned_path)
+        else:
+            torch.save({"model": model.half(), "train_args": {}, "date": datetime.now().isoformat()}, pruned_path)
+        print(f"Pruned model saved to: {pruned_path}")
+        return pruned_path
+
+    def quantize_int8(self, model_path, dataset_config_path, calibration_fraction=0.25):
+        """
+        Post-training int8 quantization for CPU inference. The activation ranges are calibrated
+        on a sample of the dataset's images.
+        Args:
+            calibration_fraction (float): Fraction of the dataset used for calibration.
+        Returns:
+            str: Path of the exported int8 model (a directory loadable with YOLO()).
+        """
+        print(f"Quantizing {model_path} to int8, calibrated on {calibration_fraction:.0%} of the dataset")
+        exported = YOLO(model_path).export(format="openvino", int8=True, data=dataset_config_path,
+                                           fraction=calibration_fraction, imgsz=self.img_size)
+        print(f"Int8 model saved to: {exported}")
+        return str(exported)
+
+    def compress(self, model_path, dataset_config_path, test_data_dir, variants=("distilled", "pruned", "int8"),
+                 student_model=None, prune_amount=0.3, distill_epochs=50, prune_epochs=10, latency_samples=50):
+        """
+        Builds the requested variants and evaluates them next to the original model.
+        The distilled student is also quantized, since both savings add up. Variants that
+        cannot be faster than the original are skipped: distillation when the model already
+        has the smallest scale, pruning when torch-pruning is not installed.
+        Returns:
+            dict: Report with one entry per variant (path, mAP, CPU latency, size, speedup), fastest first.
+        """
+        candidates = [("original", model_path)]
+        distilled_path = None
+        if "distilled" in variants:
+            student_model = student_model or smaller_student(model_path)
+            if student_model is None:
+                print(f"Skipping distillation: {model_path} already has the smallest YOLOv8 scale")
+            else:
+                distilled_path = self.distill(model_path, dataset_config_path, student_model, epochs=distill_epochs)
+                candidates.append(("distilled", distilled_path))
+        if "pruned" in variants:
+            if importlib.util.find_spec("torch_pruning") is None:
+                print("Skipping pruning: torch-pruning is not installed, and zeroed filters would not be faster")
+            else:
+                candidates.append(("pruned", self.prune(model_path, dataset_config_path, prune_amount,
+                                                        finetune_epochs=prune_epochs)))
+        if "int8" in variants:
+            candidates.append(("int8", self.quantize_int8(model_path, dataset_config_path)))
+            if distilled_path is not None:
+                candidates.append(("distilled_int8", self.quantize_int8(distilled_path, dataset_config_path)))
+
+        entries = []
+        for name, path in candidates:
+            evaluator = ModelEvaluator(
+                path, img_size=self.img_size, cache_dir=os.path.join(self.logs_dir, "prediction_cache"), device="cpu"
+            )
+            evaluation = evaluator.evaluate(test_data_dir, latency_samples=latency_samples)
+            entries.append({
+                "name": name,
+                "path": path,
+                "mAP_0.5": evaluation["metrics"]["mAP_0.5"],
+                "mAP_0.5:0.95": evaluation["metrics"]["mAP_0.5:0.95"],
+                "cpu_latency_ms": evaluation["speed"]["latency_ms_per_image"],
+                "size_mb": round(model_size_mb(path), 2),
+                "evaluation": evaluation,
+            })
+
+        baseline = entries[0]["cpu_latency_ms"]
+        for entry in entries:
+            latency = entry["cpu_latency_ms"]
+            entry["speedup"] = round(baseline / latency, 2) if baseline and latency else None
+        entries.sort(key=lambda entry: entry["cpu_latency_ms"] if entry["cpu_latency_ms"] is not None else float("inf"))
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        report = {"model_path": model_path, "test_data_dir": test_data_dir, "date": datetime.now().isoformat(),
+                  "variants": entries}
+        report_path = os.path.join(self.logs_dir, f"compression_report_{timestamp}.json")
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        report["report_path"] = report_path
+
+        print(self.format_report(report))
+        print(f"Compression report saved to: {report_path}")
+        return report
+
+    @staticmethod
+    def format_report(report):
+        """Side-by-side table of all variants."""
+        lines = [f"{'variant':<16}{'mAP@0.5':>9}{'mAP@.5:.95':>12}{'CPU ms':>9}{'speedup':>9}{'size MB':>9}"]
+        for entry in report["variants"]:
+            latency = entry["cpu_latency_ms"]
+            lines.append(
+                f"{entry['name']:<16}{entry['mAP_0.5']:>9.3f}{entry['mAP_0.5:0.95']:>12.3f}"
+                f"{latency if latency is not None else float('nan'):>9.1f}"
+                f"{entry['speedup'] if entry['speedup'] is not None else float('nan'):>8.2f}x"
+                f"{entry['size_mb']:>9.2f}"
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _list_images(directory):
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.abspath(os.path.join(directory, name)) for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+
+if __name__ == "__main__":
+    compressor = ModelCompressor()
+    report = compressor.compress("yolov8n.pt", "data/training/dataset/dataset.yaml", "data/simulated_defects")
@@ -0,0 +1,427 @@
+import os
+import time
+import hashlib
+import numpy as np
+from ultralytics import YOLO
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+COCO_IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def box_iou(boxes1, boxes2):
+    """
+    Computes the pairwise IoU between two sets of boxes in (x1, y1, x2, y2) format.
+    Args:
+        boxes1 (np.ndarray): Array of shape (N, 4).
+        boxes2 (np.ndarray): Array of shape (M, 4).
+    Returns:
+        np.ndarray: IoU matrix of shape (N, M).
+    """
+    area1 = (boxes1[:, 2] - boxes1[:, 0]).clip(0) * (boxes1[:, 3] - boxes1[:, 1]).clip(0)
+    area2 = (boxes2[:, 2] - boxes2[:, 0]).clip(0) * (boxes2[:, 3] - boxes2[:, 1]).clip(0)
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    inter = (bottom_right - top_left).clip(0).prod(axis=2)
+    return inter / (area1[:, None] + area2[None, :] - inter + 1e-9)
+
+
+def _unique_matches(iou, threshold):
+    """
+    Greedy one-to-one matching of (prediction, ground truth) pairs above an IoU threshold,
+    highest IoU first, without iterating over individual boxes.
+    """
+    matches = np.argwhere(iou >= threshold)
+    if len(matches) == 0:
+        return matches
+    matches = matches[np.argsort(-iou[matches[:, 0], matches[:, 1]], kind="stable")]
+    matches = matches[np.sort(np.unique(matches[:, 0], return_index=True)[1])]
+    matches = matches[np.sort(np.unique(matches[:, 1], return_index=True)[1])]
+    return matches
+
+
+def match_predictions(pred_classes, gt_classes, iou, iou_thresholds=COCO_IOU_THRESHOLDS):
+    """
+    Marks each prediction as true positive or not at every IoU threshold.
+    Args:
+        pred_classes (np.ndarray): Predicted class ids, shape (N,).
+        gt_classes (np.ndarray): Ground truth class ids, shape (M,).
+        iou (np.ndarray): IoU matrix between predictions and ground truth, shape (N, M).
+        iou_thresholds (np.ndarray): IoU thresholds, shape (T,).
+    Returns:
+        np.ndarray: Boolean array of shape (N, T).
+    """
+    correct = np.zeros((len(pred_classes), len(iou_thresholds)), dtype=bool)
+    if len(pred_classes) == 0 or len(gt_classes) == 0:
+        return correct
+    iou = iou * (pred_classes[:, None] == gt_classes[None, :])
+    for i, threshold in enumerate(iou_thresholds):
+        matches = _unique_matches(iou, threshold)
+        if len(matches):
+            correct[matches[:, 0], i] = True
+    return correct
+
+
+def update_confusion_matrix(matrix, pred_classes, gt_classes, iou, iou_threshold=0.5):
+    """
+    Adds one image to a confusion matrix of shape (nc + 1, nc + 1).
+    Rows are predicted classes, columns are true classes and the last
+    row/column stands for background (missed defects / false alarms).
+    """
+    background = matrix.shape[0] - 1
+    matches = _unique_matches(iou, iou_threshold)
+    pred_matched = np.zeros(len(pred_classes), dtype=bool)
+    gt_matched = np.zeros(len(gt_classes), dtype=bool)
+    if len(matches):
+        pred_matched[matches[:, 0]] = True
+        gt_matched[matches[:, 1]] = True
+        np.add.at(matrix, (pred_classes[matches[:, 0]], gt_classes[matches[:, 1]]), 1)
+    np.add.at(matrix, (np.full((~gt_matched).sum(), background), gt_classes[~gt_matched]), 1)
+    np.add.at(matrix, (pred_classes[~pred_matched], np.full((~pred_matched).sum(), background)), 1)
+    return matrix
+
+
+def compute_ap(recall, precision):
+    """
+    Computes average precision with COCO-style 101-point interpolation.
+    """
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    recall_points = np.linspace(0, 1, 101)
+    return float(mpre[np.searchsorted(mrec, recall_points, side="left")].mean())
+
+
+def ap_per_class(correct, confidences, pred_classes, gt_classes, num_classes, curve_points=101):
+    """
+    Computes per-class AP at every IoU threshold and PR curves at the first threshold.
+    Args:
+        correct (np.ndarray): Boolean true-positive matrix of shape (N, T).
+        confidences (np.ndarray): Prediction confidences, shape (N,).
+        pred_classes (np.ndarray): Predicted class ids, shape (N,).
+        gt_classes (np.ndarray): Ground truth class ids of the whole set, shape (M,).
+        num_classes (int): Number of classes.
+        curve_points (int): Number of recall points sampled for the PR curves.
+    Returns:
+        tuple: (ap of shape (C, T), recall axis of shape (P,), precision curves of shape (C, P)).
+    """
+    order = np.argsort(-confidences, kind="stable")
+    correct, pred_classes = correct[order], pred_classes[order]
+    num_labels = np.bincount(gt_classes, minlength=num_classes)
+    recall_axis = np.linspace(0, 1, curve_points)
+    ap = np.zeros((num_classes, correct.shape[1]))
+    pr_curves = np.zeros((num_classes, curve_points))
+
+    for c in range(num_classes):
+        mask = pred_classes == c
+        if num_labels[c] == 0 or not mask.any():
+            continue
+        tp_cum = correct[mask].cumsum(axis=0)
+        fp_cum = (~correct[mask]).cumsum(axis=0)
+        recall = tp_cum / num_labels[c]
+        precision = tp_cum / (tp_cum + fp_cum)
+        for j in range(correct.shape[1]):
+            ap[c, j] = compute_ap(recall[:, j], precision[:, j])
+        envelope = np.flip(np.maximum.accumulate(np.flip(precision[:, 0])))
+        index = np.searchsorted(recall[:, 0], recall_axis, side="left")
+        pr_curves[c] = np.where(index < len(envelope), envelope[index.clip(max=len(envelope) - 1)], 0.0)
+    return ap, recall_axis, pr_curves
+
+
+class ModelEvaluator:
+    def __init__(self, model_path, class_names=None, batch_size=32, img_size=640,
+                 cache_dir="cache/predictions", device=None):
+        """
+        Evaluates a YOLOv8 model on a labeled test set.
+        Predictions are cached on disk per model and test set so that threshold
+        sweeps and repeated reports do not re-run inference.
+        The model may also be an exported one (e.g. an OpenVINO directory); device
+        (e.g. 'cpu') pins inference for comparable latency measurements.
+        """
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.img_size = img_size
+        self.cache_dir = cache_dir
+        self.device = device
+        self._model_args = {"device": device} if device else {}
+        self._model = None
+        self._class_names = class_names
+        os.makedirs(self.cache_dir, exist_ok=True)
+        print(f"ModelEvaluator initialized with model: {model_path}")
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = YOLO(self.model_path)
+        return self._model
+
+    @property
+    def class_names(self):
+        if self._class_names is None:
+            self._class_names = [self.model.names[i] for i in sorted(self.model.names)]
+        return list(self._class_names)
+
+    def load_test_set(self, test_data_dir):
+        """
+        Collects image paths and their YOLO-format label files.
+        Supports labels next to the images as well as the images/ + labels/ layout.
+        Returns:
+            tuple: (list of image paths, list of label paths or None for unlabeled images).
+        """
+        image_paths = []
+        for root, _, files in os.walk(test_data_dir):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    image_paths.append(os.path.join(root, name))
+        image_paths.sort()
+
+        label_paths = []
+        for image_path in image_paths:
+            stem = os.path.splitext(image_path)[0]
+            candidates = [stem + ".txt"]
+            parts = stem.split(os.sep)
+            if "images" in parts:
+                parts[len(parts) - 1 - parts[::-1].index("images")] = "labels"
+                candidates.append(os.sep.join(parts) + ".txt")
+            label_paths.append(next((p for p in candidates if os.path.exists(p)), None))
+        return image_paths, label_paths
+
+    def _cache_path(self, image_paths):
+        digest = hashlib.sha1()
+        stat = os.stat(self.model_path) if os.path.exists(self.model_path) else None
+        digest.update(f"{os.path.abspath(self.model_path)}|{stat.st_mtime_ns if stat else 0}|"
+                      f"{stat.st_size if stat else 0}|{self.img_size}|{self.device}|{self.batch_size}".encode())
+        for image_path in image_paths:
+            digest.update(image_path.encode())
+        return os.path.join(self.cache_dir, f"predictions_{digest.hexdigest()[:16]}.npz")
+
+    def predict(self, image_paths, use_cache=True):
+        """
+        Runs batched inference over all images, or loads cached predictions.
+        Predictions are kept at a very low confidence so that any operating
+        threshold can be applied afterwards.
+        Returns:
+            dict: Flat prediction arrays plus image shapes and per-batch timings.
+        """
+        cache_path = self._cache_path(image_paths)
+        if use_cache and os.path.exists(cache_path):
+            print(f"Loading cached predictions from {cache_path}")
+            with np.load(cache_path) as cached:
+                return {key: cached[key] for key in cached.files}
+
+        image_index, boxes, confidences, classes = [], [], [], []
+        shapes = np.zeros((len(image_paths), 2), dtype=np.int32)
+        batch_times, batch_sizes = [], []
+
+        # Warm-up so that lazy initialization does not distort the first batch timing
+        if image_paths:
+            self.model(image_paths[:1], imgsz=self.img_size, verbose=False, **self._model_args)
+
+        for start in range(0, len(image_paths), self.batch_size):
+            batch = image_paths[start:start + self.batch_size]
+            t0 = time.perf_counter()
+            results = self.model(batch, imgsz=self.img_size, conf=0.001, batch=self.batch_size, verbose=False,
+                                 **self._model_args)
+            batch_times.append(time.perf_counter() - t0)
+            batch_sizes.append(len(batch))
+
+            for offset, r in enumerate(results):
+                shapes[start + offset] = r.orig_shape[:2]
+                n = len(r.boxes)
+                if n == 0:
+                    continue
+                image_index.append(np.full(n, start + offset, dtype=np.int32))
+                boxes.append(r.boxes.xyxy.cpu().numpy())
+                confidences.append(r.boxes.conf.cpu().numpy())
+                classes.append(r.boxes.cls.cpu().numpy().astype(np.int32))
+
+        predictions = {
+            "image_index": np.concatenate(image_index) if image_index else np.zeros(0, dtype=np.int32),
+            "boxes": np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.float32),
+            "confidences": np.concatenate(confidences) if confidences else np.zeros(0, dtype=np.float32),
+            "classes": np.concatenate(classes) if classes else np.zeros(0, dtype=np.int32),
+            "shapes": shapes,
+            "batch_times": np.array(batch_times),
+            "batch_sizes": np.array(batch_sizes),
+        }
+        np.savez_compressed(cache_path, **predictions)
+        print(f"Predictions for {len(image_paths)} images cached at {cache_path}")
+        return predictions
+
+    def load_ground_truth(self, label_paths, shapes):
+        """
+        Reads YOLO-format labels (class cx cy w h, normalized) into flat arrays of
+        absolute (x1, y1, x2, y2) boxes.
+        """
+        image_index, rows = [], []
+        for i, label_path in enumerate(label_paths):
+            if label_path is None:
+                continue
+            labels = np.loadtxt(label_path, ndmin=2, dtype=np.float64)
+            if labels.size == 0:
+                continue
+            image_index.append(np.full(len(labels), i, dtype=np.int32))
+            rows.append(labels[:, :5])
+
+        if not rows:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros((0, 4))
+        image_index = np.concatenate(image_index)
+        labels = np.concatenate(rows)
+        heights = shapes[image_index, 0]
+        widths = shapes[image_index, 1]
+        cx, cy = labels[:, 1] * widths, labels[:, 2] * heights
+        w, h = labels[:, 3] * widths, labels[:, 4] * heights
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        return image_index, labels[:, 0].astype(np.int32), boxes
+
+    def measure_latency(self, image_paths, num_samples=50):
+        """
+        Measures single-image (batch size 1) latency as seen on the inspection line.
+        """
+        sample = image_paths[:num_samples]
+        if not sample:
+            return {}
+        self.model(sample[0], imgsz=self.img_size, verbose=False, **self._model_args)
+        timings = []
+        for image_path in sample:
+            t0 = time.perf_counter()
+            self.model(image_path, imgsz=self.img_size, verbose=False, **self._model_args)
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        timings = np.array(timings)
+        return {
+            "samples": len(timings),
+            "latency_ms_mean": float(timings.mean()),
+            "latency_ms_p50": float(np.percentile(timings, 50)),
+            "latency_ms_p95": float(np.percentile(timings, 95)),
+        }
+
+    def evaluate(self, test_data_dir, conf_threshold=0.25, iou_thresholds=COCO_IOU_THRESHOLDS,
+                 sweep_thresholds=None, latency_samples=50, use_cache=True):
+        """
+        Evaluates the model on a test set.
+        Args:
+            test_data_dir (str): Directory with test images and YOLO-format labels.
+            conf_threshold (float): Operating confidence threshold for precision, recall,
+                                    F1 and the confusion matrix.
+            iou_thresholds (np.ndarray): IoU thresholds for mAP (COCO 0.5:0.95 by default).
+            sweep_thresholds (list, optional): Additional confidence thresholds to report
+                                               precision/recall/F1 for, reusing the cached predictions.
+            latency_samples (int): Number of images for the batch-size-1 latency measurement.
+            use_cache (bool): Reuse cached predictions if available.
+        Returns:
+            dict: Metrics, per-class metrics, PR curves, confusion matrix and speed.
+        """
+        image_paths, label_paths = self.load_test_set(test_data_dir)
+        print(f"Evaluating {len(image_paths)} images from {test_data_dir}")
+        class_names = self.class_names
+        num_classes = len(class_names)
+        iou_thresholds = np.asarray(iou_thresholds)
+
+        predictions = self.predict(image_paths, use_cache=use_cache)
+        gt_index, gt_classes, gt_boxes = self.load_ground_truth(label_paths, predictions["shapes"])
+        gt_order = np.argsort(gt_index, kind="stable")
+        gt_index, gt_classes, gt_boxes = gt_index[gt_order], gt_classes[gt_order], gt_boxes[gt_order]
+
+        pred_index = predictions["image_index"]
+        pred_boxes = predictions["boxes"]
+        pred_conf = predictions["confidences"]
+        pred_classes = predictions["classes"]
+
+        num_images = len(image_paths)
+        pred_offsets = np.searchsorted(pred_index, np.arange(num_images + 1))
+        gt_offsets = np.searchsorted(gt_index, np.arange(num_images + 1))
+
+        correct = np.zeros((len(pred_classes), len(iou_thresholds)), dtype=bool)
+        confusion = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+        above_conf = pred_conf >= conf_threshold
+        for i in range(num_images):
+            ps, pe = pred_offsets[i], pred_offsets[i + 1]
+            gs, ge = gt_offsets[i], gt_offsets[i + 1]
+            if ps == pe and gs == ge:
+                continue
+            iou = box_iou(pred_boxes[ps:pe], gt_boxes[gs:ge])
+            correct[ps:pe] = match_predictions(pred_classes[ps:pe], gt_classes[gs:ge], iou, iou_thresholds)
+            keep = above_conf[ps:pe]
+            update_confusion_matrix(confusion, pred_classes[ps:pe][keep], gt_classes[gs:ge], iou[keep])
+
+        ap, recall_axis, pr_curves = ap_per_class(correct, pred_conf, pred_classes, gt_classes, num_classes)
+        num_labels = np.bincount(gt_classes, minlength=num_classes)
+        present = num_labels > 0
+
+        def operating_point(threshold):
+            keep = pred_conf >= threshold
+            tp = np.bincount(pred_classes[keep], weights=correct[keep, 0], minlength=num_classes)
+            n_pred = np.bincount(pred_classes[keep], minlength=num_classes)
+            precision = np.divide(tp, n_pred, out=np.zeros(num_classes), where=n_pred > 0)
+            recall = np.divide(tp, num_labels, out=np.zeros(num_classes), where=num_labels > 0)
+            f1 = np.divide(2 * precision * recall, precision + recall,
+                           out=np.zeros(num_classes), where=(precision + recall) > 0)
+            return precision, recall, f1
+
+        precision, recall, f1 = operating_point(conf_threshold)
+        mean = (lambda values: float(values[present].mean()) if present.any() else 0.0)
+
+        batch_times = predictions["batch_times"]
+        batch_sizes = predictions["batch_sizes"]
+        per_image_ms = np.repeat(batch_times / np.maximum(batch_sizes, 1), batch_sizes) * 1000.0
+        total_time = float(batch_times.sum())
+        speed = {
+            "batch_size": self.batch_size,
+            "img_size": self.img_size,
+            "batched_latency_ms_per_image": float(per_image_ms.mean()) if len(per_image_ms) else None,
+            "batched_latency_ms_p95": float(np.percentile(per_image_ms, 95)) if len(per_image_ms) else None,
+            "throughput_images_per_s": num_images / total_time if total_time > 0 else None,
+        }
+        single = self.measure_latency(image_paths, latency_samples) if latency_samples else {}
+        speed.update({f"single_image_{key}": value for key, value in single.items()})
+        speed["latency_ms_per_image"] = single.get("latency_ms_mean", speed["batched_latency_ms_per_image"])
+
+        results = {
+            "model_path": self.model_path,
+            "test_data_dir": test_data_dir,
+            "num_images": num_images,
+            "num_labels": int(num_labels.sum()),
+            "conf_threshold": conf_threshold,
+            "metrics": {
+                "mAP_0.5": mean(ap[:, 0]),
+                "mAP_0.5:0.95": mean(ap.mean(axis=1)),
+                "precision": mean(precision),
+                "recall": mean(recall),
+                "f1_score": mean(f1),
+            },
+            "class_metrics": {
+                name: {
+                    "precision": float(precision[c]),
+                    "recall": float(recall[c]),
+                    "f1": float(f1[c]),
+                    "ap_0.5": float(ap[c, 0]),
+                    "ap_0.5:0.95": float(ap[c].mean()),
+                    "labels": int(num_labels[c]),
+                }
+                for c, name in enumerate(class_names)
+            },
+            "pr_curves": {
+                "recall": recall_axis.round(4).tolist(),
+                "precision": {name: pr_curves[c].round(4).tolist() for c, name in enumerate(class_names)},
+            },
+            "confusion_matrix": {
+                "labels": class_names + ["background"],
+                "matrix": confusion.tolist(),
+            },
+            "speed": speed,
+        }
+
+        if sweep_thresholds:
+            sweep = []
+            for threshold in sweep_thresholds:
+                p, r, f = operating_point(threshold)
+                sweep.append({"conf_threshold": threshold, "precision": mean(p),
+                              "recall": mean(r), "f1_score": mean(f)})
+            results["threshold_sweep"] = sweep
+
+        return results
+
+if __name__ == "__main__":
+    evaluator = ModelEvaluator("yolov8n.pt", class_names=["scratch", "crack", "dent", "corrosion"])
+    report = evaluator.evaluate("data/simulated_defects", sweep_thresholds=[0.1, 0.25, 0.5])
+    print("Metrics:", report["metrics"])
+    print("Speed:", report["speed"])
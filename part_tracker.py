@@ -0,0 +1,226 @@
+import logging
+from collections import Counter as ClassVotes
+import cv2
+import numpy as np
+from .metrics import REGISTRY
+from .model_evaluation import box_iou
+
+logger = logging.getLogger(__name__)
+
+TRACKED_FRAMES = REGISTRY.counter(
+    "inspection_tracked_frames_total", "Frames handled by the part tracker, by kind", ("kind",)
+)
+PART_VERDICTS = REGISTRY.counter(
+    "inspection_part_verdicts_total", "Consolidated verdicts emitted per part", ("verdict",)
+)
+
+
+class _DefectTrack:
+    __slots__ = ("track_id", "box", "class_votes", "confidence", "last_confidence", "hits", "visible", "unconfirmed")
+
+    def __init__(self, track_id, defect, unconfirmed=False):
+        self.track_id = track_id
+        self.box = np.asarray(defect["box"], dtype=np.float64)
+        self.class_votes = ClassVotes({defect["class"]: 1})
+        self.confidence = defect["confidence"]
+        self.last_confidence = defect["confidence"]
+        self.hits = 1
+        self.visible = True
+        self.unconfirmed = unconfirmed  # Low-confidence first sighting, re-checked on the next frame
+
+    def update(self, defect):
+        self.box = np.asarray(defect["box"], dtype=np.float64)
+        self.class_votes[defect["class"]] += 1
+        self.confidence = max(self.confidence, defect["confidence"])
+        self.last_confidence = defect["confidence"]
+        self.hits += 1
+        self.visible = True
+
+    @property
+    def defect_class(self):
+        return self.class_votes.most_common(1)[0][0]
+
+
+class PartTracker:
+    def __init__(self, keyframe_interval=5, part_pitch_px=None, motion_size=160, min_motion_response=0.1,
+                 match_iou=0.3, uncertain_confidence=0.5, min_hits=1):
+        """
+        Follows parts and their defects across consecutive conveyor frames.
+        The belt motion between frames is estimated by phase correlation on a small gray
+        version of the frame; between keyframes the known defects are only shifted by that
+        motion instead of running the detector. A frame becomes a keyframe when a new part
+        starts, every keyframe_interval frames, when the motion estimate is unreliable, or
+        when a defect seen only once was detected with low confidence and needs confirmation.
+        When a part has left, one consolidated verdict with deduplicated defects is emitted.
+        Args:
+            keyframe_interval (int): Maximum number of frames between two detector runs.
+            part_pitch_px (float, optional): Belt travel in original frame pixels after which the next
+                                             part starts. Defaults to the longer frame side. Ignored while
+                                             the caller provides part ids.
+            motion_size (int): Longer side of the frames used for motion estimation.
+            min_motion_response (float): Phase correlation peak below which the motion is not trusted.
+            match_iou (float): Minimum IoU between a shifted track and a detection to be the same defect.
+            uncertain_confidence (float): Detections below this confidence are re-checked on the next frame.
+            min_hits (int): Keyframes a defect must be seen on to count in the verdict.
+        """
+        self.keyframe_interval = keyframe_interval
+        self.part_pitch_px = part_pitch_px
+        self.motion_size = motion_size
+        self.min_motion_response = min_motion_response
+        self.match_iou = match_iou
+        self.uncertain_confidence = uncertain_confidence
+        self.min_hits = min_hits
+
+        self.part_id = None
+        self._auto_part_id = 0
+        self._previous = None
+        self._window = None
+        self._reset_part()
+
+    def _reset_part(self):
+        self._tracks = []
+        self._next_track_id = 1
+        self._frames = 0
+        self._keyframes = 0
+        self._since_keyframe = 0
+        self._travel = 0.0
+
+    def _motion_frame(self, image):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        # Integer-factor INTER_AREA keeps the decimation cheap on multi-megapixel frames
+        factor = max(1, max(h, w) // self.motion_size)
+        h, w = h - h % factor, w - w % factor
+        small = cv2.resize(gray[:h, :w], (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+        return small.astype(np.float32), factor
+
+    def estimate_motion(self, image):
+        """
+        Estimates the shift of the current frame against the previous one.
+        Returns:
+            tuple: (dx, dy, response) in pixels of the given image; response is None for the first frame.
+        """
+        small, factor = self._motion_frame(image)
+        previous, self._previous = self._previous, small
+        if previous is None or previous.shape != small.shape:
+            return 0.0, 0.0, None
+        if self._window is None or self._window.shape != small.shape:
+            self._window = cv2.createHanningWindow((small.shape[1], small.shape[0]), cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(previous, small, self._window)
+        return dx * factor, dy * factor, response
+
+    def step(self, image, part_id=None, box_scale=1.0):
+        """
+        Advances the tracker by one frame.
+        Args:
+            image (np.ndarray): The frame.
+            part_id (optional): Part identifier from the line control, if available.
+            box_scale (float): Factor from image pixels to original frame pixels (see DefectDetector).
+        Returns:
+            tuple: (keyframe, verdicts). If keyframe is True the caller has to run the detector
+                   and pass its defects to update(). verdicts lists parts that were completed.
+        """
+        dx, dy, response = self.estimate_motion(image)
+        dx, dy = dx * box_scale, dy * box_scale
+        verdicts = []
+
+        if part_id is not None:
+            new_part = part_id != self.part_id
+        else:
+            pitch = self.part_pitch_px or max(image.shape[:2]) * box_scale
+            new_part = self.part_id is None or self._travel + np.hypot(dx, dy) >= pitch
+            if new_part:
+                self._auto_part_id += 1
+                part_id = self._auto_part_id
+        if new_part:
+            if self.part_id is not None and self._frames:
+                verdicts.append(self.finish())
+            self.part_id = part_id
+            self._reset_part()
+        else:
+            self._travel += np.hypot(dx, dy)
+            self._shift_tracks(dx, dy, image.shape, box_scale)
+
+        self._frames += 1
+        self._since_keyframe += 1
+        uncertain = any(t.visible and t.unconfirmed for t in self._tracks)
+        keyframe = (new_part or self._since_keyframe >= self.keyframe_interval or uncertain
+                    or (response is not None and response < self.min_motion_response))
+        if keyframe:
+            self._since_keyframe = 0
+            self._keyframes += 1
+        TRACKED_FRAMES.inc(kind="keyframe" if keyframe else "propagated")
+        return keyframe, verdicts
+
+    def _shift_tracks(self, dx, dy, shape, box_scale):
+        height, width = shape[0] * box_scale, shape[1] * box_scale
+        for track in self._tracks:
+            if not track.visible:
+                continue
+            track.box += (dx, dy, dx, dy)
+            x1, y1, x2, y2 = track.box
+            if x2 < 0 or y2 < 0 or x1 > width or y1 > height:
+                track.visible = False
+
+    def update(self, defects):
+        """
+        Associates the detections of a keyframe with the known defects of the part.
+        Low-confidence defects that are not detected again on this keyframe are dropped.
+        """
+        visible = [t for t in self._tracks if t.visible]
+        matched, updated = set(), set()
+        if visible and defects:
+            iou = box_iou(np.array([d["box"] for d in defects]), np.array([t.box for t in visible]))
+            # Greedy association, best overlap first
+            for di, ti in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[di, ti] < self.match_iou:
+                    break
+                if di in matched or ti in updated:
+                    continue
+                visible[ti].update(defects[di])
+                visible[ti].unconfirmed = False
+                matched.add(di)
+                updated.add(ti)
+        # This keyframe was the re-check of low-confidence sightings; those not seen again were false alarms
+        rejected = [t for ti, t in enumerate(visible) if t.unconfirmed and ti not in updated]
+        if rejected:
+            self._tracks = [t for t in self._tracks if t not in rejected]
+        for di, defect in enumerate(defects):
+            if di not in matched:
+                unconfirmed = defect["confidence"] < self.uncertain_confidence
+                self._tracks.append(_DefectTrack(self._next_track_id, defect, unconfirmed))
+                self._next_track_id += 1
+
+    def current_defects(self):
+        """Defects of the current part at their (motion-compensated) position in this frame."""
+        return [
+            {"box": track.box.tolist(), "confidence": track.last_confidence, "class": track.defect_class,
+             "track_id": track.track_id, "hits": track.hits}
+            for track in self._tracks if track.visible
+        ]
+
+    def finish(self):
+        """
+        Closes the current part and returns its consolidated verdict. Low-confidence defects
+        that were not confirmed on a later keyframe do not count.
+        Returns:
+            dict: part_id, frames, keyframes, verdict ('ok' or 'defective') and the deduplicated defects.
+        """
+        defects = [
+            {"track_id": track.track_id, "class": track.defect_class, "confidence": track.confidence,
+             "hits": track.hits}
+            for track in self._tracks if track.hits >= self.min_hits and not track.unconfirmed
+        ]
+        verdict = {
+            "part_id": self.part_id,
+            "frames": self._frames,
+            "keyframes": self._keyframes,
+            "verdict": "defective" if defects else "ok",
+            "defects": defects,
+        }
+        PART_VERDICTS.inc(verdict=verdict["verdict"])
+        logger.debug("Part %s finished: %s with %d defect(s) after %d keyframes of %d frames.",
+                     self.part_id, verdict["verdict"], len(defects), self._keyframes, self._frames)
+        self.part_id = None
+        self._reset_part()
+        return verdict
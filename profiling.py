@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import time
+import base64
+import queue
+import shutil
+import itertools
+import threading
+import logging
+from collections import Counter
+from datetime import datetime
+from .metrics import REGISTRY, start_stage_trace, stop_stage_trace
+from .image_io import decode_image, decode_raw_pixels
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SESSIONS = REGISTRY.counter(
+    "inspection_profile_sessions_total", "Sampling profiler sessions that were run"
+)
+SLOW_REQUESTS = REGISTRY.counter(
+    "inspection_slow_requests_total", "Requests over the capture latency threshold, by result (captured/dropped)",
+    ("result",)
+)
+
+# Leaf frames of threads that are blocked waiting for work; skipped unless idle threads are requested
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("thread.py", "_worker"),  # concurrent.futures pool thread waiting for a work item
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socketserver.py", "serve_forever"),
+    ("base_events.py", "_run_once"),
+}
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profiling session is requested while another one is running."""
+
+
+class SamplingProfiler:
+    def __init__(self, interval_s=0.01, max_duration_s=120.0):
+        """
+        Statistical profiler for a running service. A session samples the Python stacks of all
+        threads at a fixed interval and aggregates them as collapsed stacks
+        ('thread;outer (file:line);...;inner (file:line) count'), the input format of
+        flamegraph.pl, speedscope and similar tools. Nothing is instrumented, so the service
+        runs at full speed outside of a session; during a session the cost is one stack walk
+        per thread and interval. Time spent in native code (OpenCV, PyTorch) is attributed
+        to the Python function that called it.
+        Args:
+            interval_s (float): Default sampling interval.
+            max_duration_s (float): Longest session that may be requested.
+        """
+        self.interval_s = interval_s
+        self.max_duration_s = max_duration_s
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def profile(self, duration_s, interval_s=None, include_idle=False):
+        """
+        Samples all threads for duration_s seconds; blocks the calling thread meanwhile.
+        Args:
+            interval_s (float, optional): Sampling interval, defaults to the profiler's interval.
+            include_idle (bool): Also count threads that are blocked waiting for work.
+        Returns:
+            dict: duration_s, interval_s, samples and stacks (collapsed stacks, most frequent first).
+        Raises:
+            ValueError: For a duration or interval out of range.
+            ProfilerBusy: If another session is running.
+        """
+        interval_s = interval_s or self.interval_s
+        if not 0 < duration_s <= self.max_duration_s:
+            raise ValueError(f"Profiling duration must be between 0 and {self.max_duration_s} seconds")
+        if not 0.001 <= interval_s <= 1.0:
+            raise ValueError("Sampling interval must be between 1 ms and 1 s")
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profiling session is already running")
+        try:
+            stacks, samples, elapsed = self._sample(duration_s, interval_s, include_idle)
+        finally:
+            self._lock.release()
+        PROFILE_SESSIONS.inc()
+        logger.info("Profiling session finished: %d samples of %d distinct stacks in %.1f s.",
+                    samples, len(stacks), elapsed)
+        return {
+            "duration_s": round(elapsed, 3),
+            "interval_s": interval_s,
+            "samples": samples,
+            "stacks": "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()),
+        }
+
+    def _sample(self, duration_s, interval_s, include_idle):
+        own_thread = threading.get_ident()
+        labels = {}  # code object -> frame label, built once per session
+        stacks = Counter()
+        samples = 0
+        start = time.perf_counter()
+        next_sample = start
+        while next_sample < start + duration_s:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_thread:
+                    continue
+                if not include_idle:
+                    code = frame.f_code
+                    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                        continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = (
+                            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                        ).replace(";", ":")
+                    names.append(label)
+                    frame = frame.f_back
+                names.append(thread_names.get(ident, f"thread-{ident}").replace(";", ":"))
+                stacks[";".join(reversed(names))] += 1
+            samples += 1
+            next_sample += interval_s
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return stacks, samples, time.perf_counter() - start
+
+
+class SlowRequestRecorder:
+    def __init__(self, directory="logs/slow_requests", threshold_ms=250.0, max_entries=50, max_frames=4,
+                 max_pending=4):
+        """
+        Keeps the inputs of slow requests on disk so that latency outliers can be reproduced
+        offline (see replay_capture). For each request over the threshold the input frames,
+        the request options, the active settings and the per-stage timings are written to a
+        directory of their own; only the newest max_entries directories are kept.
+        The frames are copied on the request thread, files are written by a background
+        thread. Captures arriving while max_pending are still being written are dropped.
+        Args:
+            directory (str): Directory of the capture ring.
+            threshold_ms (float): Request latency from which a request is captured.
+            max_entries (int): Captures kept on disk; older ones are deleted.
+            max_frames (int): Frames kept per capture, e.g. of a large batch request.
+            max_pending (int): Captures that may wait for the writer.
+        """
+        self.directory = directory
+        self.threshold_s = threshold_ms / 1000.0
+        self.max_entries = max_entries
+        self.max_frames = max_frames
+        self._sequence = itertools.count(1)
+        self._pending = queue.Queue(maxsize=max_pending)
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="slow-request-writer", daemon=True)
+        self._writer.start()
+        logger.info("SlowRequestRecorder initialized, requests over %.0f ms are captured to %s.",
+                    threshold_ms, directory)
+
+    def is_slow(self, latency_s):
+        return latency_s >= self.threshold_s
+
+    def capture(self, endpoint, latency_s, frames, status=None, options=None, inspection=None, settings=None,
+                timings=None):
+        """
+        Captures a slow request.
+        Args:
+            endpoint (str): Route of the request.
+            latency_s (float): Request latency.
+            frames (list): Input frames as dicts with 'kind' ('encoded', 'base64' or 'raw') and 'data';
+                           raw frames also have 'shape', 'dtype' and 'channel_order', encoded frames may
+                           have 'target_size' (reduced decode).
+            options (dict, optional): Request options as sent by the client.
+            inspection (dict, optional): Parsed inspection arguments (measurement_points, scale_factor,
+                                         camera_id, lane, batch) used by replay_capture.
+            settings (dict, optional): Detection settings active during the request.
+            timings (dict, optional): Stage name -> seconds of the request.
+        Returns:
+            bool: Whether the capture was queued for writing.
+        """
+        # Request buffers are reused once the response is sent, so the frames are copied now
+        copied = []
+        for frame in frames[:self.max_frames]:
+            if frame["kind"] == "base64":
+                frame = dict(frame, kind="encoded", data=base64.b64decode(frame["data"]))
+            copied.append(dict(frame, data=bytes(frame["data"])))
+        record = {
+            "id": f"{datetime.now():%Y%m%d_%H%M%S_%f}_{next(self._sequence):04d}",
+            "endpoint": endpoint,
+            "status": status,
+            "latency_ms": round(latency_s * 1000.0, 2),
+            "stages_ms": {stage: round(seconds * 1000.0, 2) for stage, seconds in (timings or {}).items()},
+            "options": options or {},
+            "inspection": inspection or {},
+            "settings": settings,
+            "frame_count": len(frames),
+            "captured_at": datetime.now().isoformat(),
+        }
+        try:
+            self._pending.put_nowait((record, copied))
+        except queue.Full:
+            SLOW_REQUESTS.inc(result="dropped")
+            logger.warning("Slow request on %s (%.0f ms) not captured, the writer is busy.",
+                           endpoint, record["latency_ms"])
+            return False
+        SLOW_REQUESTS.inc(result="captured")
+        return True
+
+    def entries(self):
+        """Metadata of the captures on disk, newest first."""
+        captures = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.directory, name, "request.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    captures.append(json.load(f))
+        return captures
+
+    def _write_loop(self):
+        while True:
+            record, frames = self._pending.get()
+            try:
+                self._write(record, frames)
+                self._trim()
+            except Exception:
+                logger.exception("Could not write slow request capture %s", record["id"])
+
+    def _write(self, record, frames):
+        entry_dir = os.path.join(self.directory, record["id"])
+        tmp_dir = entry_dir + ".tmp"
+        os.makedirs(tmp_dir)
+        record["frames"] = []
+        for index, frame in enumerate(frames):
+            data = frame.pop("data")
+            name = f"frame_{index}{_frame_extension(frame['kind'], data)}"
+            with open(os.path.join(tmp_dir, name), "wb") as f:
+                f.write(data)
+            record["frames"].append(dict(frame, file=name))
+        with open(os.path.join(tmp_dir, "request.json"), "w") as f:
+            json.dump(record, f, indent=2, default=str)
+        # Complete captures only; a directory without the suffix always has its request.json
+        os.replace(tmp_dir, entry_dir)
+
+    def _trim(self):
+        names = sorted(name for name in os.listdir(self.directory) if not name.endswith(".tmp"))
+        for name in names[:max(0, len(names) - self.max_entries)]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+def _frame_extension(kind, data):
+    if kind == "raw":
+        return ".raw"
+    if data[:2] == b"\xff\xd8":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    return ".bin"
+
+
+def load_capture(entry_dir):
+    """
+    Loads a slow request capture.
+    Returns:
+        tuple: (record, frames) with the request metadata and the decoded (image, decode_scale) per frame.
+    """
+    with open(os.path.join(entry_dir, "request.json")) as f:
+        record = json.load(f)
+    frames = []
+    for frame in record["frames"]:
+        with open(os.path.join(entry_dir, frame["file"]), "rb") as f:
+            data = f.read()
+        if frame["kind"] == "raw":
+            image = decode_raw_pixels(data, frame["shape"], dtype=frame.get("dtype", "uint8"),
+                                      channel_order=frame.get("channel_order", "bgr"))
+            frames.append((image, 1))
+        else:
+            frames.append(decode_image(data, frame.get("target_size")))
+    return record, frames
+
+
+def replay_capture(entry_dir, inspection_service, repeats=3, apply_settings=True):
+    """
+    Runs a captured request again through an InspectionService and times its stages, e.g. to
+    check whether an outlier is caused by the input itself or by load on the line.
+    Args:
+        apply_settings (bool): Apply the captured detection settings first. Only use this with a
+                               service of its own, the settings are stored in its settings store.
+    Returns:
+        dict: The recorded latency and stages next to those of every replay, all in milliseconds.
+    """
+    record, frames = load_capture(entry_dir)
+    if apply_settings and record.get("settings"):
+        settings = {k: v for k, v in record["settings"].items() if k not in ("version", "updated_at")}
+        inspection_service.settings_store.update(settings)
+    inspection = record.get("inspection", {})
+    replays = []
+    for _ in range(repeats):
+        timings = start_stage_trace()
+        start = time.perf_counter()
+        try:
+            if inspection.get("batch"):
+                inspection_service.inspect_batch(
+                    [image for image, _ in frames], decode_scales=[scale for _, scale in frames],
+                    lane=inspection.get("lane", "bulk")
+                )
+            else:
+                image, decode_scale = frames[0]
+                inspection_service.perform_inspection(
+                    image, inspection.get("measurement_points"), inspection.get("scale_factor"),
+                    decode_scale=decode_scale, lane=inspection.get("lane", "realtime"),
+                    camera_id=inspection.get("camera_id")
+                )
+        finally:
+            stop_stage_trace()
+        replays.append({
+            "latency_ms": round((time.perf_counter() - start) * 1000.0, 2),
+            "stages_ms": {stage: round(seconds * 1000.0, 2) for stage, seconds in timings.items()},
+        })
+    return {
+        "id": record["id"],
+        "endpoint": record["endpoint"],
+        "recorded": {"latency_ms": record["latency_ms"], "stages_ms": record["stages_ms"]},
+        "replays": replays,
+    }
+
+
+if __name__ == "__main__":
+    # python -m services.profiling logs/slow_requests/20240101_120000_000000_0001 --model yolov8n.pt
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a captured slow request")
+    parser.add_argument("capture", help="Capture directory of a SlowRequestRecorder")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--scheduler", action="store_true", help="Detect through the priority scheduler")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from .inspection_service import InspectionService
+    service = InspectionService(model_path=args.model, use_scheduler=args.scheduler)
+    print(json.dumps(replay_capture(args.capture, service, repeats=args.repeats), indent=2))
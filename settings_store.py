@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import fcntl
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "detection_threshold": 0.25,  # Minimum confidence passed to NMS
+    "iou_threshold": 0.45,  # NMS IoU threshold
+    "max_detections": 300,
+    "allowed_classes": None,  # None keeps all classes, otherwise a list of class names
+    "class_thresholds": {},  # Per-class minimum confidence, e.g. {"scratch": 0.6}
+    "measurement_tolerance": 0.2,
+    "preprocessing_enabled": True,
+}
+
+
+class SettingsConflict(ValueError):
+    """Raised when an update was based on an outdated settings version."""
+
+
+def validate_settings(changes):
+    """
+    Validates a (partial) settings update.
+    Returns:
+        dict: The normalized changes.
+    Raises:
+        ValueError: On unknown keys or invalid values.
+    """
+    unknown = set(changes) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    for key, value in changes.items():
+        if key in ("detection_threshold", "iou_threshold", "measurement_tolerance"):
+            value = float(value)
+            if key != "measurement_tolerance" and not 0.0 <= value <= 1.0:
+                raise ValueError(f"{key} must be between 0 and 1")
+        elif key == "max_detections":
+            value = int(value)
+            if value < 1:
+                raise ValueError("max_detections must be at least 1")
+        elif key == "allowed_classes":
+            if value is not None:
+                if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+                    raise ValueError("allowed_classes must be a list of class names or null")
+        elif key == "class_thresholds":
+            if not isinstance(value, dict):
+                raise ValueError("class_thresholds must map class names to confidences")
+            value = {str(name): float(conf) for name, conf in value.items()}
+            if any(not 0.0 <= conf <= 1.0 for conf in value.values()):
+                raise ValueError("class_thresholds must be between 0 and 1")
+        elif key == "preprocessing_enabled":
+            if not isinstance(value, bool):
+                raise ValueError("preprocessing_enabled must be true or false")
+        normalized[key] = value
+    return normalized
+
+
+class SettingsStore:
+    def __init__(self, path=None, check_interval_s=1.0):
+        """
+        Versioned inspection settings, persisted as JSON and hot-reloaded when the file changes.
+        Every saved version is also appended to '<path>.history.jsonl'.
+        Args:
+            path (str, optional): Settings file. Without a path the settings only live in memory.
+            check_interval_s (float): Minimum time between two checks of the file for external changes.
+        """
+        self.path = path
+        self.check_interval_s = check_interval_s
+        self._settings = dict(DEFAULT_SETTINGS, version=0, updated_at=None)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        if path and os.path.exists(path):
+            self._load()
+        logger.info("SettingsStore initialized (version %d).", self._settings["version"])
+
+    @property
+    def version(self):
+        return self._settings["version"]
+
+    def get(self):
+        """
+        Returns a copy of the current settings including 'version' and 'updated_at',
+        reloaded first if another process changed the file.
+        """
+        self.reload_if_changed(force=True)
+        return json.loads(json.dumps(self._settings))
+
+    def subscribe(self, callback):
+        """Registers callback(settings), called now and after every change."""
+        self._listeners.append(callback)
+        callback(self.get())
+
+    def update(self, changes, expected_version=None):
+        """
+        Applies a partial update, persists it as a new version and notifies subscribers.
+        Args:
+            changes (dict): Settings to change.
+            expected_version (int, optional): Version the update is based on; a mismatch
+                                              raises SettingsConflict.
+        Returns:
+            dict: The new settings.
+        """
+        changes = validate_settings(changes)
+        # The file lock serializes updates of all processes; each one starts from the stored version
+        with self._lock, self._file_lock():
+            previous = self._settings["version"]
+            if self.path and os.path.exists(self.path):
+                self._load()
+            current = self._settings["version"]
+            conflict = expected_version is not None and int(expected_version) != current
+            if not conflict:
+                settings = dict(self._settings, **changes)
+                settings["version"] = current + 1
+                settings["updated_at"] = datetime.now().isoformat()
+                if self.path:
+                    self._save(settings)
+                self._settings = settings
+        if conflict:
+            if current != previous:
+                self._notify()
+            raise SettingsConflict(f"Settings changed in the meantime (version {current}, expected {expected_version})")
+        logger.info("Settings updated to version %d: %s", settings["version"], changes)
+        self._notify()
+        return self.get()
+
+    def reload_if_changed(self, force=False):
+        """
+        Reloads the settings file if another process changed it. Cheap enough to call per frame.
+        Args:
+            force (bool): Checks the file even if the last check is less than check_interval_s ago.
+        Returns:
+            bool: True if new settings were loaded.
+        """
+        if not self.path:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval_s:
+            return False
+        self._last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            previous = self._settings["version"]
+            self._load()
+            changed = self._settings["version"] != previous
+        if changed:
+            logger.info("Settings reloaded from %s (version %d).", self.path, self._settings["version"])
+            self._notify()
+        return changed
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            settings = dict(DEFAULT_SETTINGS)
+            settings.update(validate_settings({k: v for k, v in stored.items() if k in DEFAULT_SETTINGS}))
+        except (OSError, ValueError) as e:
+            logger.error("Could not load settings from %s: %s", self.path, e)
+            return
+        settings["version"] = int(stored.get("version", 0))
+        settings["updated_at"] = stored.get("updated_at")
+        self._settings = settings
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self):
+        if not self.path:
+            yield
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self, settings):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so that readers never see a partial file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(settings, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path + ".history.jsonl", "a") as f:
+            f.write(json.dumps(settings) + "\n")
+
+    def _notify(self):
+        settings = self.get()
+        for callback in self._listeners:
+            try:
+                callback(settings)
+            except Exception:
+                logger.exception("Settings listener failed")
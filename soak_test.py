@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+"""
+Soak and load test for the Metal Inspection App
+Simulates camera stations that send frames at a configurable rate and burst pattern,
+and a manufacturing execution system (MES) that consumes the inspection results.
+Runs for hours against the HTTP API, the shared-memory frame ring (streaming) or the
+in-process service and reports per time window latency, errors, dropped frames and
+memory, so that latency creep and leaks show up before a release
+
+Examples:
+    python soak_test.py --target http --url http://localhost:5000 --server-pid 1234 --stations 4 --fps 5 --duration 8h
+    python soak_test.py --target stream --stations 2 --fps 15 --pattern burst --duration 30m
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import queue
+import platform
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import cv2
+
+# Add the parent directory to the path to import our services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import RESOLUTIONS, create_synthetic_frame, summarize_latencies
+
+PATTERNS = ("steady", "poisson", "burst")
+
+
+def parse_duration(value):
+    """Parse a duration such as '90s', '30m', '8h' or plain seconds"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def current_rss_mb(pid=None):
+    """Current resident set size in MB of this process or of another local process"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def arrival_intervals(pattern, fps, rng, burst_size=5, burst_factor=4.0):
+    """
+    Yield the time between consecutive frames of a station
+    steady:  fixed frame rate
+    poisson: random arrivals with the given mean rate
+    burst:   parts arrive in groups of burst_size frames at burst_factor times the rate,
+             followed by a gap that keeps the mean rate at fps
+    """
+    mean = 1.0 / fps
+    if pattern == "steady":
+        while True:
+            yield mean
+    elif pattern == "poisson":
+        while True:
+            yield rng.exponential(mean)
+    else:
+        fast = mean / burst_factor
+        gap = burst_size * mean - (burst_size - 1) * fast
+        while True:
+            for _ in range(burst_size - 1):
+                yield fast
+            yield gap
+
+
+def load_image_set(args):
+    """Images replayed by the stations, from a directory or synthetic"""
+    if args.images:
+        names = sorted(name for name in os.listdir(args.images) if name.lower().endswith((".jpg", ".jpeg", ".png")))
+        images = [cv2.imread(os.path.join(args.images, name)) for name in names]
+        images = [image for image in images if image is not None]
+        if not images:
+            raise ValueError(f"No images found in {args.images}")
+        return images
+    width, height = RESOLUTIONS[args.resolution]
+    return [create_synthetic_frame(width, height, seed=args.seed + index) for index in range(args.frames)]
+
+
+class SoakStats:
+    """Counters and latencies of the current report window, shared by all threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window = self._new_window()
+
+    @staticmethod
+    def _new_window():
+        return {"frames": 0, "ok": 0, "errors": Counter(), "dropped": Counter(), "latencies": [],
+                "mes_latencies": [], "mes_reordered": 0, "verdicts": Counter()}
+
+    def frame(self):
+        with self._lock:
+            self._window["frames"] += 1
+
+    def result(self, latency_ms):
+        with self._lock:
+            self._window["ok"] += 1
+            self._window["latencies"].append(latency_ms)
+
+    def error(self, reason):
+        with self._lock:
+            self._window["errors"][reason] += 1
+
+    def dropped(self, reason, count=1):
+        with self._lock:
+            self._window["dropped"][reason] += count
+
+    def mes(self, latency_ms, reordered, verdicts=()):
+        with self._lock:
+            self._window["mes_latencies"].append(latency_ms)
+            self._window["mes_reordered"] += int(reordered)
+            for verdict in verdicts:
+                self._window["verdicts"][verdict] += 1
+
+    def swap(self):
+        """Returns the finished window and starts a new one"""
+        with self._lock:
+            window, self._window = self._window, self._new_window()
+        return window
+
+
+class MesConsumer:
+    """
+    Stands in for the manufacturing execution system: receives the result of every frame,
+    spends processing_ms on it, checks that the results of each station arrive in order and,
+    against the HTTP API, fetches the overlay of defective parts like an operator screen would
+    """
+
+    def __init__(self, stats, processing_ms=2.0, max_backlog=1000, base_url=None, fetch_overlays=False):
+        self.stats = stats
+        self.processing_s = processing_ms / 1000.0
+        self.base_url = base_url
+        self.fetch_overlays = fetch_overlays and base_url is not None
+        self._queue = queue.Queue(maxsize=max_backlog)
+        self._last_seq = {}
+        self._thread = threading.Thread(target=self._run, name="mes-consumer", daemon=True)
+        self._thread.start()
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def deliver(self, station_id, seq, captured_at, result):
+        try:
+            self._queue.put_nowait((station_id, seq, captured_at, result))
+        except queue.Full:
+            self.stats.dropped("mes_backlog")
+
+    def _run(self):
+        session = None
+        if self.fetch_overlays:
+            import requests
+            session = requests.Session()
+        while True:
+            station_id, seq, captured_at, result = self._queue.get()
+            time.sleep(self.processing_s)
+            reordered = seq is not None and seq < self._last_seq.get(station_id, 0)
+            if seq is not None:
+                self._last_seq[station_id] = max(seq, self._last_seq.get(station_id, 0))
+            if session is not None and result.get("defects") and result.get("result_id"):
+                try:
+                    response = session.get(f"{self.base_url}/api/results/{result['result_id']}/overlay", timeout=10)
+                    if response.status_code != 200:
+                        self.stats.error(f"overlay_{response.status_code}")
+                except Exception:
+                    self.stats.error("overlay_connection")
+            verdicts = [verdict["verdict"] for verdict in result.get("part_verdicts", [])]
+            self.stats.mes((time.time() - captured_at) * 1000.0, reordered, verdicts)
+
+
+class CameraStation:
+    """
+    One camera of the line: emits frames on its own schedule. A camera cannot wait for a
+    slow inspection, so a frame that is due while max_in_flight frames are still being
+    inspected is dropped
+    """
+
+    def __init__(self, station_id, images, intervals, stats, mes, stop_event, max_in_flight=2):
+        self.station_id = station_id
+        self.images = images
+        self.intervals = intervals
+        self.stats = stats
+        self.mes = mes
+        self.stop_event = stop_event
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=station_id)
+
+    def run(self, start_offset_s=0.0):
+        next_due = time.monotonic() + start_offset_s
+        seq = 0
+        for interval in self.intervals:
+            delay = next_due - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            if self.stop_event.is_set():
+                break
+            if delay < -1.0:
+                # The load generator itself fell behind; continue from now instead of catching up
+                next_due = time.monotonic()
+            seq += 1
+            self.stats.frame()
+            self.emit(seq, self.images[seq % len(self.images)], time.time())
+            next_due += interval
+        self._pool.shutdown(wait=True)
+
+    def emit(self, seq, image, captured_at):
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self.stats.dropped("station_busy")
+                return
+            self._in_flight += 1
+        self._pool.submit(self._send, seq, image, captured_at)
+
+    def _send(self, seq, image, captured_at):
+        try:
+            result, error = self.inspect(seq, image)
+        except Exception as e:
+            result, error = None, f"exception_{type(e).__name__}"
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        if error:
+            self.stats.error(error)
+            return
+        self.stats.result((time.time() - captured_at) * 1000.0)
+        self.mes.deliver(self.station_id, seq, captured_at, result)
+
+    def inspect(self, seq, image):
+        """Returns (result, error reason)"""
+        raise NotImplementedError
+
+
+class HttpStation(CameraStation):
+    """Sends frames to the HTTP API over pooled keep-alive connections"""
+
+    def __init__(self, *args, base_url, payload="jpeg", timeout=30.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url
+        self.payload = payload
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight))
+        # Encode once, the stations replay the same bytes
+        if payload == "jpeg":
+            self.bodies = [cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+                           for image in self.images]
+        else:
+            self.bodies = [np.ascontiguousarray(image).tobytes() for image in self.images]
+
+    def inspect(self, seq, image):
+        import requests
+
+        index = seq % len(self.images)
+        headers = {"X-Request-Id": f"{self.station_id}-{seq}"}
+        try:
+            if self.payload == "jpeg":
+                response = self.session.post(
+                    f"{self.base_url}/api/inspect",
+                    files={"image": ("frame.jpg", self.bodies[index], "image/jpeg")},
+                    data={"camera_id": self.station_id},
+                    headers=headers, timeout=self.timeout,
+                )
+            else:
+                shape = ",".join(str(v) for v in self.images[index].shape)
+                response = self.session.post(
+                    f"{self.base_url}/api/inspect/raw",
+                    params={"shape": shape, "camera_id": self.station_id},
+                    data=self.bodies[index],
+                    headers=dict(headers, **{"Content-Type": "application/octet-stream"}), timeout=self.timeout,
+                )
+        except requests.exceptions.Timeout:
+            return None, "timeout"
+        except requests.exceptions.RequestException:
+            return None, "connection"
+        if response.status_code != 200:
+            return None, f"http_{response.status_code}"
+        return response.json()["results"], None
+
+
+class InProcessStation(CameraStation):
+    """Calls InspectionService.perform_inspection directly"""
+
+    def __init__(self, *args, service, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.service = service
+
+    def inspect(self, seq, image):
+        return self.service.perform_inspection(image, lane="realtime", camera_id=self.station_id), None
+
+
+class StreamStation(CameraStation):
+    """
+    Publishes raw frames into a shared-memory frame ring that the service reads in place
+    (InspectionService.serve_frame_ring). The ring never blocks the camera; frames the
+    service cannot keep up with are counted by the ring consumer
+    """
+
+    def __init__(self, *args, service, ring_slots=8, workers=1, tracking=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        from services.frame_ring import FrameRingProducer, FrameRingConsumer
+
+        max_shape = tuple(int(v) for v in np.max([image.shape for image in self.images], axis=0))
+        self.ring_name = f"soak_{os.getpid()}_{self.station_id}"
+        self.producer = FrameRingProducer(self.ring_name, slots=ring_slots, max_shape=max_shape)
+        self.consumer = FrameRingConsumer(self.ring_name)
+        self._reported_drops = 0
+        # Tracking needs the frames of a camera in order, i.e. a single serving thread
+        self._serving = [
+            threading.Thread(
+                target=service.serve_frame_ring, args=(self.consumer, self._on_result, self.stop_event),
+                kwargs={"tracking": tracking}, name=f"{self.station_id}-ring-{index}", daemon=True
+            )
+            for index in range(1 if tracking else workers)
+        ]
+        for thread in self._serving:
+            thread.start()
+
+    def emit(self, seq, image, captured_at):
+        self.producer.publish(image, self.station_id, timestamp=captured_at, metadata={"seq": seq})
+
+    def _on_result(self, frame, result):
+        self.stats.result((time.time() - frame.timestamp) * 1000.0)
+        self.mes.deliver(self.station_id, frame.metadata.get("seq"), frame.timestamp, result)
+
+    def collect_drops(self):
+        dropped = self.consumer.dropped
+        if dropped > self._reported_drops:
+            self.stats.dropped("ring", dropped - self._reported_drops)
+            self._reported_drops = dropped
+
+    def close(self):
+        for thread in self._serving:
+            thread.join()
+        self.consumer.close()
+        self.producer.close()
+
+
+def summarize_window(window, index, elapsed_s, duration_s, rss_mb, mes_backlog, pool_stats=None):
+    """Condense one report window into the numbers that are compared across the run"""
+    dropped = sum(window["dropped"].values())
+    errors = sum(window["errors"].values())
+    frames = window["frames"]
+    summary = {
+        "window": index,
+        "elapsed_s": round(elapsed_s, 1),
+        "duration_s": round(duration_s, 1),
+        "frames": frames,
+        "ok": window["ok"],
+        "errors": dict(window["errors"]),
+        "error_rate": errors / frames if frames else 0.0,
+        "dropped": dict(window["dropped"]),
+        "drop_rate": dropped / frames if frames else 0.0,
+        "latency_ms": summarize_latencies(window["latencies"], duration_s),
+        "mes_latency_ms": summarize_latencies(window["mes_latencies"], duration_s),
+        "mes_reordered": window["mes_reordered"],
+        "mes_backlog": mes_backlog,
+        "part_verdicts": dict(window["verdicts"]),
+        "rss_mb": rss_mb,
+    }
+    if pool_stats is not None:
+        summary["buffer_pool_mb"] = (pool_stats["in_use_bytes"] + pool_stats["free_bytes"]) / (1024 * 1024)
+    return summary
+
+
+def analyze_run(windows, warmup_windows=1):
+    """
+    Trends over the run after the warm-up windows: latency drift and memory growth per hour
+    (least-squares slope) and the change between the first and the last window
+    """
+    steady = [w for w in windows[warmup_windows:] if w["latency_ms"].get("count")] or \
+        [w for w in windows if w["latency_ms"].get("count")]
+    frames = sum(w["frames"] for w in windows)
+    analysis = {
+        "windows": len(windows),
+        "frames": frames,
+        "ok": sum(w["ok"] for w in windows),
+        "error_rate": sum(sum(w["errors"].values()) for w in windows) / frames if frames else 0.0,
+        "drop_rate": sum(sum(w["dropped"].values()) for w in windows) / frames if frames else 0.0,
+    }
+    if not steady:
+        return analysis
+
+    hours = np.array([w["elapsed_s"] for w in steady]) / 3600.0
+    for metric in ("p50", "p95", "p99"):
+        values = np.array([w["latency_ms"][metric] for w in steady])
+        first, last = values[0], values[-1]
+        analysis[f"{metric}_first_ms"] = float(first)
+        analysis[f"{metric}_last_ms"] = float(last)
+        analysis[f"{metric}_drift_pct"] = float((last - first) / first * 100.0) if first else None
+        analysis[f"{metric}_slope_ms_per_h"] = float(np.polyfit(hours, values, 1)[0]) if len(steady) > 1 else None
+    analysis["max_ms"] = max(w["latency_ms"]["max"] for w in steady)
+
+    rss = [(h, w["rss_mb"]) for h, w in zip(hours, steady) if w["rss_mb"] is not None]
+    if rss:
+        analysis["rss_first_mb"] = rss[0][1]
+        analysis["rss_last_mb"] = rss[-1][1]
+        analysis["rss_max_mb"] = max(value for _, value in rss)
+        if len(rss) > 1:
+            analysis["rss_growth_mb_per_h"] = float(np.polyfit([h for h, _ in rss], [v for _, v in rss], 1)[0])
+    return analysis
+
+
+def check_limits(analysis, args):
+    """Returns the violated limits; a soak run with failures exits non-zero"""
+    failures = []
+    if args.max_error_rate is not None and analysis["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {analysis['error_rate']:.4f} > {args.max_error_rate}")
+    if args.max_drop_rate is not None and analysis["drop_rate"] > args.max_drop_rate:
+        failures.append(f"drop rate {analysis['drop_rate']:.4f} > {args.max_drop_rate}")
+    drift = analysis.get("p95_drift_pct")
+    if args.max_p95_drift_pct is not None and drift is not None and drift > args.max_p95_drift_pct:
+        failures.append(f"p95 drift {drift:+.1f}% > {args.max_p95_drift_pct}%")
+    growth = analysis.get("rss_growth_mb_per_h")
+    if args.max_memory_growth_mb_per_h is not None and growth is not None and growth > args.max_memory_growth_mb_per_h:
+        failures.append(f"memory growth {growth:.1f} MB/h > {args.max_memory_growth_mb_per_h} MB/h")
+    return failures
+
+
+def print_window(summary):
+    latency = summary["latency_ms"]
+    mes = summary["mes_latency_ms"]
+    line = (f"[{datetime.now():%H:%M:%S}] #{summary['window']:<4} frames {summary['frames']:>6} ok {summary['ok']:>6} "
+            f"err {sum(summary['errors'].values()):>4} drop {sum(summary['dropped'].values()):>4}")
+    if latency.get("count"):
+        line += f"  p50 {latency['p50']:7.1f}  p95 {latency['p95']:7.1f}  p99 {latency['p99']:7.1f} ms"
+    if mes.get("count"):
+        line += f"  mes p95 {mes['p95']:7.1f} ms"
+    line += f"  backlog {summary['mes_backlog']}"
+    if summary["rss_mb"] is not None:
+        line += f"  rss {summary['rss_mb']:.1f} MB"
+    print(line, flush=True)
+
+
+def print_summary(analysis, failures):
+    print("\n" + "=" * 80)
+    print("METAL INSPECTION APP - SOAK TEST RESULTS")
+    print("=" * 80)
+    print(f"frames {analysis['frames']}, ok {analysis['ok']}, "
+          f"error rate {analysis['error_rate']:.4f}, drop rate {analysis['drop_rate']:.4f}")
+    for metric in ("p50", "p95", "p99"):
+        if f"{metric}_first_ms" in analysis:
+            slope = analysis[f"{metric}_slope_ms_per_h"]
+            drift = analysis[f"{metric}_drift_pct"]
+            print(f"{metric}: {analysis[f'{metric}_first_ms']:.1f} -> {analysis[f'{metric}_last_ms']:.1f} ms"
+                  + (f" ({drift:+.1f}%)" if drift is not None else "")
+                  + (f", trend {slope:+.2f} ms/h" if slope is not None else ""))
+    if "rss_first_mb" in analysis:
+        growth = analysis.get("rss_growth_mb_per_h")
+        print(f"rss: {analysis['rss_first_mb']:.1f} -> {analysis['rss_last_mb']:.1f} MB "
+              f"(max {analysis['rss_max_mb']:.1f})" + (f", trend {growth:+.2f} MB/h" if growth is not None else ""))
+    for failure in failures:
+        print(f"FAILED: {failure}")
+
+
+def run_soak(args):
+    """Run the soak test and return the report"""
+    images = load_image_set(args)
+    stats = SoakStats()
+    stop_event = threading.Event()
+    base_url = args.url.rstrip("/") if args.target == "http" else None
+    mes = MesConsumer(stats, args.mes_processing_ms, base_url=base_url, fetch_overlays=args.mes_fetch_overlays)
+
+    service = None
+    if args.target in ("inprocess", "stream"):
+        from services.inspection_service import InspectionService
+        service = InspectionService(model_path=args.model, use_scheduler=args.scheduler)
+
+    stations = []
+    rng = np.random.default_rng(args.seed)
+    for index in range(args.stations):
+        station_args = (f"station-{index}", images, arrival_intervals(args.pattern, args.fps, rng, args.burst_size,
+                        args.burst_factor), stats, mes, stop_event)
+        if args.target == "http":
+            station = HttpStation(*station_args, max_in_flight=args.max_in_flight, base_url=base_url,
+                                  payload=args.payload, timeout=args.timeout)
+        elif args.target == "inprocess":
+            station = InProcessStation(*station_args, max_in_flight=args.max_in_flight, service=service)
+        else:
+            station = StreamStation(*station_args, service=service, ring_slots=args.ring_slots,
+                                    workers=args.max_in_flight, tracking=args.tracking)
+        stations.append(station)
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+        },
+        "config": vars(args),
+        "windows": [],
+    }
+    # Stations start spread over one frame interval instead of all at once
+    threads = [threading.Thread(target=station.run, args=(rng.uniform(0, 1.0 / args.fps),), name=station.station_id,
+                                daemon=True) for station in stations]
+    for thread in threads:
+        thread.start()
+
+    start = time.monotonic()
+    window_start = start
+    try:
+        while window_start - start < args.duration:
+            window_end = min(window_start + args.report_interval, start + args.duration)
+            time.sleep(max(0.0, window_end - time.monotonic()))
+            for station in stations:
+                if isinstance(station, StreamStation):
+                    station.collect_drops()
+            now = time.monotonic()
+            summary = summarize_window(
+                stats.swap(), len(report["windows"]), now - start, now - window_start,
+                current_rss_mb(args.server_pid if args.target == "http" else None), mes.backlog,
+                service.buffer_pool.stats() if service is not None else None
+            )
+            report["windows"].append(summary)
+            print_window(summary)
+            window_start = now
+            # Keep the report on disk during the run, a long run that is aborted still leaves its data
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    except KeyboardInterrupt:
+        print("Interrupted, finishing the report")
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=args.timeout)
+        for station in stations:
+            if isinstance(station, StreamStation):
+                station.close()
+
+    report["summary"] = analyze_run(report["windows"], args.warmup_windows)
+    report["failures"] = check_limits(report["summary"], args)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test the metal inspection app with simulated camera stations")
+    parser.add_argument("--target", choices=["http", "stream", "inprocess"], default="http")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--payload", choices=["jpeg", "raw"], default="jpeg", help="HTTP upload format")
+    parser.add_argument("--server-pid", type=int, help="PID of a local API server to track its memory")
+    parser.add_argument("--stations", type=int, default=4, help="Simulated camera stations")
+    parser.add_argument("--fps", type=float, default=5.0, help="Mean frame rate per station")
+    parser.add_argument("--pattern", choices=PATTERNS, default="steady")
+    parser.add_argument("--burst-size", type=int, default=5, help="Frames per burst (burst pattern)")
+    parser.add_argument("--burst-factor", type=float, default=4.0, help="Frame rate within a burst relative to --fps")
+    parser.add_argument("--max-in-flight", type=int, default=2,
+                        help="Frames a station may have in inspection before it drops frames (serving threads per "
+                             "ring for --target stream)")
+    parser.add_argument("--duration", type=parse_duration, default=parse_duration("1h"), help="e.g. 90s, 30m, 8h")
+    parser.add_argument("--report-interval", type=parse_duration, default=parse_duration("60s"))
+    parser.add_argument("--warmup-windows", type=int, default=1, help="Windows left out of the drift analysis")
+    parser.add_argument("--images", help="Directory of images to replay instead of synthetic frames")
+    parser.add_argument("--resolution", choices=sorted(RESOLUTIONS), default="5mp")
+    parser.add_argument("--frames", type=int, default=8, help="Distinct synthetic frames")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--model", default="yolov8n.pt", help="Model for --target stream and inprocess")
+    parser.add_argument("--scheduler", action="store_true", help="Use the priority scheduler in-process")
+    parser.add_argument("--ring-slots", type=int, default=8)
+    parser.add_argument("--tracking", action="store_true", help="Track parts across frames (--target stream)")
+    parser.add_argument("--mes-processing-ms", type=float, default=2.0, help="Time the MES spends per result")
+    parser.add_argument("--mes-fetch-overlays", action="store_true", help="MES fetches overlays of defective parts")
+    parser.add_argument("--max-error-rate", type=float)
+    parser.add_argument("--max-drop-rate", type=float)
+    parser.add_argument("--max-p95-drift-pct", type=float)
+    parser.add_argument("--max-memory-growth-mb-per-h", type=float)
+    parser.add_argument("--output", default="soak_results.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_soak(args)
+    print_summary(report["summary"], report["failures"])
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    sys.exit(1 if report["failures"] else 0)
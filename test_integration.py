@@ -9,6 +9,7 @@ import json
 import time
 import os
 import base64
+import io
 from PIL import Image
 import numpy as np
 
@@ -131,6 +132,59 @@ def test_image_inspection_base64():
         if os.path.exists(test_image_path):
             os.remove(test_image_path)
 
+def test_overlay_rendering():
+    """Test on-demand overlay rendering for a stored inspection result"""
+    test_image_path = None
+    try:
+        test_image_path = create_test_image()
+        
+        with open(test_image_path, 'rb') as f:
+            response = requests.post(
+                "http://localhost:5000/api/inspect",
+                files={'image': f},
+                timeout=30
+            )
+        if response.status_code != 200:
+            print(f"✗ Overlay Rendering: FAILED (Inspection status: {response.status_code})")
+            return False
+        
+        result_id = response.json()['results']['result_id']
+        response = requests.get(f"http://localhost:5000/api/results/{result_id}/overlay", timeout=10)
+        if response.status_code == 200 and response.headers.get('Content-Type', '').startswith('image/jpeg'):
+            print("✓ Overlay Rendering: PASSED")
+            print(f"  Overlay size: {len(response.content)} bytes")
+            return True
+        else:
+            print(f"✗ Overlay Rendering: FAILED (Status: {response.status_code})")
+            return False
+            
+    except requests.exceptions.RequestException as e:
+        print(f"✗ Overlay Rendering: FAILED (Error: {e})")
+        return False
+    finally:
+        if test_image_path and os.path.exists(test_image_path):
+            os.remove(test_image_path)
+
+def test_small_frame_inspection():
+    """Test that frames smaller than the preprocessing pyramid are inspected instead of failing"""
+    try:
+        for height, width in [(1, 1), (3, 3), (7, 5)]:
+            buffer = io.BytesIO()
+            Image.fromarray(np.full((height, width, 3), 255, dtype=np.uint8)).save(buffer, format="PNG")
+            response = requests.post(
+                "http://localhost:5000/api/inspect",
+                files={'image': ('small.png', buffer.getvalue(), 'image/png')},
+                timeout=30
+            )
+            if response.status_code != 200:
+                print(f"✗ Small Frame Inspection: FAILED ({width}x{height}, Status: {response.status_code})")
+                return False
+        print("✓ Small Frame Inspection: PASSED")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"✗ Small Frame Inspection: FAILED (Error: {e})")
+        return False
+
 def test_settings_api():
     """Test settings API endpoints"""
     try:
@@ -157,19 +211,46 @@ def test_settings_api():
             timeout=5
         )
         
-        if response.status_code == 200:
+        if response.status_code == 200 and response.json()["settings"]["detection_threshold"] == 0.9:
             result = response.json()
             print("✓ Settings POST: PASSED")
-            print(f"  Update result: {result.get('message')}")
-            return True
+            print(f"  Update result: {result.get('message')} (version {result['settings'].get('version')})")
         else:
             print(f"✗ Settings POST: FAILED (Status: {response.status_code})")
             return False
+
+        # Invalid values are rejected instead of being stored
+        response = requests.post(
+            "http://localhost:5000/api/settings",
+            json={"detection_threshold": 1.5},
+            timeout=5
+        )
+        if response.status_code == 400:
+            print("✓ Settings validation: PASSED")
+            return True
+        else:
+            print(f"✗ Settings validation: FAILED (Status: {response.status_code})")
+            return False
             
     except requests.exceptions.RequestException as e:
         print(f"✗ Settings API: FAILED (Error: {e})")
         return False
 
+def test_metrics_endpoint():
+    """Test the Prometheus-style metrics endpoint"""
+    try:
+        response = requests.get("http://localhost:5000/metrics", timeout=5)
+        if response.status_code == 200 and "inspection_stage_duration_seconds" in response.text:
+            print("✓ Metrics Endpoint: PASSED")
+            print(f"  Exposed {response.text.count('# TYPE')} metric families")
+            return True
+        else:
+            print(f"✗ Metrics Endpoint: FAILED (Status: {response.status_code})")
+            return False
+    except requests.exceptions.RequestException as e:
+        print(f"✗ Metrics Endpoint: FAILED (Error: {e})")
+        return False
+
 def test_frontend_accessibility():
     """Test if the frontend is accessible"""
     try:
@@ -196,7 +277,10 @@ def run_integration_tests():
         ("Frontend Accessibility", test_frontend_accessibility),
         ("Image Inspection (Multipart)", test_image_inspection_multipart),
         ("Image Inspection (Base64)", test_image_inspection_base64),
+        ("Overlay Rendering", test_overlay_rendering),
+        ("Small Frame Inspection", test_small_frame_inspection),
         ("Settings API", test_settings_api),
+        ("Metrics Endpoint", test_metrics_endpoint),
     ]
     
     passed = 0
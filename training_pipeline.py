@@ -1,8 +1,15 @@
 import os
 import json
+import time
+import random
 import shutil
 from datetime import datetime
 from ultralytics import YOLO
+from .model_evaluation import ModelEvaluator, IMAGE_EXTENSIONS
+from .model_compression import ModelCompressor
+
+# Number of leading YOLOv8 layers that form the backbone
+YOLOV8_BACKBONE_LAYERS = 10
 
 class TrainingPipeline:
     def __init__(self, base_model_path="yolov8n.pt", training_data_dir="data/training"):
@@ -60,47 +67,207 @@ class TrainingPipeline:
         print(f"Dataset configuration created at {config_path}")
         return config_path
 
-    def train_model(self, dataset_config_path, epochs=100, batch_size=16, img_size=640):
+    def current_deployed_model(self, deployment_dir="deployed_models"):
         """
-        Placeholder for model training.
-        In a real scenario, this would:
-        1. Load the base model
-        2. Configure training parameters
-        3. Start training with the new dataset
-        4. Save the trained model with versioning
+        Returns the trainable checkpoint behind the deployed model, or the base model if none is
+        deployed. For a compressed deployment (e.g. an int8 export) this is the trained model the
+        variant was built from, since only regular checkpoints can be fine-tuned further.
+        """
+        deployment_info_path = os.path.join(deployment_dir, "deployment_info.json")
+        if os.path.exists(deployment_info_path):
+            with open(deployment_info_path) as f:
+                deployment_info = json.load(f)
+            source_path = deployment_info.get("source_checkpoint") or deployment_info.get("deployed_path")
+            if source_path and os.path.isfile(source_path):
+                return source_path
+        return self.base_model_path
+
+    def add_training_data(self, dataset_config_path, new_images_dir, new_annotations_dir, val_fraction=0.1, seed=0):
+        """
+        Adds newly labeled images to the dataset, split into train and val, so they are part of
+        the replay pool of later updates. Of two or more new images at least one goes to val, so
+        every update is also evaluated on data it was not trained on.
+        Returns:
+            dict: 'train' and 'val', the added image paths.
+        """
+        import yaml
+        with open(dataset_config_path) as f:
+            dataset_dir = yaml.safe_load(f)["path"]
+        image_names = sorted(name for name in os.listdir(new_images_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+        random.Random(seed).shuffle(image_names)
+        num_val = int(round(len(image_names) * val_fraction))
+        if val_fraction > 0 and len(image_names) > 1:
+            num_val = max(num_val, 1)
+
+        added = {"train": [], "val": []}
+        for index, name in enumerate(image_names):
+            split = "val" if index < num_val else "train"
+            image_path = os.path.join(dataset_dir, "images", split, name)
+            shutil.copy(os.path.join(new_images_dir, name), image_path)
+            label_name = os.path.splitext(name)[0] + ".txt"
+            label_path = os.path.join(new_annotations_dir, label_name)
+            if os.path.exists(label_path):
+                shutil.copy(label_path, os.path.join(dataset_dir, "labels", split, label_name))
+            added[split].append(image_path)
+        print(f"Added {len(added['train'])} training and {len(added['val'])} validation images to {dataset_dir}")
+        return added
+
+    def validation_dir(self, dataset_config_path):
+        """Images of the validation split; the held-out set models are evaluated on before deployment."""
+        import yaml
+        with open(dataset_config_path) as f:
+            dataset_config = yaml.safe_load(f)
+        return os.path.join(dataset_config["path"], dataset_config["val"])
+
+    def build_incremental_dataset(self, dataset_config_path, new_images, replay_ratio=1.0, seed=0):
+        """
+        Writes a dataset configuration that trains on the new images plus a replay buffer,
+        a random sample of the previous training images, so the model does not forget old defects.
+        Args:
+            dataset_config_path (str): Full dataset configuration.
+            new_images (list): Paths of the newly added training images.
+            replay_ratio (float): Replayed old images per new image.
+        Returns:
+            tuple: (path of the incremental dataset configuration, number of replayed images).
+        """
+        import yaml
+        with open(dataset_config_path) as f:
+            dataset_config = yaml.safe_load(f)
+        train_dir = os.path.join(dataset_config["path"], dataset_config["train"])
+        new_set = {os.path.abspath(path) for path in new_images}
+        old_images = sorted(
+            path for path in (os.path.abspath(os.path.join(train_dir, name)) for name in os.listdir(train_dir))
+            if path.lower().endswith(IMAGE_EXTENSIONS) and path not in new_set
+        )
+        replay = random.Random(seed).sample(old_images, min(len(old_images), int(len(new_set) * replay_ratio)))
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        list_path = os.path.join(dataset_config["path"], f"train_incremental_{timestamp}.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(sorted(new_set) + replay) + "\n")
+        incremental_config = dict(dataset_config, path=os.path.abspath(dataset_config["path"]),
+                                  train=os.path.basename(list_path))
+        config_path = os.path.join(dataset_config["path"], f"dataset_incremental_{timestamp}.yaml")
+        with open(config_path, "w") as f:
+            yaml.dump(incremental_config, f)
+        print(f"Incremental dataset: {len(new_set)} new and {len(replay)} replayed images ({config_path})")
+        return config_path, len(replay)
+
+    def train_model(self, dataset_config_path, epochs=100, batch_size=16, img_size=640, incremental=False,
+                    new_images=None, replay_ratio=1.0, freeze_layers=None, patience=10, lr0=None,
+                    deployment_dir="deployed_models"):
+        """
+        Trains a model and saves it with versioning.
+        A full training starts from the base model on the whole dataset. An incremental training
+        resumes from the deployed checkpoint and only trains on the new images mixed with a
+        replay buffer of old ones, by default with the backbone frozen and a lower learning rate.
+        Training stops once the validation fitness has not improved for `patience` epochs.
+        Wall-clock time and throughput of every epoch are recorded in the training log.
+        Args:
+            dataset_config_path (str): Dataset configuration (see prepare_training_data).
+            incremental (bool): Fine-tune the deployed model instead of training from the base model.
+            new_images (list, optional): Newly added training images (see add_training_data); required
+                                         for incremental training.
+            replay_ratio (float): Old images replayed per new image in incremental training.
+            freeze_layers (int, optional): Number of leading layers to freeze; defaults to the
+                                           backbone in incremental training and none otherwise.
+            patience (int): Epochs without validation improvement before training stops.
+            lr0 (float, optional): Initial learning rate; defaults to 0.001 in incremental training.
+            deployment_dir (str): Where the deployed checkpoint is looked up for incremental training.
         """
-        print(f"Starting model training with {epochs} epochs")
-        
-        # Load base model
-        model = YOLO(self.base_model_path)
-        
-        # Generate model version
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         model_name = f"defect_detection_v{timestamp}"
         model_path = os.path.join(self.models_dir, f"{model_name}.pt")
-        
-        # Training configuration (placeholder)
+
+        replayed = 0
+        if incremental:
+            if not new_images:
+                raise ValueError("Incremental training needs the newly added training images")
+            start_model = self.current_deployed_model(deployment_dir)
+            data, replayed = self.build_incremental_dataset(dataset_config_path, new_images, replay_ratio)
+            freeze_layers = YOLOV8_BACKBONE_LAYERS if freeze_layers is None else freeze_layers
+            lr0 = 0.001 if lr0 is None else lr0
+        else:
+            start_model, data = self.base_model_path, dataset_config_path
+        print(f"Starting {'incremental' if incremental else 'full'} model training from {start_model} "
+              f"with up to {epochs} epochs")
+
+        model = YOLO(start_model)
+        epoch_log = []
+        epoch_start = {}
+
+        def on_train_epoch_start(trainer):
+            epoch_start["time"] = time.perf_counter()
+
+        def on_fit_epoch_end(trainer):
+            # Called after training and validation of an epoch
+            duration = time.perf_counter() - epoch_start["time"]
+            num_images = len(trainer.train_loader.dataset)
+            entry = {
+                "epoch": trainer.epoch + 1,
+                "time_s": round(duration, 2),
+                "images_per_s": round(num_images / duration, 2) if duration > 0 else None,
+                "fitness": float(trainer.fitness) if trainer.fitness is not None else None,
+                "mAP_0.5": float(trainer.metrics.get("metrics/mAP50(B)", 0.0)),
+            }
+            epoch_log.append(entry)
+            print(f"Epoch {entry['epoch']}: {entry['time_s']} s, {entry['images_per_s']} images/s, "
+                  f"mAP@0.5 {entry['mAP_0.5']:.3f}")
+
+        model.add_callback("on_train_epoch_start", on_train_epoch_start)
+        model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+
+        train_args = {
+            "data": data,
+            "epochs": epochs,
+            "batch": batch_size,
+            "imgsz": img_size,
+            "patience": patience,
+            "project": os.path.join(self.logs_dir, "runs"),
+            "name": model_name,
+        }
+        if freeze_layers:
+            train_args["freeze"] = freeze_layers
+        if lr0 is not None:
+            train_args["lr0"] = lr0
+        training_start = time.perf_counter()
+        model.train(**train_args)
+        training_time = time.perf_counter() - training_start
+
+        # Keep the checkpoint with the best validation fitness
+        trainer = model.trainer
+        best_path = trainer.best if os.path.exists(trainer.best) else trainer.last
+        shutil.copy(best_path, model_path)
+
         training_config = {
-            "model": self.base_model_path,
-            "data": dataset_config_path,
+            "mode": "incremental" if incremental else "full",
+            "model": start_model,
+            "data": data,
             "epochs": epochs,
+            "epochs_run": len(epoch_log),
+            "stopped_early": len(epoch_log) < epochs,
             "batch": batch_size,
             "imgsz": img_size,
+            "freeze": freeze_layers,
+            "lr0": lr0,
+            "patience": patience,
+            "new_images": len(new_images) if incremental else None,
+            "replayed_images": replayed if incremental else None,
+            "training_time_s": round(training_time, 2),
+            "epoch_log": epoch_log,
             "timestamp": timestamp,
-            "status": "completed"  # In real training, this would be updated during training
+            "status": "completed"
         }
-        
+
         # Save training log
         log_path = os.path.join(self.logs_dir, f"training_log_{timestamp}.json")
         with open(log_path, 'w') as f:
             json.dump(training_config, f, indent=2)
-        
-        # Simulate training by copying the base model (placeholder)
-        shutil.copy(self.base_model_path, model_path)
-        
-        print(f"Model training completed. Model saved to: {model_path}")
+
+        print(f"Model training completed after {len(epoch_log)} epochs in {training_time:.0f} s. "
+              f"Model saved to: {model_path}")
         print(f"Training log saved to: {log_path}")
-        
+
         return {
             "model_path": model_path,
             "log_path": log_path,
@@ -108,37 +275,35 @@ class TrainingPipeline:
             "training_config": training_config
         }
 
-    def evaluate_model(self, model_path, test_data_dir):
+    def evaluate_model(self, model_path, test_data_dir, batch_size=32, img_size=640,
+                       conf_threshold=0.25, sweep_thresholds=None):
         """
-        Placeholder for model evaluation.
-        In a real scenario, this would:
-        1. Load the trained model
-        2. Run inference on test dataset
-        3. Calculate metrics (mAP, precision, recall, etc.)
-        4. Generate evaluation report
+        Evaluates a model on a labeled test set.
+        Runs batched inference (cached per model and test set), computes per-class AP,
+        PR curves and a confusion matrix, and measures latency and throughput.
+        Args:
+            model_path (str): Path to the model to evaluate.
+            test_data_dir (str): Directory with test images and YOLO-format labels.
+            batch_size (int): Inference batch size.
+            img_size (int): Inference input size.
+            conf_threshold (float): Operating confidence threshold for precision/recall.
+            sweep_thresholds (list, optional): Extra confidence thresholds to report.
+        Returns:
+            dict: Evaluation report (also saved to the logs directory).
         """
         print(f"Evaluating model: {model_path}")
-        
-        # Placeholder evaluation metrics
-        evaluation_results = {
-            "model_path": model_path,
-            "test_data_dir": test_data_dir,
-            "metrics": {
-                "mAP_0.5": 0.85,
-                "mAP_0.5:0.95": 0.72,
-                "precision": 0.88,
-                "recall": 0.82,
-                "f1_score": 0.85
-            },
-            "class_metrics": {
-                "scratch": {"precision": 0.90, "recall": 0.85, "f1": 0.87},
-                "crack": {"precision": 0.88, "recall": 0.80, "f1": 0.84},
-                "dent": {"precision": 0.85, "recall": 0.78, "f1": 0.81},
-                "corrosion": {"precision": 0.89, "recall": 0.86, "f1": 0.87}
-            },
-            "evaluation_date": datetime.now().isoformat()
-        }
-        
+
+        evaluator = ModelEvaluator(
+            model_path,
+            batch_size=batch_size,
+            img_size=img_size,
+            cache_dir=os.path.join(self.logs_dir, "prediction_cache"),
+        )
+        evaluation_results = evaluator.evaluate(
+            test_data_dir, conf_threshold=conf_threshold, sweep_thresholds=sweep_thresholds
+        )
+        evaluation_results["evaluation_date"] = datetime.now().isoformat()
+
         # Save evaluation report
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         eval_report_path = os.path.join(self.logs_dir, f"evaluation_report_{timestamp}.json")
@@ -148,7 +313,42 @@ class TrainingPipeline:
         print(f"Model evaluation completed. Report saved to: {eval_report_path}")
         return evaluation_results
 
-    def deploy_model(self, model_path, deployment_dir="deployed_models"):
+    def meets_deployment_criteria(self, evaluation_results, min_map50=0.8, max_latency_ms=None):
+        """
+        Decides whether an evaluated model may be deployed.
+        The model must reach the accuracy threshold and, if a latency budget is given,
+        its single-image latency must fit into it.
+        """
+        if evaluation_results["metrics"]["mAP_0.5"] <= min_map50:
+            return False
+        latency = evaluation_results.get("speed", {}).get("latency_ms_per_image")
+        if max_latency_ms is not None and (latency is None or latency > max_latency_ms):
+            return False
+        return True
+
+    def compress_model(self, model_path, dataset_config_path, test_data_dir, variants=("distilled", "pruned", "int8"),
+                       **options):
+        """
+        Builds cheaper serving variants of a trained model (see ModelCompressor) and
+        returns their side-by-side report of mAP, CPU latency and size, fastest first.
+        """
+        compressor = ModelCompressor(output_dir=os.path.join(self.models_dir, "compressed"), logs_dir=self.logs_dir)
+        return compressor.compress(model_path, dataset_config_path, test_data_dir, variants, **options)
+
+    def select_variant(self, compression_report, min_map50=0.8, max_latency_ms=None):
+        """
+        Picks the fastest variant of a compression report that meets the deployment criteria.
+        Returns:
+            dict: The report entry, or None if no variant qualifies.
+        """
+        for entry in compression_report["variants"]:
+            if self.meets_deployment_criteria(entry["evaluation"], min_map50, max_latency_ms):
+                print(f"Selected variant '{entry['name']}': mAP@0.5 {entry['mAP_0.5']:.3f}, "
+                      f"{entry['cpu_latency_ms']:.1f} ms on CPU")
+                return entry
+        return None
+
+    def deploy_model(self, model_path, deployment_dir="deployed_models", source_checkpoint=None):
         """
         Placeholder for model deployment.
         In a real scenario, this would:
@@ -156,20 +356,28 @@ class TrainingPipeline:
         2. Copy to deployment directory
         3. Update model registry
         4. Notify services of new model availability
+        Args:
+            source_checkpoint (str, optional): Trainable checkpoint the deployed model was derived from,
+                                               e.g. the trained model behind a compressed variant; later
+                                               incremental updates resume from it. Defaults to model_path.
         """
         print(f"Deploying model: {model_path}")
         
         os.makedirs(deployment_dir, exist_ok=True)
         
-        # Copy model to deployment directory
-        model_filename = os.path.basename(model_path)
+        # Copy model to deployment directory (exported models such as int8 OpenVINO ones are directories)
+        model_filename = os.path.basename(os.path.normpath(model_path))
         deployed_model_path = os.path.join(deployment_dir, model_filename)
-        shutil.copy(model_path, deployed_model_path)
+        if os.path.isdir(model_path):
+            shutil.copytree(model_path, deployed_model_path, dirs_exist_ok=True)
+        else:
+            shutil.copy(model_path, deployed_model_path)
         
         # Create deployment metadata
         deployment_info = {
             "original_path": model_path,
             "deployed_path": deployed_model_path,
+            "source_checkpoint": source_checkpoint or model_path,
             "deployment_date": datetime.now().isoformat(),
             "status": "active"
         }
@@ -182,23 +390,57 @@ class TrainingPipeline:
         print(f"Model deployed successfully to: {deployed_model_path}")
         return deployment_info
 
-    def update_model_pipeline(self, new_data_dir, annotations_dir):
+    def update_model_pipeline(self, new_data_dir, annotations_dir, min_map50=0.8, max_latency_ms=None,
+                              incremental=False, compress=False):
         """
         Complete pipeline for updating the model with new data.
+        Args:
+            min_map50 (float): Minimum mAP@0.5 required for deployment.
+            max_latency_ms (float, optional): Maximum single-image latency allowed for deployment.
+            incremental (bool): Fine-tune the deployed model on the new data and a replay buffer
+                                instead of retraining from the base model, e.g. for nightly updates.
+            compress (bool): Build distilled, pruned and int8 variants of the trained model and
+                             deploy the fastest one that meets the deployment criteria.
         """
         print("Starting complete model update pipeline...")
         
         # Step 1: Prepare training data
         dataset_config = self.prepare_training_data(new_data_dir, annotations_dir)
         
-        # Step 2: Train model
-        training_results = self.train_model(dataset_config)
+        # Step 2: Add the new images to the dataset and train model
+        added = self.add_training_data(dataset_config, new_data_dir, annotations_dir)
+        if incremental:
+            training_results = self.train_model(dataset_config, incremental=True, new_images=added["train"])
+        else:
+            training_results = self.train_model(dataset_config)
+        
+        # Step 3: Evaluate model on the validation split, which it was not trained on
+        val_dir = self.validation_dir(dataset_config)
+        evaluation_results = self.evaluate_model(training_results["model_path"], val_dir)
         
-        # Step 3: Evaluate model
-        evaluation_results = self.evaluate_model(training_results["model_path"], new_data_dir)
+        # Step 3b: Compress model; every variant (including the original) is evaluated on CPU
+        if compress:
+            compression_report = self.compress_model(training_results["model_path"], dataset_config, val_dir)
+            variant = self.select_variant(compression_report, min_map50, max_latency_ms)
+            result = {
+                "training": training_results,
+                "evaluation": evaluation_results,
+                "compression": compression_report,
+                "deployment": None,
+                "status": "performance_below_threshold"
+            }
+            if variant is not None:
+                result["deployment"] = self.deploy_model(
+                    variant["path"], source_checkpoint=training_results["model_path"]
+                )
+                result["status"] = "success"
+                print("Model update pipeline completed successfully!")
+            else:
+                print("No model variant meets the deployment criteria. Deployment skipped.")
+            return result
         
         # Step 4: Deploy model (if evaluation is satisfactory)
-        if evaluation_results["metrics"]["mAP_0.5"] > 0.8:  # Threshold for deployment
+        if self.meets_deployment_criteria(evaluation_results, min_map50, max_latency_ms):
             deployment_info = self.deploy_model(training_results["model_path"])
             print("Model update pipeline completed successfully!")
             return {
@@ -208,7 +450,7 @@ class TrainingPipeline:
                 "status": "success"
             }
         else:
-            print("Model performance below threshold. Deployment skipped.")
+            print("Model accuracy or latency outside deployment criteria. Deployment skipped.")
             return {
                 "training": training_results,
                 "evaluation": evaluation_results,
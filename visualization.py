@@ -0,0 +1,95 @@
+import cv2
+import threading
+import logging
+from collections import OrderedDict
+from .metrics import time_stage, record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+DEFECT_COLOR = (0, 0, 255)  # Red for defects
+MEASUREMENT_COLOR = (0, 255, 0)  # Green for measurements
+
+
+def draw_inspection_overlay(img, defects, measurements=None, scale=1.0):
+    """
+    Draws defect bounding boxes and measurement results onto an image in place.
+    Args:
+        img (np.ndarray): BGR image to draw on.
+        defects (list): Defects as returned by DefectDetector.detect_defects.
+        measurements (dict, optional): Measurement results.
+        scale (float): Factor between the image and the coordinates of the defect boxes.
+    Returns:
+        np.ndarray: The annotated image.
+    """
+    thickness = 2 if scale >= 0.5 else 1
+    for defect in defects:
+        x1, y1, x2, y2 = (int(round(v * scale)) for v in defect["box"])
+        cv2.rectangle(img, (x1, y1), (x2, y2), DEFECT_COLOR, thickness)
+        label = f'{defect["class"]}: {defect["confidence"]:.2f}'
+        cv2.putText(img, label, (x1, max(y1 - 10, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, DEFECT_COLOR, thickness)
+
+    # Draw measurement results (simplified for now)
+    if measurements and "measured_length" in measurements:
+        text = f'Measured Length: {measurements["measured_length"]:.2f}'
+        cv2.putText(img, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, MEASUREMENT_COLOR, 2)
+    return img
+
+
+class OverlayRenderer:
+    def __init__(self, max_size=960, jpeg_quality=80, cache_size=32):
+        """
+        Renders annotated inspection previews on demand.
+        Previews are kept at a reduced resolution and encoded JPEGs are cached,
+        so repeated requests for the same overlay do not re-encode.
+        Args:
+            max_size (int): Maximum side length of preview images in pixels.
+            jpeg_quality (int): JPEG quality of encoded overlays.
+            cache_size (int): Number of encoded overlays kept in memory.
+        """
+        self.max_size = max_size
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_preview(self, img):
+        """
+        Downscales an image to the preview resolution.
+        Returns:
+            tuple: (preview image, scale factor from original to preview coordinates).
+        """
+        height, width = img.shape[:2]
+        scale = min(1.0, self.max_size / float(max(height, width)))
+        if scale == 1.0:
+            return img.copy(), 1.0
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        return cv2.resize(img, size, interpolation=cv2.INTER_LINEAR), scale
+
+    def encode(self, img):
+        ok, buffer = cv2.imencode(".jpg", img, self.encode_params)
+        if not ok:
+            raise ValueError("JPEG encoding of overlay failed")
+        return buffer.tobytes()
+
+    def render(self, key, preview, scale, defects, measurements=None):
+        """
+        Returns the JPEG-encoded overlay for a stored preview, rendering it on first use.
+        """
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        record_cache_lookup("overlay", cached is not None)
+        if cached is not None:
+            return cached
+
+        with time_stage("visualization"):
+            annotated = draw_inspection_overlay(preview.copy(), defects, measurements, scale)
+            encoded = self.encode(annotated)
+
+        with self._lock:
+            self._cache[key] = encoded
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        logger.debug("Rendered overlay %s (%d bytes)", key, len(encoded))
+        return encoded
@@ -0,0 +1,468 @@
+import os
+import time
+import base64
+import binascii
+import uuid
+import socket
+import threading
+import logging
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+from multiprocessing.managers import BaseManager
+from .metrics import REGISTRY, QUEUE_DEPTH
+from .inference_executor import ExecutorOverloaded
+from .inference_scheduler import REALTIME, BULK, LANES
+from .image_io import decode_image, decode_raw_pixels
+
+logger = logging.getLogger(__name__)
+
+JOBS_REDELIVERED = REGISTRY.counter(
+    "inspection_jobs_redelivered_total", "Jobs put back on the queue because their worker stopped sending heartbeats"
+)
+JOBS_FAILED = REGISTRY.counter(
+    "inspection_jobs_failed_total", "Jobs that failed, by reason", ("reason",)
+)
+WORKER_BATCH_SIZE = REGISTRY.histogram(
+    "inspection_worker_batch_size", "Jobs leased per worker batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+
+class InProcessWorkQueue:
+    def __init__(self, max_pending=256, heartbeat_timeout_s=10.0, max_attempts=3, result_ttl_s=120.0):
+        """
+        Work queue between request handlers and inference workers.
+        Jobs wait in the lane named by the 'priority' of their payload; realtime jobs are
+        leased before bulk jobs. Workers lease jobs in batches and must send heartbeats; jobs
+        leased by a worker whose heartbeat is older than heartbeat_timeout_s are redelivered to
+        other workers, up to max_attempts deliveries. Results are kept until they are collected or result_ttl_s expires.
+        The same object is served to other nodes by serve_broker().
+        Args:
+            max_pending (int): Jobs that may wait for a worker; put() raises ExecutorOverloaded beyond that.
+            heartbeat_timeout_s (float): Silence after which a worker is considered lost.
+            max_attempts (int): Deliveries of a job before it fails.
+            result_ttl_s (float): How long uncollected results are kept.
+        """
+        self.max_pending = max_pending
+        self.heartbeat_timeout_s = heartbeat_timeout_s
+        self.max_attempts = max_attempts
+        self.result_ttl_s = result_ttl_s
+
+        self._pending = {lane: deque() for lane in LANES}
+        self._leases = {}  # worker id -> {job id: job}
+        self._heartbeats = {}  # worker id -> monotonic time of the last heartbeat
+        self._results = OrderedDict()  # job id -> (finished time, outcome)
+        self._condition = threading.Condition()
+
+    def put(self, job):
+        """
+        Queues a job (a dict with a 'payload' and optionally a 'request_id').
+        Returns:
+            str: The job id.
+        """
+        lane = job["payload"].get("priority") or REALTIME
+        if lane not in LANES:
+            raise ValueError(f"Unknown priority '{lane}'")
+        job = dict(job, job_id=uuid.uuid4().hex, attempts=0, lane=lane)
+        with self._condition:
+            if self._pending_count() >= self.max_pending:
+                raise ExecutorOverloaded(f"Work queue is full ({self.max_pending} jobs)")
+            self._pending[lane].append(job)
+            QUEUE_DEPTH.set(self._pending_count(), queue="work_queue")
+            self._condition.notify_all()
+        return job["job_id"]
+
+    def _pending_count(self):
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def _take(self, max_items):
+        # Realtime jobs first; bulk jobs only fill what is left of the batch
+        jobs = []
+        for lane in (REALTIME, BULK):
+            pending = self._pending[lane]
+            while pending and len(jobs) < max_items:
+                jobs.append(pending.popleft())
+        return jobs
+
+    def lease(self, worker_id, max_items=8, timeout=1.0, linger_s=0.005):
+        """
+        Hands up to max_items jobs to a worker. Waits up to timeout for the first job and
+        then up to linger_s for the batch to fill. Leasing counts as a heartbeat.
+        Returns:
+            list: The leased jobs, possibly empty.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._heartbeats[worker_id] = time.monotonic()
+            self._reap()
+            while not self._pending_count():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(remaining)
+                self._reap()
+            if self._pending_count() < max_items and linger_s > 0:
+                self._condition.wait(linger_s)
+            jobs = self._take(max_items)
+            leases = self._leases.setdefault(worker_id, {})
+            for job in jobs:
+                job["attempts"] += 1
+                leases[job["job_id"]] = job
+            QUEUE_DEPTH.set(self._pending_count(), queue="work_queue")
+        WORKER_BATCH_SIZE.observe(len(jobs))
+        return jobs
+
+    def heartbeat(self, worker_id):
+        with self._condition:
+            self._heartbeats[worker_id] = time.monotonic()
+            self._reap()
+
+    def complete(self, worker_id, job_id, result=None, error=None):
+        """Stores the outcome of a leased job. Late outcomes of redelivered jobs are ignored."""
+        with self._condition:
+            self._leases.get(worker_id, {}).pop(job_id, None)
+            if job_id in self._results:
+                return
+            self._results[job_id] = (time.monotonic(), {"result": result, "error": error})
+            if error is not None:
+                JOBS_FAILED.inc(reason="error")
+            self._condition.notify_all()
+
+    def wait_results(self, job_ids, timeout=1.0):
+        """
+        Waits until at least one of the given jobs finished, or timeout.
+        Returns:
+            dict: job id -> {'result': ..., 'error': ...} for every finished job; these are removed.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._reap()
+                finished = {job_id: self._results.pop(job_id)[1] for job_id in job_ids if job_id in self._results}
+                remaining = deadline - time.monotonic()
+                if finished or remaining <= 0:
+                    self._expire_results()
+                    return finished
+                self._condition.wait(remaining)
+
+    def stats(self):
+        with self._condition:
+            now = time.monotonic()
+            return {
+                "pending": {lane: len(jobs) for lane, jobs in self._pending.items()},
+                "leased": sum(len(leases) for leases in self._leases.values()),
+                "workers": {worker_id: {"leased": len(self._leases.get(worker_id, {})),
+                                        "last_heartbeat_s": round(now - seen, 3)}
+                            for worker_id, seen in self._heartbeats.items()},
+            }
+
+    def _reap(self):
+        # Called with the condition held
+        now = time.monotonic()
+        for worker_id, seen in list(self._heartbeats.items()):
+            if now - seen < self.heartbeat_timeout_s:
+                continue
+            del self._heartbeats[worker_id]
+            lost = self._leases.pop(worker_id, {})
+            if lost:
+                logger.warning("Worker %s lost, redelivering %d job(s).", worker_id, len(lost))
+            for job in lost.values():
+                if job["attempts"] >= self.max_attempts:
+                    self._results[job["job_id"]] = (now, {"result": None,
+                                                          "error": f"Job failed after {job['attempts']} attempts"})
+                    JOBS_FAILED.inc(reason="attempts")
+                else:
+                    self._pending[job["lane"]].appendleft(job)
+                    JOBS_REDELIVERED.inc()
+            if lost:
+                QUEUE_DEPTH.set(self._pending_count(), queue="work_queue")
+                self._condition.notify_all()
+
+    def _expire_results(self):
+        now = time.monotonic()
+        while self._results:
+            job_id, (finished, _) = next(iter(self._results.items()))
+            if now - finished < self.result_ttl_s:
+                break
+            del self._results[job_id]
+
+
+class WorkQueueManager(BaseManager):
+    """
+    Serves a work queue to other processes and nodes over an authenticated TCP connection.
+    multiprocessing.managers exchanges pickles, and unpickling runs code chosen by the sender:
+    anyone who knows the authkey can execute code on the broker and on every node. The broker
+    must therefore only be reachable from a trusted network, with a secret, random authkey.
+    """
+
+
+def _check_authkey(authkey):
+    if not authkey:
+        raise ValueError("The work queue broker requires a non-empty authkey (INSPECTION_BROKER_AUTHKEY)")
+
+
+def serve_broker(address, authkey, **queue_options):
+    """
+    Runs a local broker that holds the queue for all nodes (blocks forever).
+    Only bind it to an interface of a trusted network (see WorkQueueManager).
+    Args:
+        address (tuple): (host, port) to listen on.
+        authkey (bytes): Shared secret of all nodes; must not be empty.
+    Raises:
+        ValueError: If authkey is empty.
+    """
+    _check_authkey(authkey)
+    work_queue = InProcessWorkQueue(**queue_options)
+    WorkQueueManager.register("work_queue", callable=lambda: work_queue)
+    manager = WorkQueueManager(address=address, authkey=authkey)
+    server = manager.get_server()
+    logger.info("Work queue broker listening on %s:%d.", *address)
+    server.serve_forever()
+
+
+def connect_work_queue(spec, authkey=b"", **queue_options):
+    """
+    Returns the work queue described by spec: 'inprocess' for a queue inside this process,
+    or 'host:port' for a proxy to a broker started with serve_broker().
+    Raises:
+        ValueError: If a broker is given without an authkey.
+    """
+    if spec == "inprocess":
+        return InProcessWorkQueue(**queue_options)
+    _check_authkey(authkey)
+    host, port = spec.rsplit(":", 1)
+    WorkQueueManager.register("work_queue")
+    manager = WorkQueueManager(address=(host, int(port)), authkey=authkey)
+    manager.connect()
+    logger.info("Connected to work queue broker at %s.", spec)
+    return manager.work_queue()
+
+
+class WorkQueueClient:
+    def __init__(self, work_queue, poll_timeout_s=0.5):
+        """
+        Submits inspection jobs and resolves their futures when the results come back.
+        One collector thread waits for all outstanding jobs, so request handlers never poll.
+        """
+        self.work_queue = work_queue
+        self.poll_timeout_s = poll_timeout_s
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._collect, name="work-queue-client", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload, request_id=None):
+        """
+        Queues a frame for inspection.
+        Args:
+            payload (dict): See InspectionWorker.process for the fields.
+            request_id (str, optional): Id of the originating request, returned with the result.
+        Returns:
+            concurrent.futures.Future: Resolves to the result dictionary; ValueError if the worker
+                                       rejected the frame, RuntimeError on other failures.
+        Raises:
+            ExecutorOverloaded: If the queue is full.
+        """
+        future = Future()
+        job_id = self.work_queue.put({"payload": payload, "request_id": request_id or uuid.uuid4().hex})
+        with self._lock:
+            self._futures[job_id] = future
+        self._wakeup.set()
+        return future
+
+    def _collect(self):
+        while True:
+            with self._lock:
+                job_ids = list(self._futures)
+            if not job_ids:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                finished = self.work_queue.wait_results(job_ids, self.poll_timeout_s)
+            except (OSError, EOFError) as e:
+                logger.error("Lost connection to the work queue: %s", e)
+                time.sleep(self.poll_timeout_s)
+                continue
+            for job_id, outcome in finished.items():
+                with self._lock:
+                    future = self._futures.pop(job_id, None)
+                if future is None or future.done():
+                    continue
+                error = outcome["error"]
+                if error is None:
+                    future.set_result(outcome["result"])
+                elif error.startswith("ValueError: "):
+                    future.set_exception(ValueError(error[len("ValueError: "):]))
+                else:
+                    future.set_exception(RuntimeError(error))
+
+    def cancel(self, future):
+        """Stops waiting for a job, e.g. after the request timed out."""
+        with self._lock:
+            for job_id, pending in list(self._futures.items()):
+                if pending is future:
+                    del self._futures[job_id]
+
+
+class InspectionWorker:
+    def __init__(self, work_queue, inspection_service, worker_id=None, batch_size=8, heartbeat_interval_s=2.0):
+        """
+        Stateless inference worker: leases jobs in batches, inspects them with its own
+        InspectionService and returns the results with the originating request id.
+        Args:
+            work_queue: InProcessWorkQueue or broker proxy.
+            inspection_service (InspectionService): Local service used for the inspections.
+            worker_id (str, optional): Defaults to host name, process id and a random suffix.
+            batch_size (int): Maximum jobs per lease; frames without measurements are detected together.
+            heartbeat_interval_s (float): Interval of heartbeats sent while a batch is being processed.
+        """
+        self.work_queue = work_queue
+        self.inspection_service = inspection_service
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.batch_size = batch_size
+        self.heartbeat_interval_s = heartbeat_interval_s
+
+    def run(self, stop_event=None):
+        """Processes jobs until stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop_event,), daemon=True)
+        heartbeat.start()
+        logger.info("InspectionWorker %s started.", self.worker_id)
+        while not stop_event.is_set():
+            try:
+                jobs = self.work_queue.lease(self.worker_id, self.batch_size, timeout=1.0)
+            except (OSError, EOFError) as e:
+                logger.error("Lost connection to the work queue: %s", e)
+                stop_event.wait(1.0)
+                continue
+            if jobs:
+                self.process(jobs)
+
+    def _heartbeat(self, stop_event):
+        while not stop_event.wait(self.heartbeat_interval_s):
+            try:
+                self.work_queue.heartbeat(self.worker_id)
+            except (OSError, EOFError):
+                pass
+
+    def _decode(self, payload, buffers):
+        if payload["kind"] == "encoded":
+            return decode_image(payload["data"], payload.get("target_size"))
+        if payload["kind"] == "base64":
+            try:
+                data = base64.b64decode(payload["data"])
+            except binascii.Error as e:
+                raise ValueError(str(e))
+            return decode_image(data, payload.get("target_size"))
+        if payload["kind"] == "raw":
+            image = decode_raw_pixels(payload["data"], payload["shape"], payload.get("dtype", "uint8"),
+                                      payload.get("channel_order", "bgr"), buffers)
+            return image, 1
+        raise ValueError(f"Unknown payload kind '{payload['kind']}'")
+
+    def process(self, jobs):
+        """
+        Inspects a batch of jobs. Payload fields: 'kind' ('encoded' or 'base64' with 'data' and an
+        optional 'target_size', or 'raw' with 'data', 'shape', 'dtype' and 'channel_order'), and optionally
+        'measurement_points', 'scale_factor', 'camera_id', 'render' and 'priority'.
+        """
+        with self.inspection_service.buffer_pool.lease() as buffers:
+            self._process(jobs, buffers)
+
+    def _process(self, jobs, buffers):
+        service = self.inspection_service
+        batches = {}  # lane -> [(job, image, decode_scale)]
+        for job in jobs:
+            payload = job["payload"]
+            try:
+                image, decode_scale = self._decode(payload, buffers)
+            except (ValueError, KeyError, TypeError) as e:
+                self.work_queue.complete(self.worker_id, job["job_id"], error=f"ValueError: {e}")
+                continue
+            if payload.get("measurement_points"):
+                self._finish(job, lambda: service.perform_inspection(
+                    image, payload["measurement_points"], payload.get("scale_factor"),
+                    decode_scale=decode_scale, lane=job.get("lane", REALTIME), camera_id=payload.get("camera_id")
+                ))
+            else:
+                batches.setdefault(job.get("lane", REALTIME), []).append((job, image, decode_scale))
+
+        for lane, batch in batches.items():
+            try:
+                results = service.inspect_batch(
+                    [image for _, image, _ in batch], [scale for _, _, scale in batch], lane=lane
+                )
+            except Exception as e:
+                logger.exception("Batch of %d jobs failed", len(batch))
+                for job, _, _ in batch:
+                    self.work_queue.complete(self.worker_id, job["job_id"], error=f"{type(e).__name__}: {e}")
+                continue
+            for (job, _, _), result in zip(batch, results):
+                self._finish(job, lambda: result)
+
+    def _finish(self, job, inspect):
+        try:
+            result = inspect()
+            result["request_id"] = job["request_id"]
+            result["worker_id"] = self.worker_id
+            if job["payload"].get("render"):
+                result["overlay"] = self.inspection_service.render_overlay(result["result_id"])
+        except Exception as e:
+            logger.exception("Job %s failed", job["job_id"])
+            self.work_queue.complete(self.worker_id, job["job_id"], error=f"{type(e).__name__}: {e}")
+            return
+        self.work_queue.complete(self.worker_id, job["job_id"], result=result)
+
+
+def start_work_queue_client(spec, inspection_service, authkey=b"", local_workers=0, batch_size=8):
+    """
+    Sets up the distributed mode of an API process.
+    Args:
+        spec (str): 'inprocess' or the 'host:port' of a broker.
+        authkey (bytes): Shared secret of the broker; required unless spec is 'inprocess'.
+        inspection_service (InspectionService): Service used by local workers.
+        local_workers (int): Worker threads started in this process; an in-process queue needs at least one.
+    Returns:
+        WorkQueueClient: Client the request handlers submit frames to.
+    """
+    work_queue = connect_work_queue(spec, authkey)
+    if spec == "inprocess":
+        local_workers = max(local_workers, 1)
+    for index in range(local_workers):
+        worker = InspectionWorker(work_queue, inspection_service, batch_size=batch_size)
+        threading.Thread(target=worker.run, name=f"inspection-worker-{index}", daemon=True).start()
+    return WorkQueueClient(work_queue)
+
+
+if __name__ == "__main__":
+    # Run as a module of the services package, with the same INSPECTION_BROKER_AUTHKEY on all nodes:
+    # Broker:  python -m services.work_queue broker --bind 10.0.0.5:5600
+    # Worker:  python -m services.work_queue worker --broker 10.0.0.5:5600 --model yolov8n.pt
+    # The broker exchanges pickles; bind it to a trusted network only (see WorkQueueManager).
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distributed inspection work queue")
+    parser.add_argument("role", choices=["broker", "worker"])
+    parser.add_argument("--bind", default="127.0.0.1:5600",
+                        help="Broker listen address; only expose it on a trusted network")
+    parser.add_argument("--broker", default="localhost:5600", help="Broker address for workers")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=256)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    key = os.environ.get("INSPECTION_BROKER_AUTHKEY", "").encode()
+    if args.role == "broker":
+        host, port = args.bind.rsplit(":", 1)
+        serve_broker((host, int(port)), key, max_pending=args.max_pending)
+    else:
+        from .inspection_service import InspectionService
+        worker = InspectionWorker(
+            connect_work_queue(args.broker, key),
+            InspectionService(model_path=args.model, result_history=args.batch_size * 2),
+            batch_size=args.batch_size,
+        )
+        worker.run()